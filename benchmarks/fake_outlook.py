@@ -0,0 +1,1016 @@
+"""纯Python实现的Outlook对象模型模拟（Application/Namespace/Folder/Items/MailItem）
+
+用于在Linux上运行基准测试：每次属性读写与方法调用都会被计数，并可注入可配置的延迟，
+以模拟跨进程COM调用的开销。通过 install() 将其注册为 win32com.client 模块。
+"""
+import datetime
+import random
+import re
+import sys
+import time
+import types
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+
+class ComStats:
+    """COM调用统计与延迟配置"""
+
+    def __init__(self):
+        self.property_latency = 0.0
+        self.call_latency = 0.0
+        # 属性读取被Outlook拒绝（RPC_E_CALL_REJECTED）的概率，以及Outlook无响应（Dispatch失败）
+        self.reject_rate = 0.0
+        self.hung = False
+        self.rng = random.Random(0)
+        self.reset()
+
+    def reset(self):
+        self.property_gets = 0
+        self.property_sets = 0
+        self.method_calls = 0
+        self.by_name = Counter()
+
+    @property
+    def total(self) -> int:
+        return self.property_gets + self.property_sets + self.method_calls
+
+    @property
+    def simulated_latency(self) -> float:
+        """按计数推算的COM延迟总和（秒）"""
+        return ((self.property_gets + self.property_sets) * self.property_latency +
+                self.method_calls * self.call_latency)
+
+
+STATS = ComStats()
+RPC_E_CALL_REJECTED = -2147418111
+RPC_E_SERVERCALL_RETRYLATER = -2147417846
+
+
+class com_error(Exception):
+    """仿 pywintypes.com_error：args 为 (hresult, 描述, 异常信息, 参数序号)"""
+
+    @property
+    def hresult(self):
+        return self.args[0]
+
+
+def _delay(seconds: float):
+    if seconds <= 0:
+        return
+    if seconds >= 0.001:
+        time.sleep(seconds)
+        return
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def com_method(fn):
+    """将方法标记为COM方法调用：计数并注入调用延迟"""
+    name = fn.__name__
+
+    def wrapper(self, *args, **kwargs):
+        STATS.method_calls += 1
+        STATS.by_name[f"{type(self).__name__}.{name}()"] += 1
+        _delay(STATS.call_latency)
+        return fn(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+
+class ComObject:
+    """所有模拟COM对象的基类，属性保存在 _props 中"""
+
+    def __init__(self, **props):
+        object.__setattr__(self, "_props", dict(props))
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        props = object.__getattribute__(self, "_props")
+        STATS.property_gets += 1
+        STATS.by_name[f"{type(self).__name__}.{name}"] += 1
+        _delay(STATS.property_latency)
+        if STATS.reject_rate and STATS.rng.random() < STATS.reject_rate:
+            raise com_error(RPC_E_CALL_REJECTED, "Call was rejected by callee.", None, None)
+        if name in props:
+            return props[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+            return
+        STATS.property_sets += 1
+        STATS.by_name[f"{type(self).__name__}.{name}="] += 1
+        _delay(STATS.property_latency)
+        self._props[name] = value
+        self._on_change()
+
+    def _on_change(self):
+        pass
+
+
+class Collection(ComObject):
+    """带 Count、Item(i)、迭代与调用语法的COM集合"""
+
+    def __init__(self, items=None, **props):
+        super().__init__(**props)
+        object.__setattr__(self, "_items", list(items or []))
+
+    def __getattr__(self, name):
+        if name == "Count":
+            STATS.property_gets += 1
+            STATS.by_name[f"{type(self).__name__}.Count"] += 1
+            _delay(STATS.property_latency)
+            return len(self._items)
+        return super().__getattr__(name)
+
+    def __iter__(self):
+        for item in list(self._items):
+            STATS.method_calls += 1
+            STATS.by_name[f"{type(self).__name__}.Next()"] += 1
+            _delay(STATS.call_latency)
+            yield item
+
+    @com_method
+    def Item(self, index):
+        if isinstance(index, int):
+            return self._items[index - 1]
+        for item in self._items:
+            if item._props.get("Name") == index:
+                return item
+        raise IndexError(index)
+
+    def __call__(self, index):
+        return self.Item(index)
+
+
+class Recipient(ComObject):
+    pass
+
+
+class Attachment(ComObject):
+    @com_method
+    def SaveAsFile(self, path):
+        with open(path, "wb") as f:
+            f.write(b"\0" * min(self._props.get("Size", 0), 1024))
+
+
+class Recipients(Collection):
+    @com_method
+    def Add(self, address):
+        recipient = Recipient(Name=address, Address=address)
+        self._items.append(recipient)
+        return recipient
+
+
+class Attachments(Collection):
+    pass
+
+
+class OutlookItem(ComObject):
+    """邮件、任务、联系人等条目的公共实现"""
+
+    def __init__(self, session, **props):
+        props.setdefault("LastModificationTime", props.get("ReceivedTime") or datetime.datetime.now())
+        super().__init__(**props)
+        object.__setattr__(self, "_session", session)
+        object.__setattr__(self, "_folder", None)
+
+    def __getattr__(self, name):
+        if name == "Parent":
+            STATS.property_gets += 1
+            STATS.by_name["Item.Parent"] += 1
+            _delay(STATS.property_latency)
+            return self._folder
+        return super().__getattr__(name)
+
+    def _on_change(self):
+        self._props["LastModificationTime"] = datetime.datetime.now()
+
+    @com_method
+    def Save(self):
+        if self._folder is None:
+            folder = self._session._default_folder_for(self)
+            if folder is not None:
+                folder._add(self)
+        else:
+            self._folder._fire("OnItemChange", self)
+
+    @com_method
+    def Delete(self):
+        if self._folder is not None:
+            deleted = self._session._folders_by_type.get(3)
+            folder = self._folder
+            folder._remove(self)
+            if deleted is not None and folder is not deleted:
+                deleted._add(self)
+
+    @com_method
+    def Move(self, folder):
+        if self._folder is not None:
+            self._folder._remove(self)
+        folder._add(self)
+        return self
+
+
+class MailItem(OutlookItem):
+    @com_method
+    def Send(self):
+        self._props["Sent"] = True
+        sent = self._session._folders_by_type.get(5)
+        if sent is not None:
+            self._props.setdefault("SentOn", datetime.datetime.now())
+            sent._add(self)
+
+    def _reply(self, reply_all):
+        reply = MailItem(
+            self._session,
+            Subject="RE: " + self._props.get("Subject", ""),
+            Body="\n-----原始邮件-----\n" + self._props.get("Body", ""),
+            To=self._props.get("SenderEmailAddress", ""),
+            Recipients=Recipients(),
+            Attachments=Attachments(),
+            ConversationID=self._props.get("ConversationID"),
+        )
+        return reply
+
+    @com_method
+    def Reply(self):
+        return self._reply(False)
+
+    @com_method
+    def ReplyAll(self):
+        return self._reply(True)
+
+    @com_method
+    def Forward(self):
+        return self._reply(False)
+
+
+class TaskItem(OutlookItem):
+    pass
+
+
+class ContactItem(OutlookItem):
+    pass
+
+
+class AppointmentItem(OutlookItem):
+    @com_method
+    def Respond(self, response, no_ui=True):
+        self._props["ResponseStatus"] = response
+        return self
+
+
+class MeetingItem(MailItem):
+    @com_method
+    def GetAssociatedAppointment(self, add_to_calendar):
+        return self._props["_appointment"]
+
+
+# ===== Restrict / GetTable 过滤表达式（Jet 与 DASL 的常用子集） =====
+SCHEMA_PROPERTIES = {
+    "urn:schemas:httpmail:datereceived": "ReceivedTime",
+    "urn:schemas:httpmail:subject": "Subject",
+    "urn:schemas:httpmail:fromname": "SenderName",
+    "urn:schemas:httpmail:fromemail": "SenderEmailAddress",
+    "urn:schemas:httpmail:read": "_Read",
+    "urn:schemas:httpmail:importance": "Importance",
+    "urn:schemas:httpmail:hasattachment": "_HasAttachment",
+    "urn:schemas:httpmail:textdescription": "Body",
+    "urn:schemas-microsoft-com:office:office#Keywords": "Categories",
+    "http://schemas.microsoft.com/mapi/proptag/0x001A001F": "MessageClass",
+    "http://schemas.microsoft.com/mapi/proptag/0x0E080003": "Size",
+    "http://schemas.microsoft.com/mapi/proptag/0x0E1B000B": "_HasAttachment",
+    "http://schemas.microsoft.com/mapi/proptag/0x1000001F": "_BodyPreview",
+    "http://schemas.microsoft.com/mapi/proptag/0x0E070003": "_MessageFlags",
+    "urn:schemas:calendar:dtstart": "Start",
+    "http://schemas.microsoft.com/mapi/id/{6ED8DA90-450B-101B-98DA-00AA003F1305}/00030102": "_GlobalObjectId",
+}
+DATE_FORMATS = ("%m/%d/%Y %I:%M %p", "%m/%d/%Y %H:%M", "%m/%d/%Y", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+_TOKEN = re.compile(r"""\s*(?:(\()|(\))|(\[[^\]]+\])|("[^"]+")|('(?:[^']|'')*')|(<=|>=|<>|=|<|>)|([A-Za-z_][\w.]*)|(-?\d+(?:\.\d+)?))""")
+
+
+def item_value(item, name):
+    """按属性名或DASL架构名取条目的值（不计入COM调用统计）"""
+    name = SCHEMA_PROPERTIES.get(name, name)
+    props = item._props
+    if name == "_Read":
+        return not props.get("UnRead", False)
+    if name == "_HasAttachment":
+        attachments = props.get("Attachments")
+        return bool(attachments is not None and attachments._items)
+    if name == "_BodyPreview":
+        return (props.get("Body") or "")[:255]
+    if name == "_MessageFlags":
+        return 0 if props.get("UnRead") else 1
+    if name == "_GlobalObjectId":
+        appointment = props.get("_appointment")
+        return bytes.fromhex(appointment._props["GlobalAppointmentID"].encode().hex()) if appointment else None
+    if name == "StoreID":
+        folder = getattr(item, "_folder", None)
+        return folder._props["StoreID"] if folder is not None else item._session.store_id
+    return props.get(name)
+
+
+def _parse_literal(token):
+    if token.startswith("'"):
+        return token[1:-1].replace("''", "'")
+    if token.lower() in ("true", "false"):
+        return token.lower() == "true"
+    return float(token) if "." in token else int(token)
+
+
+def _coerce(value, literal):
+    if isinstance(value, datetime.datetime) and isinstance(literal, str):
+        for fmt in DATE_FORMATS:
+            try:
+                return value.replace(tzinfo=None, second=0, microsecond=0), datetime.datetime.strptime(literal, fmt)
+            except ValueError:
+                continue
+    if isinstance(value, bool) or isinstance(literal, bool):
+        if isinstance(literal, str):
+            literal = literal.lower() in ("true", "1", "yes")
+        return bool(value), bool(literal)
+    if isinstance(value, (int, float)) and isinstance(literal, str):
+        try:
+            return value, float(literal)
+        except ValueError:
+            return str(value), literal
+    if isinstance(value, str) and isinstance(literal, str):
+        return value.casefold(), literal.casefold()
+    return value, literal
+
+
+def _compare(name, value, op, literal):
+    if name in ("Categories", "urn:schemas-microsoft-com:office:office#Keywords") and op in ("=", "<>", "like", "ci_phrasematch"):
+        values = [v.strip() for v in (value or "").split(",") if v.strip()]
+        hit = any(_compare("", v, "=" if op == "<>" else op, literal) for v in values)
+        return not hit if op == "<>" else hit
+    if op == "like":
+        text = (value or "").casefold() if isinstance(value, str) else str(value or "").casefold()
+        pattern = "^" + re.escape(literal.casefold()).replace("%", ".*") + "$"
+        return re.match(pattern, text, re.S) is not None
+    if op == "ci_phrasematch":
+        return literal.casefold() in str(value or "").casefold()
+    if op == "ci_startswith":
+        return str(value or "").casefold().startswith(literal.casefold())
+    if value is None:
+        return op == "<>"
+    left, right = _coerce(value, literal)
+    try:
+        return {"=": left == right, "<>": left != right, "<": left < right, ">": left > right,
+                "<=": left <= right, ">=": left >= right}[op]
+    except TypeError:
+        return False
+
+
+def compile_filter(expression: str):
+    """将过滤表达式编译为 item -> bool 的函数"""
+    text = expression.strip()
+    if text.startswith("@SQL="):
+        text = text[5:]
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        if text[pos:].strip() == "":
+            break
+        match = _TOKEN.match(text, pos)
+        if not match:
+            raise Exception(f"无法解析条件：{expression}")
+        tokens.append(match.group(0).strip())
+        pos = match.end()
+
+    state = {"i": 0}
+
+    def peek():
+        return tokens[state["i"]] if state["i"] < len(tokens) else None
+
+    def take():
+        token = peek()
+        state["i"] += 1
+        return token
+
+    def parse_or():
+        left = parse_and()
+        while peek() and peek().upper() == "OR":
+            take()
+            right = parse_and()
+            left = (lambda a, b: lambda item: a(item) or b(item))(left, right)
+        return left
+
+    def parse_and():
+        left = parse_not()
+        while peek() and peek().upper() == "AND":
+            take()
+            right = parse_not()
+            left = (lambda a, b: lambda item: a(item) and b(item))(left, right)
+        return left
+
+    def parse_not():
+        if peek() and peek().upper() == "NOT":
+            take()
+            inner = parse_not()
+            return lambda item: not inner(item)
+        if peek() == "(":
+            take()
+            inner = parse_or()
+            take()
+            return inner
+        return parse_comparison()
+
+    def parse_comparison():
+        prop = take()
+        name = prop[1:-1]
+        op = take().lower()
+        if op == "is":
+            negate = peek() and peek().upper() == "NOT"
+            if negate:
+                take()
+            take()  # NULL
+            return lambda item: (item_value(item, name) in (None, "")) != bool(negate)
+        literal = _parse_literal(take())
+        return lambda item: _compare(name, item_value(item, name), op, literal)
+
+    predicate = parse_or()
+    return predicate
+
+
+class Columns(Collection):
+    @com_method
+    def Add(self, name):
+        self._items.append(name)
+        return name
+
+    @com_method
+    def RemoveAll(self):
+        self._items.clear()
+
+
+class Row(ComObject):
+    def __init__(self, table, item):
+        super().__init__()
+        object.__setattr__(self, "_table", table)
+        object.__setattr__(self, "_item", item)
+
+    @com_method
+    def Item(self, column):
+        if isinstance(column, int):
+            column = self._table._columns._items[column - 1]
+        return item_value(self._item, column)
+
+    def __call__(self, column):
+        return self.Item(column)
+
+
+class Table(ComObject):
+    """Folder.GetTable 返回的只读行集合，按列批量读取"""
+
+    DEFAULT_COLUMNS = ["EntryID", "Subject", "CreationTime", "LastModificationTime", "MessageClass"]
+
+    def __init__(self, items):
+        super().__init__()
+        object.__setattr__(self, "_rows", list(items))
+        object.__setattr__(self, "_pos", 0)
+        object.__setattr__(self, "_columns", Columns(self.DEFAULT_COLUMNS))
+
+    def __getattr__(self, name):
+        if name == "EndOfTable":
+            STATS.property_gets += 1
+            STATS.by_name["Table.EndOfTable"] += 1
+            _delay(STATS.property_latency)
+            return self._pos >= len(self._rows)
+        if name == "Columns":
+            STATS.property_gets += 1
+            STATS.by_name["Table.Columns"] += 1
+            _delay(STATS.property_latency)
+            return self._columns
+        return super().__getattr__(name)
+
+    def _row_values(self, item):
+        return tuple(item_value(item, column) for column in self._columns._items)
+
+    @com_method
+    def GetArray(self, max_rows):
+        chunk = self._rows[self._pos:self._pos + max_rows]
+        object.__setattr__(self, "_pos", self._pos + len(chunk))
+        # 模拟一次跨进程调用传输整批数据的开销
+        _delay(STATS.property_latency * len(chunk) * 0.05)
+        return tuple(self._row_values(item) for item in chunk)
+
+    @com_method
+    def GetNextRow(self):
+        if self._pos >= len(self._rows):
+            return None
+        item = self._rows[self._pos]
+        object.__setattr__(self, "_pos", self._pos + 1)
+        return Row(self, item)
+
+    @com_method
+    def GetRowCount(self):
+        return len(self._rows)
+
+    @com_method
+    def Restrict(self, expression):
+        predicate = compile_filter(expression)
+        table = Table([item for item in self._rows[self._pos:] if predicate(item)])
+        object.__setattr__(table, "_columns", Columns(self._columns._items))
+        return table
+
+    @com_method
+    def Sort(self, column, descending=False):
+        self._rows.sort(key=lambda item: (item_value(item, column.strip("[]")) is None,
+                                          item_value(item, column.strip("[]")) or 0),
+                        reverse=descending)
+
+    @com_method
+    def MoveToStart(self):
+        object.__setattr__(self, "_pos", 0)
+
+
+class Items(Collection):
+    """Folder.Items：支持 Sort、GetFirst/GetNext 与迭代"""
+
+    def __init__(self, folder, items=None):
+        super().__init__(items)
+        object.__setattr__(self, "_folder", folder)
+        object.__setattr__(self, "_cursor", 0)
+
+    @com_method
+    def Sort(self, prop, descending=False):
+        key = prop.strip("[]")
+        self._items.sort(
+            key=lambda item: (item._props.get(key) is None, item._props.get(key) or 0),
+            reverse=descending,
+        )
+
+    @com_method
+    def GetFirst(self):
+        object.__setattr__(self, "_cursor", 1)
+        return self._items[0] if self._items else None
+
+    @com_method
+    def GetNext(self):
+        index = self._cursor
+        object.__setattr__(self, "_cursor", index + 1)
+        return self._items[index] if index < len(self._items) else None
+
+    @com_method
+    def Add(self, item_type=0):
+        item = self._folder._session._new_item(item_type)
+        self._folder._add(item)
+        return item
+
+    @com_method
+    def Restrict(self, expression):
+        predicate = compile_filter(expression)
+        return Items(self._folder, [item for item in self._items if predicate(item)])
+
+    @com_method
+    def Find(self, expression):
+        predicate = compile_filter(expression)
+        matches = [item for item in self._items if predicate(item)]
+        object.__setattr__(self, "_found", matches)
+        object.__setattr__(self, "_found_pos", 1)
+        return matches[0] if matches else None
+
+    @com_method
+    def FindNext(self):
+        found = getattr(self, "_found", None) or []
+        index = self._found_pos
+        object.__setattr__(self, "_found_pos", index + 1)
+        return found[index] if index < len(found) else None
+
+
+class Folders(Collection):
+    def __init__(self, parent, items=None):
+        super().__init__(items)
+        object.__setattr__(self, "_parent", parent)
+
+    @com_method
+    def Add(self, name, folder_type=None):
+        folder = Folder(self._parent._session, name, parent=self._parent)
+        self._items.append(folder)
+        return folder
+
+
+class Folder(ComObject):
+    def __init__(self, session, name, parent=None, default_item_type=0, store_id=None, latency=0.0):
+        session._folder_seq += 1
+        path = (parent._props["FolderPath"] if parent is not None else "\\") + "\\" + name
+        if parent is not None:
+            store_id, latency = parent._props["StoreID"], parent._latency
+        super().__init__(
+            Name=name,
+            EntryID=f"FOLDER{session._folder_seq:06d}",
+            StoreID=store_id or session.store_id,
+            FolderPath=path,
+            DefaultItemType=default_item_type,
+        )
+        object.__setattr__(self, "_session", session)
+        object.__setattr__(self, "_parent", parent)
+        # 所在存储的额外往返延迟（秒），用于模拟慢速的网络存档或共享邮箱
+        object.__setattr__(self, "_latency", latency)
+        object.__setattr__(self, "_contents", [])
+        object.__setattr__(self, "_subfolders", Folders(self))
+        object.__setattr__(self, "_event_sinks", [])
+        session._folders_by_id[self._props["EntryID"]] = self
+
+    def __getattr__(self, name):
+        if name == "Items":
+            STATS.property_gets += 1
+            STATS.by_name["Folder.Items"] += 1
+            _delay(STATS.property_latency + self._latency)
+            return Items(self, self._contents)
+        if name == "Folders":
+            STATS.property_gets += 1
+            STATS.by_name["Folder.Folders"] += 1
+            _delay(STATS.property_latency)
+            return self._subfolders
+        if name == "Parent":
+            STATS.property_gets += 1
+            _delay(STATS.property_latency)
+            return self._parent
+        return super().__getattr__(name)
+
+    @com_method
+    def GetTable(self, expression="", table_contents=0):
+        _delay(self._latency)
+        table = Table(self._contents)
+        return table.Restrict(expression) if expression else table
+
+    def _add(self, item):
+        object.__setattr__(item, "_folder", self)
+        self._contents.append(item)
+        self._session._items_by_id[item._props["EntryID"]] = item
+        self._fire("OnItemAdd", item)
+
+    def _remove(self, item):
+        self._contents.remove(item)
+        object.__setattr__(item, "_folder", None)
+        self._fire("OnItemRemove")
+
+    def _fire(self, event, *args):
+        """同步调用通过 DispatchWithEvents 订阅了本文件夹 Items 事件的接收器"""
+        for sink in list(self._event_sinks):
+            handler = getattr(sink, event, None)
+            if handler is not None:
+                handler(*args)
+
+    def _add_subfolder(self, name, default_item_type=0):
+        folder = Folder(self._session, name, parent=self, default_item_type=default_item_type)
+        self._subfolders._items.append(folder)
+        return folder
+
+
+class Rule(ComObject):
+    pass
+
+
+class _Toggle(ComObject):
+    pass
+
+
+class Rules(Collection):
+    def __init__(self, store):
+        super().__init__(store._rules)
+        object.__setattr__(self, "_store", store)
+
+    @com_method
+    def Create(self, name, rule_type):
+        conditions = ComObject(
+            From=_Toggle(Enabled=False, Recipients=Recipients()),
+            SenderAddress=_Toggle(Enabled=False, Address=[]),
+            Subject=_Toggle(Enabled=False, Text=[]),
+        )
+        actions = ComObject(
+            MoveToFolder=_Toggle(Enabled=False, Folder=None),
+            MarkAsRead=_Toggle(Enabled=False),
+            Forward=_Toggle(Enabled=False, Recipients=Recipients()),
+        )
+        rule = Rule(Name=name, Enabled=True, ExecutionOrder=len(self._items) + 1,
+                    RuleType=rule_type, Conditions=conditions, Actions=actions)
+        self._items.append(rule)
+        return rule
+
+    @com_method
+    def Remove(self, index):
+        del self._items[index - 1]
+
+    @com_method
+    def Save(self, show_progress=False):
+        _delay(STATS.call_latency * 20)
+        self._store._rules[:] = self._items
+
+
+class Store(ComObject):
+    def __init__(self, session, display_name, store_id=None, exchange_store_type=0, file_path=""):
+        super().__init__(DisplayName=display_name, StoreID=store_id or session.store_id,
+                         ExchangeStoreType=exchange_store_type, FilePath=file_path)
+        object.__setattr__(self, "_rules", [])
+        object.__setattr__(self, "_folders_by_type", {})
+
+    @com_method
+    def GetRootFolder(self):
+        return self._root
+
+    @com_method
+    def GetDefaultFolder(self, folder_type):
+        if folder_type not in self._folders_by_type:
+            raise Exception(f"无法获取默认文件夹 {folder_type}")
+        return self._folders_by_type[folder_type]
+
+    @com_method
+    def GetRules(self):
+        _delay(STATS.call_latency * 20)
+        return Rules(self)
+
+
+class Category(ComObject):
+    pass
+
+
+class Namespace(ComObject):
+    def __init__(self):
+        super().__init__()
+        object.__setattr__(self, "store_id", "STORE0001")
+        object.__setattr__(self, "_folder_seq", 0)
+        object.__setattr__(self, "_item_seq", 0)
+        object.__setattr__(self, "_folders_by_id", {})
+        object.__setattr__(self, "_items_by_id", {})
+        object.__setattr__(self, "_folders_by_type", {})
+        object.__setattr__(self, "_app_sinks", [])
+        store = Store(self, "Mailbox - 测试用户")
+        root = Folder(self, "Mailbox - 测试用户")
+        self._props.update(
+            DefaultStore=store,
+            Stores=Collection([store]),
+            Folders=Folders(None, [root]),
+            Categories=Collection([Category(Name=name, Color=i) for i, name in
+                                   enumerate(["工作", "会议", "通知", "个人", "紧急"], 1)]),
+        )
+        object.__setattr__(self, "_root", root)
+        object.__setattr__(store, "_root", root)
+        layout = [
+            (6, "收件箱", 0), (5, "已发送邮件", 0), (16, "草稿", 0), (3, "已删除邮件", 0),
+            (18, "垃圾邮件", 0), (4, "发件箱", 0), (9, "日历", 1), (10, "联系人", 2),
+            (11, "日记", 4), (12, "便笺", 5), (13, "任务", 3),
+        ]
+        for folder_type, name, item_type in layout:
+            self._folders_by_type[folder_type] = root._add_subfolder(name, item_type)
+        object.__setattr__(store, "_folders_by_type", self._folders_by_type)
+
+    def add_store(self, display_name, exchange_store_type=3, latency=0.0) -> Store:
+        """挂载一个额外的存储（PST存档、共享邮箱等），只包含收件箱、已发送邮件与已删除邮件；
+        latency 为该存储每次文件夹往返附加的延迟（秒）"""
+        store_id = f"STORE{len(self._props['Stores']._items) + 1:04d}"
+        store = Store(self, display_name, store_id=store_id, exchange_store_type=exchange_store_type,
+                      file_path=f"C:\\Archive\\{display_name}.pst" if exchange_store_type == 3 else "")
+        root = Folder(self, display_name, store_id=store_id, latency=latency)
+        object.__setattr__(store, "_root", root)
+        for folder_type, name in ((6, "收件箱"), (5, "已发送邮件"), (3, "已删除邮件")):
+            store._folders_by_type[folder_type] = root._add_subfolder(name)
+        self._props["Stores"]._items.append(store)
+        self._props["Folders"]._items.append(root)
+        return store
+
+    def deliver(self, items, folder=None):
+        """模拟新邮件投递：逐封放入收件箱（触发 ItemAdd），再以逗号分隔的EntryID触发一次 Application.NewMailEx"""
+        folder = folder or self._folders_by_type[6]
+        for item in items:
+            folder._add(item)
+        entry_ids = ",".join(item._props["EntryID"] for item in items)
+        for sink in list(self._app_sinks):
+            handler = getattr(sink, "OnNewMailEx", None)
+            if handler is not None:
+                handler(entry_ids)
+
+    def next_entry_id(self) -> str:
+        object.__setattr__(self, "_item_seq", self._item_seq + 1)
+        return f"ENTRY{self._item_seq:08d}"
+
+    def _new_item(self, item_type):
+        common = dict(EntryID=self.next_entry_id(), Subject="", Body="",
+                      Recipients=Recipients(), Attachments=Attachments())
+        cls = {0: MailItem, 1: AppointmentItem, 2: ContactItem, 3: TaskItem}.get(item_type, OutlookItem)
+        if item_type == 0:
+            common.update(UnRead=False, Importance=1, Categories="", MessageClass="IPM.Note")
+        return cls(self, **common)
+
+    def _default_folder_for(self, item):
+        folder_type = {TaskItem: 13, ContactItem: 10, AppointmentItem: 9}.get(type(item), 16)
+        return self._folders_by_type.get(folder_type)
+
+    @com_method
+    def GetDefaultFolder(self, folder_type):
+        if folder_type not in self._folders_by_type:
+            raise Exception(f"无法获取默认文件夹 {folder_type}")
+        return self._folders_by_type[folder_type]
+
+    @com_method
+    def GetItemFromID(self, entry_id, store_id=None):
+        item = self._items_by_id.get(entry_id)
+        if item is None or item._folder is None:
+            raise Exception("找不到该条目")
+        return item
+
+    @com_method
+    def GetFolderFromID(self, entry_id, store_id=None):
+        return self._folders_by_id[entry_id]
+
+
+class Application(ComObject):
+    def __init__(self, namespace: Namespace):
+        super().__init__(Session=namespace)
+        object.__setattr__(self, "_namespace", namespace)
+
+    @com_method
+    def GetNamespace(self, name):
+        return self._namespace
+
+    @com_method
+    def CreateItem(self, item_type):
+        return self._namespace._new_item(item_type)
+
+
+# ===== 测试数据生成 =====
+SENDERS = [
+    ("张伟", "zhang.wei@example.com"), ("王芳", "wang.fang@example.com"),
+    ("李娜", "li.na@example.com"), ("刘洋", "liu.yang@example.com"),
+    ("陈静", "chen.jing@example.com"), ("Alice Smith", "alice@example.org"),
+    ("Bob Jones", "bob@example.org"), ("系统通知", "noreply@system.example.com"),
+    ("IT Service Desk", "servicedesk@example.com"), ("Newsletter", "news@marketing.example.net"),
+]
+SUBJECTS = [
+    "项目进度周报", "会议纪要：季度规划", "请审批报销单", "系统维护通知", "报表已生成",
+    "Re: 合同条款确认", "紧急：线上故障处理", "Weekly digest", "优惠活动推广", "关于新员工入职安排",
+]
+BODY_LINES = [
+    "您好，附件是本周的项目进度，请查收。", "会议将于明天下午三点在301会议室召开。",
+    "请在周五之前完成审批，谢谢。", "系统将于本周六凌晨进行维护，期间服务不可用。",
+    "Please find the attached report for your review.", "如有问题请及时联系我。",
+    "感谢大家的辛苦付出，项目已顺利完成。", "该问题需要立即处理，请尽快回复。",
+]
+CATEGORIES = ["", "", "", "工作", "会议", "通知", "工作, 紧急", "个人"]
+
+
+def _pick_folder(rng: random.Random, targets):
+    roll = rng.random()
+    acc = 0.0
+    folder = targets[0][0]
+    for candidate, share in targets:
+        acc += share
+        if roll < acc:
+            folder = candidate
+            break
+    return folder
+
+
+def _make_mail(ns: Namespace, rng: random.Random, i: int, size: int, now: datetime.datetime,
+               days_span: int, allow_meeting: bool = False) -> MailItem:
+    sender_name, sender_email = rng.choice(SENDERS)
+    received = now - datetime.timedelta(seconds=rng.randint(0, days_span * 86400))
+    attachments = Attachments([
+        Attachment(FileName=f"file_{i}_{n}.pdf", Size=rng.randint(10_000, 2_000_000), Type=1)
+        for n in range(rng.choice([0, 0, 0, 1, 2]))
+    ])
+    body = "\n".join(rng.choice(BODY_LINES) for _ in range(rng.randint(2, 12)))
+    recipients = Recipients([Recipient(Name="测试用户", Address="me@example.com")])
+    is_meeting = allow_meeting and rng.random() < 0.02
+    cls = MeetingItem if is_meeting else MailItem
+    item = cls(
+        ns,
+        EntryID=ns.next_entry_id(),
+        ConversationID=f"CONV{rng.randint(0, size // 3 + 1):07d}",
+        Subject=rng.choice(SUBJECTS) + ("" if rng.random() < 0.7 else f" #{i}"),
+        SenderName=sender_name,
+        SenderEmailAddress=sender_email,
+        ReceivedTime=received,
+        SentOn=received - datetime.timedelta(minutes=rng.randint(1, 600)),
+        Recipients=recipients,
+        Body=body,
+        HTMLBody="<html><body>" + body.replace("\n", "<br>") + "</body></html>",
+        Attachments=attachments,
+        UnRead=rng.random() < 0.3,
+        Importance=rng.choice([0, 1, 1, 1, 1, 2]),
+        Categories=rng.choice(CATEGORIES),
+        FlagStatus=0,
+        LastModificationTime=received,
+        Size=len(body) * 2 + 2000 + sum(a._props["Size"] for a in attachments._items),
+        MessageClass="IPM.Schedule.Meeting.Request" if is_meeting else "IPM.Note",
+    )
+    if is_meeting:
+        start = now + datetime.timedelta(days=rng.randint(1, 14), hours=rng.randint(0, 8))
+        item._props["_appointment"] = AppointmentItem(
+            ns, EntryID=ns.next_entry_id(), Subject=item._props["Subject"],
+            Start=start, End=start + datetime.timedelta(hours=1),
+            GlobalAppointmentID=f"GAID{i:08d}", ResponseStatus=5,
+        )
+    return item
+
+
+def build_mailbox(size: int, seed: int = 42, days_span: int = 60) -> Namespace:
+    """生成包含 size 封邮件的模拟邮箱（确定性随机）"""
+    rng = random.Random(seed)
+    ns = Namespace()
+    inbox = ns._folders_by_type[6]
+    sent = ns._folders_by_type[5]
+    projects = inbox._add_subfolder("项目")
+    notices = inbox._add_subfolder("通知")
+    now = datetime.datetime.now()
+    targets = [(inbox, 0.80), (sent, 0.10), (projects, 0.05), (notices, 0.05)]
+
+    for i in range(size):
+        folder = _pick_folder(rng, targets)
+        folder._add(_make_mail(ns, rng, i, size, now, days_span, allow_meeting=folder is inbox))
+
+    tasks = ns._folders_by_type[13]
+    for i in range(max(10, size // 100)):
+        due = now + datetime.timedelta(days=rng.randint(-30, 60))
+        tasks._add(TaskItem(
+            ns, EntryID=ns.next_entry_id(), Subject=f"任务 {i}：{rng.choice(SUBJECTS)}",
+            Complete=rng.random() < 0.4, DueDate=due, Importance=rng.choice([0, 1, 2]),
+            PercentComplete=rng.choice([0, 25, 50, 75]), Body="",
+        ))
+
+    contacts = ns._folders_by_type[10]
+    for i in range(max(10, size // 100)):
+        name, email = SENDERS[i % len(SENDERS)]
+        contacts._add(ContactItem(
+            ns, EntryID=ns.next_entry_id(), FullName=f"{name}{i}", Email1Address=email,
+            CompanyName="示例公司", BusinessTelephoneNumber=f"010-{i:08d}",
+        ))
+
+    calendar = ns._folders_by_type[9]
+    for i in range(max(10, size // 200)):
+        start = now + datetime.timedelta(days=rng.randint(-10, 30), hours=rng.randint(0, 10))
+        calendar._add(AppointmentItem(
+            ns, EntryID=ns.next_entry_id(), Subject=f"日程 {i}", Start=start,
+            End=start + datetime.timedelta(hours=1), Location="301会议室", Organizer="张伟",
+        ))
+    return ns
+
+
+def add_archive(ns: Namespace, display_name: str, size: int, seed: int = 7, days_span: int = 365,
+                exchange_store_type: int = 3, latency: float = 0.0) -> Store:
+    """为模拟邮箱挂载一个包含 size 封邮件的额外存储（存档或共享邮箱）"""
+    rng = random.Random(seed)
+    store = ns.add_store(display_name, exchange_store_type=exchange_store_type, latency=latency)
+    inbox = store._folders_by_type[6]
+    targets = [(inbox, 0.75), (store._folders_by_type[5], 0.15), (inbox._add_subfolder("2023"), 0.10)]
+    now = datetime.datetime.now()
+    for i in range(size):
+        _pick_folder(rng, targets)._add(_make_mail(ns, rng, i, size, now, days_span))
+    return store
+
+
+# ===== win32com 替身 =====
+_application: Optional[Application] = None
+
+
+def set_mailbox(namespace: Namespace) -> Application:
+    """切换 Dispatch("Outlook.Application") 返回的模拟邮箱"""
+    global _application
+    _application = Application(namespace)
+    return _application
+
+
+def Dispatch(prog_id):
+    if prog_id != "Outlook.Application" or _application is None:
+        raise Exception(f"无法创建COM对象：{prog_id}")
+    if STATS.hung:
+        raise com_error(RPC_E_SERVERCALL_RETRYLATER, "The message filter indicated that the application is busy.",
+                        None, None)
+    STATS.method_calls += 1
+    STATS.by_name["Dispatch()"] += 1
+    _delay(STATS.call_latency)
+    return _application
+
+
+def DispatchWithEvents(obj, user_event_class):
+    """模拟 win32com.client.DispatchWithEvents：支持 Folder.Items 与 Application（NewMailEx）的事件，
+    事件在修改条目的线程上同步触发（真实Outlook通过订阅线程的消息循环异步送达）"""
+    sink = user_event_class()
+    if isinstance(obj, Application):
+        obj._namespace._app_sinks.append(sink)
+        return sink
+    folder = getattr(obj, "_folder", None)
+    if folder is not None:
+        folder._event_sinks.append(sink)
+    return sink
+
+
+def install():
+    """将本模块注册为 win32com.client，使服务器模块可在非Windows平台导入"""
+    package = types.ModuleType("win32com")
+    client = types.ModuleType("win32com.client")
+    client.Dispatch = Dispatch
+    client.DispatchWithEvents = DispatchWithEvents
+    package.client = client
+    sys.modules["win32com"] = package
+    sys.modules["win32com.client"] = client
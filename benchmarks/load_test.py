@@ -0,0 +1,213 @@
+"""OutlookMaster-MCP 多会话负载测试
+
+在模拟的Outlook对象模型上（见 fake_outlook.py）模拟多个MCP会话同时调用工具：
+多数会话做交互式操作（列出邮件→按结果集句柄读取邮件→按分类搜索），少数会话反复执行大批量扫描。
+报告各工具的延迟分位数、吞吐量，并检查每个会话的结果集句柄是否只指向自己列出的邮件。
+
+默认在进程内经由 FastMCP 的 call_tool 调用（与网络传输走相同的会话与COM调度路径）；
+加 --http 时启动 streamable-http 服务，每个会话使用独立的MCP客户端连接。
+
+用法：
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --sessions 20 --bulk-sessions 2 --rounds 10 --property-latency-us 20
+    python benchmarks/load_test.py --http --port 8765
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import fake_outlook  # noqa: E402
+
+fake_outlook.install()
+
+import outlook_mcp_server as server  # noqa: E402
+
+HANDLE_PATTERN = re.compile(r"结果集：(r\d+)")
+SUBJECT_PATTERN = re.compile(r"邮件 #1\n主题：([^\n]*)")
+
+
+class InProcessClient:
+    """进程内会话：用上下文变量指定会话，经 FastMCP.call_tool 调用工具"""
+
+    def __init__(self, key: str):
+        self.key = key
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def call(self, name: str, arguments: Dict[str, Any]) -> str:
+        token = server._session_key_override.set(self.key)
+        try:
+            content, _ = await server.mcp.call_tool(name, arguments)
+        finally:
+            server._session_key_override.reset(token)
+        return content[0].text if content else ""
+
+
+class HttpClient:
+    """通过 streamable-http 连接的独立MCP会话"""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    async def __aenter__(self):
+        from mcp import ClientSession
+        from mcp.client.streamable_http import streamablehttp_client
+        self._transport = streamablehttp_client(self.url)
+        read, write, _ = await self._transport.__aenter__()
+        self._session = ClientSession(read, write)
+        await self._session.__aenter__()
+        await self._session.initialize()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.__aexit__(*exc)
+        await self._transport.__aexit__(*exc)
+        return False
+
+    async def call(self, name: str, arguments: Dict[str, Any]) -> str:
+        result = await self._session.call_tool(name, arguments)
+        return result.content[0].text if result.content else ""
+
+
+async def timed_call(client, latencies: Dict[str, List[float]], name: str, arguments: Dict[str, Any]) -> str:
+    start = time.perf_counter()
+    text = await client.call(name, arguments)
+    latencies.setdefault(name, []).append(time.perf_counter() - start)
+    return text
+
+
+async def interactive_session(client, rounds: int, latencies, problems: List[str]):
+    """交互式会话：列出→按句柄读取→按分类搜索；验证句柄只指向本会话列出的邮件"""
+    async with client:
+        for _ in range(rounds):
+            listing = await timed_call(client, latencies, "list_recent_emails", {"days": 2})
+            handle = HANDLE_PATTERN.search(listing)
+            first = SUBJECT_PATTERN.search(listing)
+            if not handle or not first:
+                problems.append(f"列表结果缺少句柄或邮件：{listing[:80]}")
+                continue
+            # 其他会话的搜索会在此期间创建自己的结果集，不应影响本会话的句柄
+            await timed_call(client, latencies, "search_by_category", {"category": "会议", "days": 3})
+            for number in (1, 2, 3):
+                detail = await timed_call(client, latencies, "get_email_by_number",
+                                          {"email_number": f"{handle.group(1)}:{number}"})
+                if number == 1 and f"主题：{first.group(1)}\n" not in detail:
+                    problems.append(f"{handle.group(1)}:1 指向了其他邮件：{detail[:80]}")
+
+
+async def bulk_session(client, rounds: int, latencies):
+    """批量会话：反复执行整个文件夹的扫描"""
+    async with client:
+        for _ in range(rounds):
+            await timed_call(client, latencies, "get_email_statistics", {})
+            await timed_call(client, latencies, "search_emails", {"search_term": "报表 OR 合同", "days": 30})
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def report(title: str, latencies: Dict[str, List[float]]):
+    print(title)
+    print(f"{'工具':<24}{'调用数':>8}{'p50(ms)':>12}{'p95(ms)':>12}{'最大(ms)':>12}")
+    for name, values in sorted(latencies.items()):
+        print(f"{name:<24}{len(values):>8}{statistics.median(values) * 1000:>12.1f}"
+              f"{percentile(values, 0.95) * 1000:>12.1f}{max(values) * 1000:>12.1f}")
+    print()
+
+
+def start_http_server(host: str, port: int):
+    import uvicorn
+    server.SERVER_TRANSPORT = "streamable-http"
+    config = uvicorn.Config(server.mcp.streamable_http_app(), host=host, port=port, log_level="warning")
+    http_server = uvicorn.Server(config)
+    threading.Thread(target=http_server.run, name="load-test-http", daemon=True).start()
+    while not http_server.started:
+        time.sleep(0.05)
+    return http_server
+
+
+async def run(args) -> int:
+    if args.http:
+        for name in ("httpx", "mcp"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+        http_server = start_http_server(args.host, args.port)
+        url = f"http://{args.host}:{args.port}/mcp"
+        make_client = lambda key: HttpClient(url)  # noqa: E731
+    else:
+        http_server = None
+        make_client = InProcessClient
+
+    interactive_latencies: Dict[str, List[float]] = {}
+    bulk_latencies: Dict[str, List[float]] = {}
+    problems: List[str] = []
+    tasks = []
+    for i in range(args.sessions):
+        if i < args.bulk_sessions:
+            tasks.append(bulk_session(make_client(f"bulk-{i}"), args.bulk_rounds, bulk_latencies))
+        else:
+            tasks.append(interactive_session(make_client(f"user-{i}"), args.rounds, interactive_latencies, problems))
+
+    start = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(v) for v in interactive_latencies.values()) + sum(len(v) for v in bulk_latencies.values())
+    snapshot = server.get_com_dispatcher().snapshot()
+    print(f"会话数：{args.sessions}（批量 {args.bulk_sessions}），传输：{'streamable-http' if args.http else '进程内'}，"
+          f"COM工作线程：{snapshot['workers']}，每会话并发：{snapshot['per_session']}")
+    print(f"总调用：{total}，耗时：{elapsed:.2f} s，吞吐：{total / elapsed:.1f} 次/秒，"
+          f"服务端会话：{len(snapshot['sessions'])}\n")
+    report("交互式会话：", interactive_latencies)
+    if bulk_latencies:
+        report("批量会话：", bulk_latencies)
+    print(f"句柄隔离检查：{'通过' if not problems else f'{len(problems)}个问题'}")
+    for problem in problems[:10]:
+        print(f"- {problem}")
+    if http_server:
+        http_server.should_exit = True
+    return 1 if problems else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OutlookMaster-MCP 多会话负载测试")
+    parser.add_argument("--sessions", type=int, default=20, help="并发会话数")
+    parser.add_argument("--bulk-sessions", type=int, default=2, help="其中执行大批量扫描的会话数")
+    parser.add_argument("--rounds", type=int, default=5, help="每个交互式会话的操作轮数")
+    parser.add_argument("--bulk-rounds", type=int, default=3, help="每个批量会话的扫描轮数")
+    parser.add_argument("--size", type=int, default=20000, help="邮箱规模")
+    parser.add_argument("--workers", type=int, default=server.COM_WORKERS, help="COM工作线程数")
+    parser.add_argument("--per-session", type=int, default=server.SESSION_CONCURRENCY, help="每个会话的并发上限")
+    parser.add_argument("--property-latency-us", type=float, default=0.0, help="每次属性读写注入的延迟（微秒）")
+    parser.add_argument("--call-latency-us", type=float, default=0.0, help="每次方法调用注入的延迟（微秒）")
+    parser.add_argument("--http", action="store_true", help="通过 streamable-http 连接")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    fake_outlook.STATS.property_latency = args.property_latency_us / 1e6
+    fake_outlook.STATS.call_latency = args.call_latency_us / 1e6
+    fake_outlook.set_mailbox(fake_outlook.build_mailbox(args.size, seed=args.seed))
+    server._com_dispatcher = server.ComDispatcher(args.workers, args.per_session)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
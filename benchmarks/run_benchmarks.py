@@ -0,0 +1,168 @@
+"""OutlookMaster-MCP 规模基准测试
+
+在模拟的Outlook对象模型上（见 fake_outlook.py）以 1k / 10k / 100k 封邮件的规模运行各个工具，
+报告耗时、COM调用次数与峰值内存。可在Linux上运行，不需要Outlook或pywin32。
+
+用法：
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 1000,10000 --property-latency-us 20 --call-latency-us 200
+    python benchmarks/run_benchmarks.py --tools list_recent_emails,search_emails --json bench.json
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import contextlib
+from typing import Any, Callable, Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import fake_outlook  # noqa: E402
+
+fake_outlook.install()
+
+import outlook_mcp_server as server  # noqa: E402
+
+EXPORT_DIR = tempfile.mkdtemp(prefix="outlook_mcp_bench_")
+
+
+def _list_then(tool: Callable[..., str], *args) -> Callable[[], str]:
+    """先列出邮件填充缓存，再执行依赖邮件编号的工具（列出步骤不计入测量）"""
+    def prepare():
+        with contextlib.redirect_stdout(io.StringIO()):
+            server.list_recent_emails(days=7)
+    return prepare, lambda: tool(*args)
+
+
+# (名称, 准备函数, 被测函数)；准备函数在计时之外执行
+def benchmark_cases() -> List[Tuple[str, Callable[[], Any], Callable[[], str]]]:
+    noop = lambda: None  # noqa: E731
+    cases = [
+        ("list_folders", noop, lambda: server.list_folders()),
+        ("list_recent_emails", noop, lambda: server.list_recent_emails(days=7)),
+        ("search_emails", noop, lambda: server.search_emails("报表 OR 会议", days=7)),
+        ("search_by_date_range", noop, lambda: server.search_by_date_range(
+            (server.datetime.date.today() - server.datetime.timedelta(days=3)).isoformat(),
+            server.datetime.date.today().isoformat())),
+        ("search_unread_emails", noop, lambda: server.search_unread_emails(days=7)),
+        ("search_with_attachments", noop, lambda: server.search_with_attachments(days=7)),
+        ("search_by_importance", noop, lambda: server.search_by_importance("高", days=7)),
+        ("search_by_category", noop, lambda: server.search_by_category("工作", days=7)),
+        ("search_mail_query", noop, lambda: server.search_mail_query(
+            "subject:报表 has:attachment is:unread after:" +
+            (server.datetime.date.today() - server.datetime.timedelta(days=7)).isoformat())),
+        ("get_category_statistics", noop, lambda: server.get_category_statistics()),
+        ("get_folder_summary", noop, lambda: server.get_folder_summary()),
+        ("get_email_statistics", noop, lambda: server.get_email_statistics()),
+        ("get_store_statistics", noop, lambda: server.get_store_statistics(days=30)),
+        ("get_sender_statistics", noop, lambda: server.get_sender_statistics(days=30)),
+        ("get_sender_statistics_advanced", noop, lambda: server.get_sender_statistics_advanced(days=30)),
+        ("analyze_email_trends", noop, lambda: server.analyze_email_trends(days=30)),
+        ("analyze_mail_timeseries", noop, lambda: server.analyze_mail_timeseries(folder_names="all")),
+        ("get_response_time_stats", noop, lambda: server.get_response_time_stats(days=30)),
+        ("get_meeting_invitations", noop, lambda: server.get_meeting_invitations(days=7)),
+        ("list_tasks", noop, lambda: server.list_tasks()),
+        ("simulate_email_rule", noop, lambda: server.simulate_email_rule(
+            sender_contains="系统", subject_contains="维护", include_subfolders=True)),
+        ("get_email_by_number", *_list_then(server.get_email_by_number, 1)),
+        ("summarize_email_thread", *_list_then(server.summarize_email_thread, 1)),
+        ("export_emails_to_file", noop, lambda: server.export_emails_to_file(
+            days=7, file_path=os.path.join(EXPORT_DIR, "export.txt"))),
+        ("mark_multiple_emails", *_list_then(server.mark_multiple_emails, ",".join(map(str, range(1, 21))))),
+        ("delete_multiple_emails", *_list_then(server.delete_multiple_emails, ",".join(map(str, range(1, 11))))),
+    ]
+    return cases
+
+
+def measure(prepare: Callable[[], Any], fn: Callable[[], str], track_memory: bool) -> Dict[str, Any]:
+    """执行一次测量：墙钟时间与COM调用计数；可选地再执行一次以测量峰值内存"""
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        prepare()
+    gc.collect()
+    fake_outlook.STATS.reset()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sink):
+        output = fn()
+    elapsed = time.perf_counter() - start
+    stats = fake_outlook.STATS
+    result = {
+        "wall_ms": elapsed * 1000,
+        "com_calls": stats.total,
+        "property_gets": stats.property_gets,
+        "property_sets": stats.property_sets,
+        "method_calls": stats.method_calls,
+        "simulated_com_ms": stats.simulated_latency * 1000,
+        "output_chars": len(output or ""),
+        "top_com": stats.by_name.most_common(5),
+    }
+    if track_memory:
+        with contextlib.redirect_stdout(sink):
+            prepare()
+        gc.collect()
+        tracemalloc.start()
+        with contextlib.redirect_stdout(sink):
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_kb"] = peak / 1024
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OutlookMaster-MCP 规模基准测试")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="邮箱规模，逗号分隔")
+    parser.add_argument("--tools", default="", help="只运行指定工具，逗号分隔")
+    parser.add_argument("--property-latency-us", type=float, default=0.0, help="每次属性读写注入的延迟（微秒）")
+    parser.add_argument("--call-latency-us", type=float, default=0.0, help="每次方法调用注入的延迟（微秒）")
+    parser.add_argument("--no-memory", action="store_true", help="不测量峰值内存（省去第二次执行）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    selected = {t.strip() for t in args.tools.split(",") if t.strip()}
+    fake_outlook.STATS.property_latency = args.property_latency_us / 1e6
+    fake_outlook.STATS.call_latency = args.call_latency_us / 1e6
+
+    results = []
+    header = f"{'工具':<32}{'规模':>8}{'耗时(ms)':>12}{'COM调用':>12}{'模拟COM(ms)':>14}{'峰值内存(KB)':>14}"
+    print(header)
+    print("-" * len(header))
+    for size in sizes:
+        mailbox = fake_outlook.build_mailbox(size, seed=args.seed)
+        for name, prepare, fn in benchmark_cases():
+            if selected and name not in selected:
+                continue
+            # 破坏性工具使用独立的邮箱副本，避免影响后续用例
+            if name == "delete_multiple_emails":
+                fake_outlook.set_mailbox(fake_outlook.build_mailbox(size, seed=args.seed))
+            else:
+                fake_outlook.set_mailbox(mailbox)
+            server.clear_email_cache()
+            server.invalidate_folder_index()
+            server._item_cache.invalidate()
+            row = measure(prepare, fn, not args.no_memory)
+            row.update(tool=name, size=size)
+            results.append(row)
+            peak = f"{row['peak_kb']:.0f}" if "peak_kb" in row else "-"
+            print(f"{name:<32}{size:>8}{row['wall_ms']:>12.1f}{row['com_calls']:>12}"
+                  f"{row['simulated_com_ms']:>14.1f}{peak:>14}")
+        print()
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+        print(f"结果已写入 {args.json_path}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
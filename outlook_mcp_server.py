@@ -1,69 +1,1132 @@
 import datetime
+import argparse
 import os
-import win32com.client
+import re
+import sys
+import csv
 import json
 import tempfile
 import shutil
-from typing import List, Optional, Dict, Any
+import time
+import types
+import threading
+import functools
+import contextvars
+import cProfile
+import pstats
+import random
+import uuid
+import difflib
+import itertools
+import math
+import html
+from html.parser import HTMLParser
+import inspect
+import asyncio
+import weakref
+import concurrent.futures
+from collections import deque, OrderedDict
+from typing import List, Optional, Dict, Any, Tuple, Union
+import numpy as np
 from mcp.server.fastmcp import FastMCP, Context
 
+
+class OutlookMCP(FastMCP):
+    """注册工具时统一套上调用钩子（性能监控等）的FastMCP；
+    需要访问Outlook的工具交给共享的COM调度器执行，模块内直接调用时仍是同步函数"""
+
+    def tool(self, *args, **kwargs):
+        register = super().tool(*args, **kwargs)
+
+        def decorator(fn):
+            wrapped = instrument_tool(fn)
+            register(wrapped if fn.__name__ in STARTUP_EXEMPT_TOOLS else dispatch_tool(wrapped))
+            return wrapped
+        return decorator
+
 # Initialize FastMCP server
-mcp = FastMCP("OutlookMaster-MCP")
+mcp = OutlookMCP("OutlookMaster-MCP")
 
 # Constants
 MAX_DAYS = 30
-email_cache = {}
 CACHE_FILE = os.path.join(tempfile.gettempdir(), "outlook_email_cache.json")
+RESULT_SET_LIMIT = int(os.environ.get("OUTLOOK_MCP_RESULT_SETS", "20"))
+COM_WORKERS = int(os.environ.get("OUTLOOK_MCP_COM_WORKERS", "2"))
+SESSION_CONCURRENCY = int(os.environ.get("OUTLOOK_MCP_SESSION_CONCURRENCY", "1"))
+SESSION_IDLE_TIMEOUT = float(os.environ.get("OUTLOOK_MCP_SESSION_IDLE_TIMEOUT", "3600"))
+EVENTS_ENABLED = os.environ.get("OUTLOOK_MCP_EVENTS", "1") == "1"
+EVENT_WATCH_LIMIT = int(os.environ.get("OUTLOOK_MCP_EVENT_FOLDERS", "200"))
+NOTIFY_DEBOUNCE = float(os.environ.get("OUTLOOK_MCP_NOTIFY_DEBOUNCE", "2"))
+NOTIFY_MAX_DELAY = float(os.environ.get("OUTLOOK_MCP_NOTIFY_MAX_DELAY", "10"))
+ITEM_CACHE_BYTES = int(float(os.environ.get("OUTLOOK_MCP_ITEM_CACHE_MB", "64")) * 1024 * 1024)
+PREFETCH_COUNT = int(os.environ.get("OUTLOOK_MCP_PREFETCH", "0"))
+BODY_CHAR_BUDGET = int(os.environ.get("OUTLOOK_MCP_BODY_CHARS", "4000"))
+QUERY_CACHE_TTL = float(os.environ.get("OUTLOOK_MCP_QUERY_CACHE_TTL", "300"))
+QUERY_CACHE_BYTES = int(float(os.environ.get("OUTLOOK_MCP_QUERY_CACHE_MB", "16")) * 1024 * 1024)
+DIGEST_FILE = os.environ.get("OUTLOOK_MCP_DIGEST_FILE") or os.path.join(tempfile.gettempdir(), "outlook_mcp_digest.json")
+STORE_TIMEOUT = float(os.environ.get("OUTLOOK_MCP_STORE_TIMEOUT", "30"))
+SNAPSHOT_DIR = os.environ.get("OUTLOOK_MCP_SNAPSHOT_DIR") or os.path.join(tempfile.gettempdir(), "outlook_mcp_snapshot")
+METRICS_ENABLED = os.environ.get("OUTLOOK_MCP_METRICS", "0") == "1"
+METRICS_FILE = os.environ.get("OUTLOOK_MCP_METRICS_FILE") or None
+METRICS_FLUSH_INTERVAL = 5.0
+SPOOL_DIR = os.environ.get("OUTLOOK_MCP_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "outlook_mcp_outbox")
+SEND_RATE_PER_MINUTE = float(os.environ.get("OUTLOOK_MCP_SEND_RATE", "30"))
+SEND_WORKERS = int(os.environ.get("OUTLOOK_MCP_SEND_WORKERS", "1"))
+SEND_MAX_ATTEMPTS = int(os.environ.get("OUTLOOK_MCP_SEND_MAX_ATTEMPTS", "5"))
+SEND_RETRY_BASE = 5.0
+SEND_RETRY_MAX = 300.0
+COM_RETRY_TIMEOUT_MS = int(os.environ.get("OUTLOOK_MCP_COM_RETRY_TIMEOUT_MS", "20000"))
+COM_RETRY_BASE_MS = 100
+COM_RETRY_MAX_MS = 2000
+COM_CONNECT_ATTEMPTS = 3
+BREAKER_THRESHOLD = int(os.environ.get("OUTLOOK_MCP_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.environ.get("OUTLOOK_MCP_BREAKER_COOLDOWN", "30"))
+STARTUP_WAIT_TIMEOUT = float(os.environ.get("OUTLOOK_MCP_STARTUP_TIMEOUT", "120"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("OUTLOOK_MCP_PROFILE_RATE", "0") or 0)
+PROFILE_DIR = os.environ.get("OUTLOOK_MCP_PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "outlook_mcp_profiles")
+PROFILE_TOOLS = {t.strip() for t in os.environ.get("OUTLOOK_MCP_PROFILE_TOOLS", "").split(",") if t.strip()}
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# ===== 性能监控 =====
+class LatencyHistogram:
+    """累积延迟直方图（与Prometheus的histogram语义一致）"""
+
+    __slots__ = ("buckets", "counts", "count", "total")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估算分位数"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, bound in enumerate(self.buckets):
+            seen += self.counts[i]
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class ToolMetrics:
+    """单个工具的调用次数、总延迟直方图与各类操作（COM/缓存）的直方图"""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.ops: Dict[str, LatencyHistogram] = {}
+        self.errors = 0
+        self.last_breakdown: Dict[str, float] = {}
+
+    def op(self, name: str) -> LatencyHistogram:
+        histogram = self.ops.get(name)
+        if histogram is None:
+            histogram = self.ops[name] = LatencyHistogram()
+        return histogram
+
+
+_tool_metrics: Dict[str, ToolMetrics] = {}
+_metrics_lock = threading.Lock()
+_metrics_last_flush = 0.0
+# 当前工具调用的 (ToolMetrics, 本次调用按类别累计的耗时)；不在工具调用中时为None
+_current_invocation = contextvars.ContextVar("outlook_mcp_invocation", default=None)
+
+
+def record_op(op: str, seconds: float):
+    """记录一次操作耗时；op形如 'com.get:Body'、'com.call:GetItemFromID'、'cache:load_result_sets'"""
+    invocation = _current_invocation.get()
+    if invocation is None or invocation[0] is None:
+        return
+    metrics, breakdown = invocation
+    metrics.op(op).observe(seconds)
+    category = op.split(":", 1)[0]
+    breakdown[category] = breakdown.get(category, 0.0) + seconds
+
+
+def timed_op(op: str):
+    """装饰器：在性能监控开启时记录函数耗时"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED or _current_invocation.get() is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_op(op, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+_PLAIN_TYPES = (str, int, float, bool, bytes, datetime.date, datetime.timedelta, tuple, list, dict)
+
+
+def wrap_com(value):
+    """将COM对象包装为计时代理；基本类型原样返回"""
+    if value is None or isinstance(value, _PLAIN_TYPES) or isinstance(value, ComProxy):
+        return value
+    return ComProxy(value)
+
+
+def unwrap_com(value):
+    return value._obj if isinstance(value, ComProxy) else value
+
+
+class ComProxy:
+    """记录属性读写与方法调用耗时的COM对象代理，仅在性能监控开启时使用"""
+
+    __slots__ = ("_obj",)
+
+    def __init__(self, obj):
+        object.__setattr__(self, "_obj", obj)
+
+    def __getattr__(self, name):
+        start = time.perf_counter()
+        value = getattr(self._obj, name)
+        if isinstance(value, types.MethodType):
+            return self._method(name, value)
+        record_op(f"com.get:{name}", time.perf_counter() - start)
+        return wrap_com(value)
+
+    def __setattr__(self, name, value):
+        start = time.perf_counter()
+        setattr(self._obj, name, unwrap_com(value))
+        record_op(f"com.set:{name}", time.perf_counter() - start)
+
+    def _method(self, name, method):
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*[unwrap_com(a) for a in args],
+                            **{k: unwrap_com(v) for k, v in kwargs.items()})
+            record_op(f"com.call:{name}", time.perf_counter() - start)
+            return wrap_com(result)
+        return call
+
+    def __call__(self, *args):
+        start = time.perf_counter()
+        result = self._obj(*[unwrap_com(a) for a in args])
+        record_op("com.call:Item", time.perf_counter() - start)
+        return wrap_com(result)
+
+    def __iter__(self):
+        iterator = iter(self._obj)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            record_op("com.call:Next", time.perf_counter() - start)
+            yield wrap_com(item)
+
+    def __bool__(self):
+        return bool(self._obj)
+
+    def __eq__(self, other):
+        return self._obj == unwrap_com(other)
+
+    def __hash__(self):
+        return hash(self._obj)
+
+
+def instrument_tool(fn):
+    """包装工具函数：按需记录性能指标，并按采样率对本次调用做cProfile剖析"""
+    tool_name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _startup_ready.is_set() and tool_name not in STARTUP_EXEMPT_TOOLS:
+            _startup_ready.wait(STARTUP_WAIT_TIMEOUT)
+        if _com_health.get() is not None:
+            # 嵌套调用的工具计入外层调用
+            return fn(*args, **kwargs)
+        uses_outlook = tool_name not in STARTUP_EXEMPT_TOOLS
+        if uses_outlook:
+            remaining = _breaker.allow()
+            if remaining is not None:
+                return _breaker.describe_open(remaining)
+        health = ComHealth()
+        token = _com_health.set(health)
+        try:
+            if not METRICS_ENABLED and not PROFILE_SAMPLE_RATE:
+                result = fn(*args, **kwargs)
+            else:
+                result = run_tool_invocation(tool_name, fn, args, kwargs)
+        except BaseException as e:
+            # 工具抛出的异常也算失败，否则熔断后的试探调用出错时会一直停在"试探中"
+            health.failure = health.failure or str(e) or type(e).__name__
+            raise
+        finally:
+            _com_health.reset(token)
+            if uses_outlook:
+                _breaker.record(health)
+        return health.annotate(result)
+    return wrapper
+
+
+def run_tool_invocation(tool_name: str, fn, args, kwargs):
+    """执行一次最外层的工具调用，嵌套调用的工具计入外层"""
+    metrics = None
+    if METRICS_ENABLED:
+        with _metrics_lock:
+            metrics = _tool_metrics.setdefault(tool_name, ToolMetrics())
+    profiler = start_tool_profile(tool_name)
+    breakdown: Dict[str, float] = {}
+    token = _current_invocation.set((metrics, breakdown))
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        if metrics:
+            metrics.errors += 1
+        raise
+    finally:
+        if profiler:
+            try:
+                profiler.disable()
+            finally:
+                _profile_lock.release()
+        elapsed = time.perf_counter() - start
+        _current_invocation.reset(token)
+        if metrics:
+            breakdown["total"] = elapsed
+            with _metrics_lock:
+                metrics.latency.observe(elapsed)
+                metrics.last_breakdown = breakdown
+            maybe_flush_metrics()
+        if profiler:
+            save_tool_profile(tool_name, fn, args, kwargs, elapsed, profiler)
+
+
+def render_prometheus_metrics() -> str:
+    """以Prometheus文本格式导出工具与操作的延迟直方图"""
+    lines = [
+        "# HELP outlook_mcp_tool_duration_seconds Tool invocation latency.",
+        "# TYPE outlook_mcp_tool_duration_seconds histogram",
+    ]
+    op_lines = [
+        "# HELP outlook_mcp_op_duration_seconds COM and cache operation latency per tool.",
+        "# TYPE outlook_mcp_op_duration_seconds histogram",
+    ]
+
+    def histogram_lines(name, labels, histogram):
+        out = []
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            out.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        out.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        out.append(f"{name}_sum{{{labels}}} {histogram.total:.6f}")
+        out.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return out
+
+    with _metrics_lock:
+        for tool_name, metrics in sorted(_tool_metrics.items()):
+            lines.extend(histogram_lines("outlook_mcp_tool_duration_seconds",
+                                         f'tool="{tool_name}"', metrics.latency))
+            for op, histogram in sorted(metrics.ops.items()):
+                op_lines.extend(histogram_lines("outlook_mcp_op_duration_seconds",
+                                                f'tool="{tool_name}",op="{op}"', histogram))
+    return "\n".join(lines + op_lines) + "\n"
+
+
+def maybe_flush_metrics(force: bool = False):
+    """按间隔将Prometheus文本写入 METRICS_FILE（原子替换）"""
+    global _metrics_last_flush
+    if not METRICS_FILE:
+        return
+    now = time.monotonic()
+    if not force and now - _metrics_last_flush < METRICS_FLUSH_INTERVAL:
+        return
+    _metrics_last_flush = now
+    try:
+        tmp_path = METRICS_FILE + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(render_prometheus_metrics())
+        os.replace(tmp_path, METRICS_FILE)
+    except Exception as e:
+        print(f"写入监控指标文件出错: {str(e)}", file=sys.stderr)
+
+# ===== 性能剖析 =====
+_recent_profiles = deque(maxlen=200)
+# 同一时刻只剖析一个调用：多个COM工作线程并发执行工具，Python 3.12起同时启用第二个剖析器会抛出异常
+_profile_lock = threading.Lock()
+
+
+def should_profile(tool_name: str) -> bool:
+    if PROFILE_SAMPLE_RATE <= 0 or (PROFILE_TOOLS and tool_name not in PROFILE_TOOLS):
+        return False
+    return PROFILE_SAMPLE_RATE >= 1 or random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_tool_profile(tool_name: str) -> Optional[cProfile.Profile]:
+    """按采样率开始剖析本次调用；已有调用正在剖析时跳过本次采样。剖析器出错不影响工具调用"""
+    if not should_profile(tool_name) or not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    except Exception as e:
+        _profile_lock.release()
+        print(f"启动性能剖析出错: {str(e)}", file=sys.stderr)
+        return None
+
+
+def describe_arguments(fn, args, kwargs) -> Dict[str, Any]:
+    """记录调用参数（过长的字符串会被截断）"""
+    try:
+        bound = inspect.signature(fn).bind_partial(*args, **kwargs).arguments
+    except Exception:
+        bound = {"args": list(args), **kwargs}
+    described = {}
+    for key, value in bound.items():
+        if isinstance(value, str) and len(value) > 200:
+            value = value[:200] + f"...（共{len(value)}字符）"
+        described[key] = value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+    return described
+
+
+def save_tool_profile(tool_name: str, fn, args, kwargs, elapsed: float, profiler: cProfile.Profile):
+    """将剖析结果写入 PROFILE_DIR：<时间戳>_<工具名>.prof 及同名 .json 说明文件"""
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        now = datetime.datetime.now()
+        base = os.path.join(PROFILE_DIR, f"{now.strftime('%Y%m%d_%H%M%S_%f')}_{tool_name}")
+        profiler.dump_stats(base + ".prof")
+        record = {
+            "tool": tool_name,
+            "arguments": describe_arguments(fn, args, kwargs),
+            "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "duration_ms": round(elapsed * 1000, 2),
+            "profile_file": base + ".prof",
+        }
+        with open(base + ".json", 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        _recent_profiles.append(record)
+    except Exception as e:
+        print(f"保存性能剖析结果出错: {str(e)}", file=sys.stderr)
+
+
+def load_profile_records() -> List[Dict[str, Any]]:
+    """读取剖析记录；内存中没有记录时（如重启后）从 PROFILE_DIR 扫描"""
+    if _recent_profiles:
+        return list(_recent_profiles)
+    records = []
+    if os.path.isdir(PROFILE_DIR):
+        for file in sorted(os.listdir(PROFILE_DIR))[-_recent_profiles.maxlen:]:
+            if file.endswith('.json'):
+                try:
+                    with open(os.path.join(PROFILE_DIR, file), 'r', encoding='utf-8') as f:
+                        records.append(json.load(f))
+                except Exception:
+                    continue
+    _recent_profiles.extend(records)
+    return records
+
+# ===== 结果集 =====
+class ResultSetStore:
+    """带句柄的搜索结果集：每次列表/搜索生成新的句柄（r1、r2…），多个结果集同时有效，
+    超出上限时淘汰最久未使用的结果集。每封邮件记录 EntryID 与 StoreID"""
+
+    def __init__(self, path: str, limit: int):
+        self.path = path
+        self.limit = limit
+        self.sets: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.next_id = 1
+        self.lock = threading.RLock()
+        self.loaded = False
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            data = load_result_sets(self.path) if self.path else None
+            if data:
+                self.next_id = data.get("next_id", 1)
+                self.sets = OrderedDict((s["handle"], s) for s in data.get("sets", []))
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            save_result_sets(self.path, {"next_id": self.next_id, "sets": list(self.sets.values())})
+
+    def create(self, label: str, emails: List[Dict[str, Any]], store_id: Optional[str] = None) -> str:
+        self.load()
+        stored = []
+        for email in emails:
+            email = {k: v for k, v in email.items() if k != "body"}
+            email["id"] = str(email.get("id", ""))
+            email.setdefault("store_id", store_id)
+            stored.append(email)
+        with self.lock:
+            handle = f"r{self.next_id}"
+            self.next_id += 1
+            self.sets[handle] = {
+                "handle": handle,
+                "label": label,
+                "created_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "emails": stored,
+            }
+            while len(self.sets) > max(1, self.limit):
+                self.sets.popitem(last=False)
+            self.save()
+        return handle
+
+    def get(self, handle: str) -> Optional[Dict[str, Any]]:
+        self.load()
+        with self.lock:
+            result_set = self.sets.get(handle.lower())
+            if result_set is not None:
+                self.sets.move_to_end(result_set["handle"])
+            return result_set
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        self.load()
+        with self.lock:
+            if not self.sets:
+                return None
+            return self.get(max(self.sets.values(), key=lambda s: int(s["handle"][1:]))["handle"])
+
+    def find_by_entry_id(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            for result_set in reversed(self.sets.values()):
+                for email in result_set["emails"]:
+                    if email["id"] == entry_id:
+                        return email
+        return None
+
+    def clear(self):
+        with self.lock:
+            self.sets.clear()
+            self.loaded = True
+            try:
+                if self.path and os.path.exists(self.path):
+                    os.remove(self.path)
+            except Exception as e:
+                print(f"清除缓存文件失败: {str(e)}", file=sys.stderr)
 
-def save_email_cache(cache_data):
-    """将邮件缓存保存到文件"""
+
+RESULT_REF_PATTERN = re.compile(r"^(r\d+)\s*[:#]\s*(\d+)$", re.IGNORECASE)
+RESULT_SET_ALL_PATTERN = re.compile(r"^(r\d+)\s*[:#]\s*\*$", re.IGNORECASE)
+RESULT_RANGE_PATTERN = re.compile(r"^(?:(r\d+)\s*[:#]\s*)?(\d+)\s*-\s*(\d+)$", re.IGNORECASE)
+
+
+@timed_op("cache:save_result_sets")
+def save_result_sets(path: str, data: Dict[str, Any]) -> bool:
+    """将结果集保存到文件，重启后句柄仍然有效"""
     try:
-        serializable_cache = {}
-        for key, email in cache_data.items():
-            email_copy = email.copy()
-            email_copy['id'] = str(email_copy['id'])
-            serializable_cache[str(key)] = email_copy
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(serializable_cache, f, ensure_ascii=False, default=str)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
         return True
     except Exception as e:
-        print(f"保存缓存出错: {str(e)}")
+        print(f"保存缓存出错: {str(e)}", file=sys.stderr)
         return False
 
-def load_email_cache():
-    """从文件加载邮件缓存"""
-    if os.path.exists(CACHE_FILE):
+
+@timed_op("cache:load_result_sets")
+def load_result_sets(path: str) -> Dict[str, Any]:
+    """从文件加载结果集；旧版本的编号缓存不再兼容，直接忽略"""
+    if os.path.exists(path):
         try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                cache = json.load(f)
-                return {int(k): v for k, v in cache.items()}
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict) and "sets" in data:
+                return data
         except Exception as e:
-            print(f"加载缓存出错: {str(e)}")
-            return {}
+            print(f"加载缓存出错: {str(e)}", file=sys.stderr)
     return {}
 
+
+# ===== 会话与COM调度 =====
+DEFAULT_SESSION = "default"
+SERVER_TRANSPORT = "stdio"
+
+
+class SessionState:
+    """一个MCP会话的独立状态：结果集与待执行的工具调用队列。
+    默认会话（stdio或模块内直接调用）的结果集持久化到缓存文件，网络会话只保存在内存中"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.result_sets = ResultSetStore(CACHE_FILE if key == DEFAULT_SESSION else None, RESULT_SET_LIMIT)
+        self.queue: deque = deque()
+        self.in_flight = 0
+        self.calls = 0
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+
+_sessions: Dict[str, SessionState] = {}
+_sessions_lock = threading.Lock()
+_current_session: contextvars.ContextVar = contextvars.ContextVar("outlook_mcp_session", default=None)
+# 测试或内嵌调用时可直接指定会话（优先于MCP请求上下文）
+_session_key_override: contextvars.ContextVar = contextvars.ContextVar("outlook_mcp_session_key", default=None)
+
+
+def get_session(key: str) -> SessionState:
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = SessionState(key)
+            expire_idle_sessions()
+        session.last_used = time.time()
+        return session
+
+
+def expire_idle_sessions():
+    """清理长时间空闲的网络会话（调用方持有 _sessions_lock）"""
+    cutoff = time.time() - SESSION_IDLE_TIMEOUT
+    for key, session in list(_sessions.items()):
+        if key != DEFAULT_SESSION and session.last_used < cutoff and not session.queue and not session.in_flight:
+            del _sessions[key]
+
+
+def drop_session(key: str):
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is not None and not session.queue and not session.in_flight:
+            del _sessions[key]
+
+
+def current_session_key() -> str:
+    """当前MCP请求所属的会话；stdio只有一个客户端，始终使用默认会话"""
+    override = _session_key_override.get()
+    if override:
+        return override
+    if SERVER_TRANSPORT == "stdio":
+        return DEFAULT_SESSION
+    try:
+        server_session = mcp.get_context().session
+    except Exception:
+        return DEFAULT_SESSION
+    key = f"s{id(server_session):x}"
+    if key not in _sessions:
+        weakref.finalize(server_session, drop_session, key)
+    return key
+
+
+def current_session() -> SessionState:
+    session = _current_session.get()
+    return session if session is not None else get_session(DEFAULT_SESSION)
+
+
+def current_result_sets() -> "ResultSetStore":
+    return current_session().result_sets
+
+
+class ComDispatcher:
+    """所有会话共享的COM调度器。每个会话一个FIFO队列，工作线程在有待执行任务的会话之间轮转取任务，
+    单个会话同时执行的任务数不超过 SESSION_CONCURRENCY，因此一个会话的大批量扫描不会让其他会话饿死"""
+
+    def __init__(self, workers: int, per_session: int):
+        self.workers = max(1, workers)
+        self.per_session = max(1, per_session)
+        self.condition = threading.Condition()
+        self.ready: deque = deque()
+        self.threads: List[threading.Thread] = []
+        self.completed = 0
+
+    def submit(self, session: SessionState, fn, args, kwargs) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self.condition:
+            session.queue.append((fn, args, kwargs, future))
+            session.calls += 1
+            self._schedule(session)
+            self.condition.notify()
+            self.threads = [t for t in self.threads if t.is_alive()]
+            for i in range(len(self.threads), self.workers):
+                self.threads.append(start_com_thread(self._worker_loop, f"outlook-com-{i + 1}"))
+        return future
+
+    def _schedule(self, session: SessionState):
+        if session.queue and session.in_flight < self.per_session and session not in self.ready:
+            self.ready.append(session)
+
+    def _next_job(self):
+        with self.condition:
+            while not self.ready:
+                self.condition.wait()
+            session = self.ready.popleft()
+            job = session.queue.popleft()
+            session.in_flight += 1
+            # 还有任务的会话排到队尾，实现轮转
+            self._schedule(session)
+            return session, job
+
+    def _worker_loop(self):
+        while True:
+            session, (fn, args, kwargs, future) = self._next_job()
+            if future.set_running_or_notify_cancel():
+                token = _current_session.set(session)
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+                finally:
+                    _current_session.reset(token)
+            with self.condition:
+                session.in_flight -= 1
+                session.last_used = time.time()
+                self.completed += 1
+                self._schedule(session)
+                self.condition.notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                "workers": self.workers,
+                "per_session": self.per_session,
+                "completed": self.completed,
+                "sessions": {key: {"queued": len(s.queue), "in_flight": s.in_flight, "calls": s.calls,
+                                   "result_sets": len(s.result_sets.sets), "last_used": s.last_used}
+                             for key, s in list(_sessions.items())},
+            }
+
+
+_com_dispatcher: Optional[ComDispatcher] = None
+
+
+def get_com_dispatcher() -> ComDispatcher:
+    global _com_dispatcher
+    if _com_dispatcher is None:
+        _com_dispatcher = ComDispatcher(COM_WORKERS, SESSION_CONCURRENCY)
+    return _com_dispatcher
+
+
+def dispatch_tool(fn):
+    """注册给FastMCP的异步入口：在事件循环中确定会话，把调用交给COM调度器执行"""
+    @functools.wraps(fn)
+    async def adapter(*args, **kwargs):
+        session = get_session(current_session_key())
+        future = get_com_dispatcher().submit(session, fn, args, kwargs)
+        return await asyncio.wrap_future(future)
+    return adapter
+
+
+def create_result_set(label: str, emails: List[Dict[str, Any]], folder=None) -> str:
+    """保存一次列表/搜索的结果并返回句柄；传入folder时记录其StoreID"""
+    store_id = None
+    if folder is not None:
+        try:
+            store_id = folder.StoreID
+        except Exception:
+            store_id = None
+    handle = current_result_sets().create(label, emails, store_id)
+    _prefetcher.schedule([dict(e, store_id=e.get("store_id") or store_id) for e in emails[:PREFETCH_COUNT]])
+    return handle
+
+
+def result_set_note(handle: str) -> str:
+    return f"结果集：{handle}（可用 \"{handle}:编号\" 引用以上邮件，其他搜索不会改变这些编号）\n"
+
+
+def lookup_email(ref: Union[int, str]) -> Dict[str, Any]:
+    """解析邮件引用："r3:5"（结果集r3的第5封）、纯编号（最近一次结果集）或邮件的稳定ID（EntryID）"""
+    text = str(ref).strip()
+    match = RESULT_REF_PATTERN.match(text)
+    if match:
+        handle, number = match.group(1).lower(), int(match.group(2))
+        result_set = current_result_sets().get(handle)
+        if result_set is None:
+            raise LookupError(f"结果集 {handle} 不存在或已过期，请重新列出邮件")
+    elif text.isdigit():
+        number = int(text)
+        result_set = current_result_sets().latest()
+        if result_set is None:
+            raise LookupError("还没有列出任何邮件。请先列出邮件。")
+    elif text:
+        return current_result_sets().find_by_entry_id(text) or {"id": text, "store_id": None}
+    else:
+        raise LookupError("邮件引用不能为空")
+    if not 1 <= number <= len(result_set["emails"]):
+        raise LookupError(f"找不到邮件 #{text}（结果集 {result_set['handle']} 共{len(result_set['emails'])}封）")
+    return result_set["emails"][number - 1]
+
+
+def split_email_refs(text: str) -> List[str]:
+    """拆分逗号分隔的邮件引用；"r3:1,2,5" 中的纯编号沿用前面的结果集句柄，"r3:*" 展开为结果集中的全部邮件，
+    "r3:4-9" 展开为编号区间"""
+    refs = []
+    handle = None
+    for part in (x.strip() for x in re.split(r"[,，]", text)):
+        if not part:
+            continue
+        whole = RESULT_SET_ALL_PATTERN.match(part)
+        if whole:
+            handle = whole.group(1).lower()
+            result_set = current_result_sets().get(handle)
+            # 结果集不存在时保留一个引用，让调用方报告"结果集不存在"
+            count = len(result_set["emails"]) if result_set else 1
+            refs.extend(f"{handle}:{number}" for number in range(1, count + 1))
+            continue
+        span = RESULT_RANGE_PATTERN.match(part)
+        if span:
+            handle = span.group(1).lower() if span.group(1) else handle
+            first, last = int(span.group(2)), int(span.group(3))
+            if first > last:
+                first, last = last, first
+            prefix = f"{handle}:" if handle else ""
+            refs.extend(f"{prefix}{number}" for number in range(first, last + 1))
+            continue
+        match = RESULT_REF_PATTERN.match(part)
+        if match:
+            handle = match.group(1).lower()
+        elif part.isdigit() and handle:
+            part = f"{handle}:{part}"
+        refs.append(part)
+    return refs
+
+
+def open_email(namespace, email_data: Dict[str, Any]):
+    """按EntryID（及StoreID）打开邮件以便修改；缓存中的副本随即失效"""
+    _item_cache.invalidate(email_data["id"])
+    return open_item(namespace, email_data)
+
+
+def open_item(namespace, email_data: Dict[str, Any]):
+    if email_data.get("store_id"):
+        return namespace.GetItemFromID(email_data["id"], email_data["store_id"])
+    return namespace.GetItemFromID(email_data["id"])
+
+
 def clear_email_cache():
-    """清空邮件缓存"""
-    global email_cache
-    email_cache = {}
-    if os.path.exists(CACHE_FILE):
+    """清空当前会话的所有结果集"""
+    current_result_sets().clear()
+
+def connect_to_outlook():
+    """连接到Outlook应用程序；Outlook繁忙或暂时不可用时按指数退避重试几次"""
+    for attempt in range(COM_CONNECT_ATTEMPTS):
         try:
-            os.remove(CACHE_FILE)
+            import win32com.client
+            outlook = win32com.client.Dispatch("Outlook.Application")
+            namespace = outlook.GetNamespace("MAPI")
+            if METRICS_ENABLED and _current_invocation.get() is not None:
+                return wrap_com(outlook), wrap_com(namespace)
+            return outlook, namespace
         except Exception as e:
-            print(f"清除缓存文件失败: {str(e)}")
+            if com_error_name(e) and attempt + 1 < COM_CONNECT_ATTEMPTS:
+                time.sleep(COM_RETRY_BASE_MS / 1000 * 4 ** attempt)
+                continue
+            health = _com_health.get()
+            if health is not None and com_error_name(e):
+                health.failure = f"连接Outlook失败：{describe_com_error(e)}"
+            raise Exception(f"连接Outlook失败：{describe_com_error(e)}") from e
+
+
+# ===== COM繁忙处理 =====
+# Outlook忙或不可用时返回的HRESULT
+COM_BUSY_ERRORS = {
+    -2147418111: "RPC_E_CALL_REJECTED（调用被拒绝）",
+    -2147417846: "RPC_E_SERVERCALL_RETRYLATER（服务器忙）",
+    -2147418110: "RPC_E_CALL_CANCELED（调用被取消）",
+    -2147023174: "RPC_S_SERVER_UNAVAILABLE（RPC服务器不可用）",
+    -2147417848: "RPC_E_DISCONNECTED（对象已断开）",
+    -2146959355: "CO_E_SERVER_EXEC_FAILURE（无法启动Outlook）",
+}
+SERVERCALL_ISHANDLED = 0
+SERVERCALL_RETRYLATER = 2
+PENDINGMSG_WAITDEFPROCESS = 2
+IID_IMESSAGE_FILTER = "{00000016-0000-0000-C000-000000000046}"
+
+
+def com_error_name(error: BaseException) -> Optional[str]:
+    """异常（或其原因链）中表示Outlook繁忙/不可用的HRESULT名称；不是这类错误时返回None"""
+    seen = 0
+    while error is not None and seen < 5:
+        code = getattr(error, "hresult", None)
+        if code is None and error.args and isinstance(error.args[0], int):
+            code = error.args[0]
+        if code in COM_BUSY_ERRORS:
+            return COM_BUSY_ERRORS[code]
+        error = error.__cause__
+        seen += 1
+    return None
+
+
+def describe_com_error(error: BaseException) -> str:
+    name = com_error_name(error)
+    return f"Outlook繁忙或无响应：{name}" if name else str(error)
+
+
+class ComHealth:
+    """一次工具调用期间的COM状况：被拒绝并自动重试的调用、重试耗尽放弃的调用、跳过的条目"""
+
+    def __init__(self):
+        self.rejected = 0
+        self.gave_up = 0
+        self.skipped = 0
+        self.skip_reasons: Dict[str, int] = {}
+        self.failure: Optional[str] = None
+
+    def skip(self, error: Optional[BaseException] = None, count: int = 1):
+        reason = "Outlook繁忙" if error is not None and com_error_name(error) else "无法读取"
+        self.skipped += count
+        self.skip_reasons[reason] = self.skip_reasons.get(reason, 0) + count
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.gave_up or self.failure)
+
+    def annotate(self, result):
+        """在工具的文本结果末尾注明不完整的扫描与Outlook繁忙的情况"""
+        if not isinstance(result, str):
+            return result
+        notes = ""
+        if self.skipped:
+            reasons = "，".join(f"{reason}{count}个" for reason, count in self.skip_reasons.items())
+            notes += f"⚠️ 结果不完整：跳过了{self.skipped}个条目（{reasons}）\n"
+        if self.gave_up:
+            notes += (f"⚠️ Outlook持续繁忙：{self.gave_up}次调用在重试{COM_RETRY_TIMEOUT_MS / 1000:g}秒后放弃"
+                      f"（共被拒绝{self.rejected}次）\n")
+        if not notes:
+            return result
+        return result + ("" if result.endswith("\n") else "\n") + notes
+
+
+_com_health: contextvars.ContextVar = contextvars.ContextVar("outlook_mcp_com_health", default=None)
+_com_busy_stats = {"rejected": 0, "gave_up": 0}
+
+
+def note_skipped(error: Optional[BaseException] = None, count: int = 1):
+    """记录扫描中因错误跳过的条目，工具结果中会注明跳过的数量"""
+    health = _com_health.get()
+    if health is not None:
+        health.skip(error, count)
+
+
+def skipped_count() -> int:
+    """本次工具调用中到目前为止跳过的条目数；前后两次取值不同说明期间读到的数据不完整"""
+    health = _com_health.get()
+    return health.skipped if health is not None else 0
+
+
+def com_retry_delay(elapsed_ms: int, reject_type: int) -> int:
+    """被拒绝的调用在重试前等待的毫秒数（IMessageFilter.RetryRejectedCall 的返回值），-1 表示放弃。
+    等待时间随已耗时指数增长（100、200、400…毫秒，上限 COM_RETRY_MAX_MS），总耗时超过 COM_RETRY_TIMEOUT_MS 后放弃"""
+    health = _com_health.get()
+    _com_busy_stats["rejected"] += 1
+    if health is not None:
+        health.rejected += 1
+    if reject_type != SERVERCALL_RETRYLATER or elapsed_ms >= COM_RETRY_TIMEOUT_MS:
+        _com_busy_stats["gave_up"] += 1
+        if health is not None:
+            health.gave_up += 1
+        return -1
+    # 此前的等待总和约为 BASE*(2^n - 1)，由已耗时反推这是第n次重试
+    attempt = int(math.log2(elapsed_ms / COM_RETRY_BASE_MS + 1))
+    return min(COM_RETRY_MAX_MS, COM_RETRY_BASE_MS * 2 ** attempt)
+
+
+class OutlookMessageFilter:
+    """COM消息过滤器（IMessageFilter）。Outlook正忙（例如打开了模态对话框）时会以 SERVERCALL_RETRYLATER
+    拒绝跨进程调用，默认行为是立即失败；注册后由COM在同一调用上按 com_retry_delay 退避重试"""
+    _com_interfaces_ = [IID_IMESSAGE_FILTER]
+    _public_methods_ = ["HandleInComingCall", "RetryRejectedCall", "MessagePending"]
+
+    def HandleInComingCall(self, call_type, task_caller, tick_count, interface_info):
+        return SERVERCALL_ISHANDLED
+
+    def RetryRejectedCall(self, task_callee, tick_count, reject_type):
+        return com_retry_delay(tick_count, reject_type)
+
+    def MessagePending(self, task_callee, tick_count, pending_type):
+        return PENDINGMSG_WAITDEFPROCESS
+
+
+_message_filter_state: Dict[str, Any] = {"registered": 0, "error": None}
+
+
+def register_message_filter():
+    """在当前COM线程（STA）上注册 OutlookMessageFilter；注册失败时该线程上被拒绝的调用不会自动重试，
+    原因写入stderr并显示在 get_server_status 中"""
+    try:
+        import pythoncom
+        from win32com.server.util import wrap
+        pythoncom.CoRegisterMessageFilter(wrap(OutlookMessageFilter(), IID_IMESSAGE_FILTER))
+    except Exception as e:
+        if _message_filter_state["error"] is None:
+            print(f"注册COM消息过滤器出错（Outlook繁忙时被拒绝的调用不会自动重试）: {str(e)}", file=sys.stderr)
+        _message_filter_state["error"] = str(e) or type(e).__name__
+        return
+    _message_filter_state["registered"] += 1
+
+
+def describe_message_filter() -> str:
+    if _message_filter_state["error"]:
+        registered = _message_filter_state["registered"]
+        return (f"注册失败（{_message_filter_state['error']}），被拒绝的调用不会自动重试"
+                + (f"；另有{registered}个COM线程注册成功" if registered else ""))
+    if _message_filter_state["registered"]:
+        return f"已在{_message_filter_state['registered']}个COM线程上注册"
+    return "未注册（尚未启动COM线程或pywin32不可用）"
+
+
+class CircuitBreaker:
+    """Outlook连续 threshold 次调用失败（重试耗尽或无法连接）后断开：冷却期内需要Outlook的工具立即返回错误，
+    而不是让每个调用都排队等待重试超时；冷却结束后放行一次试探调用，成功则恢复，失败则再次断开"""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.trips = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            if self.opened_at is None:
+                return "正常"
+            return "试探中" if self.probing else "已熔断"
+
+    def allow(self) -> Optional[float]:
+        """允许调用时返回None，否则返回距离下次试探的秒数"""
+        with self.lock:
+            if self.opened_at is None:
+                return None
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining <= 0 and not self.probing:
+                self.probing = True
+                return None
+            self.rejected += 1
+            return max(0.0, remaining)
+
+    def record(self, health: ComHealth):
+        with self.lock:
+            if not health.failed:
+                if self.opened_at is None or self.probing:
+                    self.failures = 0
+                    self.opened_at = None
+                    self.probing = False
+                return
+            self.failures += 1
+            self.last_error = health.failure or f"{health.gave_up}次调用重试耗尽"
+            if self.probing or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self.probing = False
+                self.trips += 1
+
+    def describe_open(self, remaining: float) -> str:
+        return (f"错误：Outlook暂时无响应，已熔断（连续{self.failures}次调用失败，最近：{self.last_error}）；"
+                f"约{remaining:.0f}秒后自动重试")
+
+
+_breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+
+# ===== 启动预热 =====
+# 未通过 start_background_warmup() 启动预热时（如作为模块导入）视为已就绪
+_startup_ready = threading.Event()
+_startup_ready.set()
+_startup_state: Dict[str, Any] = {"phase": "未启动", "timings": {}, "error": None}
+# 不需要等待Outlook连接即可回答的工具
+STARTUP_EXEMPT_TOOLS = {"get_server_status", "get_tool_metrics", "configure_metrics",
+                        "configure_profiling", "list_slow_profiles", "configure_item_cache",
+                        "get_query_cache_stats", "subscribe_new_mail", "unsubscribe_new_mail",
+                        "list_new_mail_subscriptions"}
+
+
+def start_com_thread(target, name: str) -> threading.Thread:
+    """在后台守护线程中运行需要访问COM的任务（线程内初始化COM套间）"""
+    def runner():
+        try:
+            import pythoncom
+            pythoncom.CoInitialize()
+            register_message_filter()
+        except ImportError:
+            pythoncom = None
+        try:
+            target()
+        finally:
+            if pythoncom:
+                pythoncom.CoUninitialize()
+
+    thread = threading.Thread(target=runner, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def warm_up_outlook():
+    """后台预热：导入win32com、连接Outlook、打开默认文件夹并加载结果集，记录各阶段耗时"""
+    timings = _startup_state["timings"]
+    started = time.perf_counter()
+
+    def phase(name, label, fn):
+        _startup_state["phase"] = label
+        t0 = time.perf_counter()
+        value = fn()
+        timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+        return value
 
-def connect_to_outlook():
-    """连接到Outlook应用程序"""
     try:
-        outlook = win32com.client.Dispatch("Outlook.Application")
-        namespace = outlook.GetNamespace("MAPI")
-        return outlook, namespace
+        phase("import_win32com", "导入win32com", lambda: __import__("win32com.client"))
+        _, namespace = phase("connect_outlook", "连接Outlook", connect_to_outlook)
+
+        def open_default_folders():
+            for folder_id in (6, 5, 16, 3, 18):
+                try:
+                    namespace.GetDefaultFolder(folder_id).Name
+                except Exception:
+                    continue
+        phase("default_folders", "打开默认文件夹", open_default_folders)
+        _startup_state["inbox_count"] = phase(
+            "inbox_count", "统计收件箱", lambda: namespace.GetDefaultFolder(6).Items.Count)
+
+        default_sets = get_session(DEFAULT_SESSION).result_sets
+        phase("load_cache", "加载结果集", default_sets.load)
+        _startup_state["cached_emails"] = sum(len(r["emails"]) for r in list(default_sets.sets.values()))
+        phase("send_queue", "恢复发件队列", get_send_queue)
+        phase("events", "订阅Outlook事件", _event_hub.ensure_started)
+        _startup_state["phase"] = "就绪"
+        print(f"Outlook预热完成，收件箱有 {_startup_state['inbox_count']} 封邮件", file=sys.stderr)
     except Exception as e:
-        raise Exception(f"连接Outlook失败：{str(e)}")
+        _startup_state["phase"] = "预热失败"
+        _startup_state["error"] = str(e)
+        print(f"Outlook预热失败：{str(e)}", file=sys.stderr)
+    finally:
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        _startup_ready.set()
+
+
+def start_background_warmup():
+    """立即返回；预热完成前调用的工具会等待预热结束"""
+    _startup_ready.clear()
+    _startup_state.update(phase="预热中", started_at=datetime.datetime.now(), error=None)
+    start_com_thread(warm_up_outlook, "outlook-warmup")
 
 def get_folder_by_name(namespace, folder_name: str):
-    """根据名称获取特定的Outlook文件夹，如果不存在则创建"""
+    """根据名称获取特定的Outlook文件夹，如果不存在则创建。
+    也接受 "存储名:文件夹/子文件夹" 或 "\\\\存储名\\文件夹" 形式的带存储路径（不会创建）；
+    只给出名称时依次查找默认文件夹、收件箱子文件夹，再按广度优先搜索各存储的所有层级"""
     try:
+        store_path = split_store_path(folder_name)
+        if store_path is not None:
+            store = find_store(namespace, store_path[0])
+            if store is not None:
+                return resolve_store_folder(store, store_path[1])
+
         # 检查默认文件夹
         default_folders = {
             "收件箱": 6, "已发送邮件": 5, "草稿": 16, 
@@ -78,12 +1141,10 @@ def get_folder_by_name(namespace, folder_name: str):
         for folder in inbox.Folders:
             if folder.Name.lower() == folder_name.lower():
                 return folder
-        for folder in namespace.Folders:
-            if folder.Name.lower() == folder_name.lower():
-                return folder
-            for subfolder in folder.Folders:
-                if subfolder.Name.lower() == folder_name.lower():
-                    return subfolder
+        for store in list_mail_stores(namespace):
+            found = find_folder_in_store(store, folder_name)
+            if found is not None:
+                return found
         
         # 如果找不到，在收件箱下创建新文件夹
         try:
@@ -133,16 +1194,1417 @@ def get_emails_from_folder(folder, days: int, search_term: Optional[str] = None)
     folder_items = folder.Items
     folder_items.Sort("[ReceivedTime]", True)
 
-    for item in folder_items:
+    for item in folder_items:
+        try:
+            if hasattr(item, "ReceivedTime") and item.ReceivedTime:
+                if item.ReceivedTime.replace(tzinfo=None) < threshold_date:
+                    continue
+                email_data = format_email(item)
+                emails_list.append(email_data)
+        except Exception as e:
+            note_skipped(e)
+            continue
+    return emails_list
+
+# ===== 邮箱元数据索引 =====
+INDEX_TABLE_CHUNK = 500
+PR_HAS_ATTACH = "http://schemas.microsoft.com/mapi/proptag/0x0E1B000B"
+# PR_BODY 在表中只返回前255个字符
+PR_BODY_PREVIEW = "http://schemas.microsoft.com/mapi/proptag/0x1000001F"
+INDEX_COLUMNS = ("EntryID", "Subject", "SenderName", "SenderEmailAddress", "ReceivedTime",
+                 "UnRead", "Importance", "Categories", "Size", "MessageClass", PR_HAS_ATTACH)
+# 文件夹EntryID -> {"name", "path", "store_id", "token", "rows", "built_at"}
+_mailbox_index: Dict[str, Dict[str, Any]] = {}
+_mailbox_index_lock = threading.Lock()
+
+
+def outlook_date_literal(dt: datetime.datetime) -> str:
+    """格式化为 Restrict / GetTable 过滤条件可用的日期字符串"""
+    return dt.strftime("%m/%d/%Y %I:%M %p")
+
+
+def iter_mail_folders(root):
+    """深度优先遍历root及其所有子文件夹中的邮件文件夹（DefaultItemType为olMailItem）"""
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            if folder.DefaultItemType == 0:
+                yield folder
+            stack.extend(reversed([subfolder for subfolder in folder.Folders]))
+        except Exception as e:
+            note_skipped(e)
+            continue
+
+
+def folder_change_token(folder):
+    """文件夹内容的变化标记：(邮件数, 最近修改时间)，用于判断缓存是否失效"""
+    items = folder.Items
+    count = items.Count
+    if not count:
+        return (0, None)
+    items.Sort("[LastModificationTime]", True)
+    newest = items.GetFirst()
+    return (count, str(newest.LastModificationTime) if newest is not None else None)
+
+
+def read_folder_table(folder, columns, filter_text: str = "", sort: Optional[str] = None, descending: bool = False):
+    """通过 Folder.GetTable 按列批量读取条目属性，每批一次COM调用，不打开条目本身"""
+    table = folder.GetTable(filter_text, 0)  # 0 = olUserItems
+    if sort:
+        table.Sort(sort, descending)
+    table.Columns.RemoveAll()
+    for column in columns:
+        table.Columns.Add(column)
+    while not table.EndOfTable:
+        rows = table.GetArray(INDEX_TABLE_CHUNK)
+        if not rows:
+            break
+        for row in rows:
+            yield row
+
+
+def index_row(values, folder_id: str, store_id: str) -> Dict[str, Any]:
+    entry_id, subject, sender, sender_email, received, unread, importance, categories, size, message_class, has_attach = values
+    return {
+        "entry_id": entry_id,
+        "store_id": store_id,
+        "folder_id": folder_id,
+        "subject": subject or "",
+        "sender": sender or "",
+        "sender_email": sender_email or "",
+        "received": received.replace(tzinfo=None) if received else None,
+        "unread": bool(unread),
+        "importance": importance if importance is not None else 1,
+        "categories": categories or "",
+        "size": size or 0,
+        "message_class": message_class or "",
+        "has_attachments": bool(has_attach),
+    }
+
+
+def index_row_email(row: Dict[str, Any], path: str) -> Dict[str, Any]:
+    """索引行 -> 结果集中的邮件条目"""
+    return {
+        "id": row["entry_id"], "store_id": row["store_id"], "folder": path, "subject": row["subject"],
+        "sender": row["sender"], "sender_email": row["sender_email"],
+        "received_time": row["received"].strftime("%Y-%m-%d %H:%M:%S") if row["received"] else None,
+        "unread": row["unread"], "has_attachments": row["has_attachments"],
+        "importance": row["importance"], "categories": row["categories"], "size": row["size"],
+    }
+
+
+def read_index_rows(folder, folder_id: str) -> Tuple[List[Dict[str, Any]], bool]:
+    """读取文件夹的元数据行，返回 (行, 是否完整)；读取失败的行计入本次调用跳过的条目"""
+    store_id = folder.StoreID
+    rows = []
+    complete = True
+    for values in read_folder_table(folder, INDEX_COLUMNS):
+        try:
+            rows.append(index_row(values, folder_id, store_id))
+        except Exception as e:
+            note_skipped(e)
+            complete = False
+    return rows, complete
+
+
+def get_folder_index(folder) -> Dict[str, Any]:
+    """返回文件夹的元数据索引；文件夹内容未变化时直接复用"""
+    folder_id = folder.EntryID
+    token = folder_change_token(folder)
+    with _mailbox_index_lock:
+        cached = _mailbox_index.get(folder_id)
+    if cached and cached["token"] == token:
+        return cached
+
+    rows, complete = read_index_rows(folder, folder_id)
+    entry = {
+        "name": folder.Name,
+        "path": folder.FolderPath,
+        "store_id": folder.StoreID,
+        "token": token,
+        "rows": rows,
+        "built_at": datetime.datetime.now(),
+    }
+    # 跳过了条目的不完整索引不保存，下次重新读取
+    if complete:
+        with _mailbox_index_lock:
+            _mailbox_index[folder_id] = entry
+    return entry
+
+
+def get_mailbox_index(root) -> List[Dict[str, Any]]:
+    """返回root下所有邮件文件夹的元数据索引"""
+    return [get_folder_index(folder) for folder in iter_mail_folders(root)]
+
+
+def invalidate_folder_index(folder_id: Optional[str] = None):
+    with _mailbox_index_lock:
+        if folder_id is None:
+            _mailbox_index.clear()
+        else:
+            _mailbox_index.pop(folder_id, None)
+
+# ===== 多存储 =====
+# Store.ExchangeStoreType（OlExchangeStoreType）
+STORE_TYPE_LABELS = {0: "主邮箱", 1: "委托邮箱", 2: "公用文件夹", 3: "数据文件（PST/OST）", 4: "附加邮箱"}
+ALL_STORES_NAMES = ("all", "全部", "allstores", "所有存储")
+DEFAULT_FOLDER_IDS = {"收件箱": 6, "inbox": 6, "已发送邮件": 5, "sent items": 5, "草稿": 16, "drafts": 16,
+                      "已删除邮件": 3, "deleted items": 3, "垃圾邮件": 18, "junk email": 18}
+STORE_PATH_PATTERN = re.compile(r"^([^:\\/]+):(.*)$")
+
+
+def list_mail_stores(namespace) -> list:
+    """当前配置文件中的所有存储（主邮箱、共享邮箱、存档、PST），默认存储排在最前"""
+    try:
+        stores = [store for store in namespace.Stores]
+    except Exception:
+        return [namespace.DefaultStore]
+    try:
+        default_id = namespace.DefaultStore.StoreID
+        stores.sort(key=lambda store: store.StoreID != default_id)
+    except Exception:
+        pass
+    return stores
+
+
+def find_store(namespace, key: str):
+    """按显示名称（不区分大小写）或StoreID查找存储"""
+    wanted = key.strip().casefold()
+    for store in list_mail_stores(namespace):
+        if store.StoreID == key or store.DisplayName.casefold() == wanted:
+            return store
+    return None
+
+
+def select_stores(namespace, stores: Optional[str]) -> list:
+    """逗号分隔的存储名称 -> 存储列表；空或 "all"/"所有存储" 为全部存储"""
+    if not stores or stores.strip().lower() in ALL_STORES_NAMES:
+        return list_mail_stores(namespace)
+    selected = []
+    for name in (n.strip() for n in re.split(r"[,，]", stores) if n.strip()):
+        store = find_store(namespace, name)
+        if store is None:
+            raise ValueError(f"找不到存储：{name}")
+        selected.append(store)
+    return selected
+
+
+def split_store_path(path: str) -> Optional[Tuple[str, List[str]]]:
+    """"存储名:文件夹/子文件夹" 或 Outlook的FolderPath "\\\\存储名\\文件夹\\子文件夹" -> (存储名, 路径各级)；
+    不是带存储的路径时返回None"""
+    if path.startswith("\\\\"):
+        parts = [part for part in path[2:].split("\\") if part]
+        return (parts[0], parts[1:]) if parts else None
+    match = STORE_PATH_PATTERN.match(path)
+    if match:
+        return match.group(1).strip(), [part.strip() for part in re.split(r"[\\/]", match.group(2)) if part.strip()]
+    return None
+
+
+def resolve_store_folder(store, segments: List[str]):
+    """在存储内按路径逐级定位文件夹，找不到时返回None；第一级可用默认文件夹名称（如 收件箱、Inbox）"""
+    folder = store.GetRootFolder()
+    for depth, segment in enumerate(segments):
+        wanted = segment.casefold()
+        match = next((f for f in folder.Folders if f.Name.casefold() == wanted), None)
+        if match is None and depth == 0 and wanted in DEFAULT_FOLDER_IDS:
+            try:
+                match = store.GetDefaultFolder(DEFAULT_FOLDER_IDS[wanted])
+            except Exception:
+                match = None
+        if match is None:
+            return None
+        folder = match
+    return folder
+
+
+def find_folder_in_store(store, folder_name: str):
+    """广度优先在存储的所有层级中按名称查找文件夹（浅层优先）"""
+    wanted = folder_name.casefold()
+    queue = deque([store.GetRootFolder()])
+    while queue:
+        try:
+            subfolders = [subfolder for subfolder in queue.popleft().Folders]
+        except Exception as e:
+            note_skipped(e)
+            continue
+        for subfolder in subfolders:
+            if subfolder.Name.casefold() == wanted:
+                return subfolder
+        queue.extend(subfolders)
+    return None
+
+
+def check_deadline(deadline: Optional[float]):
+    if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError("超过存储扫描时限")
+
+
+def store_labels(stores) -> List[str]:
+    """存储的显示名称；重名的存储附上文件路径（或序号）以便区分"""
+    names = [store.DisplayName for store in stores]
+    paths = [getattr(store, "FilePath", "") or "" for store in stores]
+    labels = []
+    for i, (name, path) in enumerate(zip(names, paths)):
+        if names.count(name) > 1:
+            name = f"{name}（{path}）" if path and paths.count(path) == 1 else f"{name} #{names[:i + 1].count(name)}"
+        labels.append(name)
+    return labels
+
+
+def scan_stores(stores, task, timeout: Optional[float] = None):
+    """并发扫描多个存储：每个存储在独立的COM线程中重新连接Outlook，执行 task(namespace, store, deadline)。
+    超过时限仍未完成的存储不再等待（task 应在文件夹之间调用 check_deadline 尽快退出），其结果被丢弃。
+    返回 ([(存储名, 结果)]（按传入顺序）, {存储名: 失败或超时原因})；同名的存储在名称后附上文件路径以示区分"""
+    timeout = STORE_TIMEOUT if timeout is None else timeout
+    targets = list(zip(store_labels(stores), (store.StoreID for store in stores)))
+    deadline = time.monotonic() + timeout
+    # 按StoreID记录结果：PST的默认显示名称（如 "Outlook Data File"）经常重复
+    outcomes: Dict[str, Tuple[bool, Any]] = {}
+    finished = threading.Condition()
+
+    for name, store_id in targets:
+        # 扫描线程沿用调用方的上下文，跳过的条目计入本次工具调用
+        context = contextvars.copy_context()
+
+        def run(name=name, store_id=store_id, context=context):
+            try:
+                _, namespace = context.run(connect_to_outlook)
+                store = find_store(namespace, store_id)
+                if store is None:
+                    raise Exception("存储已不可用")
+                outcome = (True, context.run(task, namespace, store, deadline))
+            except Exception as e:
+                outcome = (False, str(e))
+            with finished:
+                outcomes[store_id] = outcome
+                finished.notify_all()
+        start_com_thread(run, f"store-scan-{name}")
+
+    with finished:
+        while len(outcomes) < len(targets):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            finished.wait(remaining)
+        done = dict(outcomes)
+    results, failures = [], {}
+    for name, store_id in targets:
+        if store_id not in done:
+            failures[name] = f"超时（{timeout:g} 秒）"
+        elif done[store_id][0]:
+            results.append((name, done[store_id][1]))
+        else:
+            failures[name] = done[store_id][1]
+    return results, failures
+
+
+def describe_store_failures(failures: Dict[str, str]) -> str:
+    if not failures:
+        return ""
+    return "⚠️ 以下存储未纳入结果：" + "；".join(f"{name}：{reason}" for name, reason in failures.items()) + "\n"
+
+
+# ===== 发件队列 =====
+class SendQueue:
+    """持久化的发件队列：每封邮件一个JSON文件，后台工作线程按速率限制发送并在失败时退避重试"""
+
+    def __init__(self, spool_dir: str):
+        self.spool_dir = spool_dir
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.condition = threading.Condition()
+        self.workers: List[threading.Thread] = []
+        self.next_slot = 0.0
+        self.loaded = False
+
+    def _path(self, queue_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{queue_id}.json")
+
+    def _persist(self, message: Dict[str, Any]):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        tmp_path = self._path(message["id"]) + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(message, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(message["id"]))
+
+    def load(self):
+        """加载磁盘上的队列；上次退出时正在发送的邮件重新排队"""
+        with self.condition:
+            if self.loaded:
+                return
+            self.loaded = True
+            if not os.path.isdir(self.spool_dir):
+                return
+            for file in os.listdir(self.spool_dir):
+                if not file.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(self.spool_dir, file), 'r', encoding='utf-8') as f:
+                        message = json.load(f)
+                except Exception:
+                    continue
+                if message.get("status") == "sending":
+                    message["status"] = "queued"
+                self.messages[message["id"]] = message
+        if self.pending_count():
+            self.ensure_workers()
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], summary: str) -> str:
+        self.load()
+        queue_id = f"Q{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        message = {
+            "id": queue_id,
+            "kind": kind,
+            "payload": payload,
+            "summary": summary,
+            "status": "queued",
+            "attempts": 0,
+            "created_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "next_attempt_at": 0.0,
+            "last_error": None,
+            "sent_at": None,
+        }
+        with self.condition:
+            self._persist(message)
+            self.messages[queue_id] = message
+            self.condition.notify()
+        self.ensure_workers()
+        return queue_id
+
+    def pending_count(self) -> int:
+        return sum(1 for m in self.messages.values() if m["status"] in ("queued", "sending"))
+
+    def ensure_workers(self):
+        with self.condition:
+            self.workers = [w for w in self.workers if w.is_alive()]
+            for i in range(len(self.workers), max(1, SEND_WORKERS)):
+                self.workers.append(start_com_thread(self._worker_loop, f"outlook-sender-{i + 1}"))
+
+    def _take_due(self) -> Optional[Dict[str, Any]]:
+        """取出一封到期的邮件；没有时等待到最近的重试时间"""
+        with self.condition:
+            while True:
+                now = time.time()
+                queued = [m for m in self.messages.values() if m["status"] == "queued"]
+                due = [m for m in queued if m["next_attempt_at"] <= now]
+                if due:
+                    message = min(due, key=lambda m: m["created_at"])
+                    message["status"] = "sending"
+                    return message
+                timeout = min((m["next_attempt_at"] - now for m in queued), default=30.0)
+                self.condition.wait(max(0.05, min(timeout, 30.0)))
+
+    def _wait_for_rate_slot(self):
+        if SEND_RATE_PER_MINUTE <= 0:
+            return
+        interval = 60.0 / SEND_RATE_PER_MINUTE
+        with self.condition:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _worker_loop(self):
+        outlook = namespace = None
+        while True:
+            message = self._take_due()
+            self._wait_for_rate_slot()
+            try:
+                if outlook is None:
+                    outlook, namespace = connect_to_outlook()
+                self._send(outlook, namespace, message)
+                message["status"] = "sent"
+                message["sent_at"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                message["last_error"] = None
+            except Exception as e:
+                outlook = namespace = None
+                message["attempts"] += 1
+                message["last_error"] = str(e)
+                if message["attempts"] >= SEND_MAX_ATTEMPTS:
+                    message["status"] = "failed"
+                else:
+                    delay = min(SEND_RETRY_BASE * 2 ** (message["attempts"] - 1), SEND_RETRY_MAX)
+                    message["status"] = "queued"
+                    message["next_attempt_at"] = time.time() + delay * random.uniform(0.8, 1.2)
+            with self.condition:
+                try:
+                    self._persist(message)
+                except Exception as e:
+                    print(f"保存发件队列状态出错: {str(e)}", file=sys.stderr)
+
+    @staticmethod
+    def _send(outlook, namespace, message: Dict[str, Any]):
+        payload = message["payload"]
+        if message["kind"] == "reply":
+            original = open_email(namespace, {"id": payload["entry_id"], "store_id": payload.get("store_id")})
+            mail = original.ReplyAll() if payload.get("reply_all") else original.Reply()
+            mail.Body = payload["body"] + "\n\n" + mail.Body
+        else:
+            mail = outlook.CreateItem(0)
+            mail.To = payload["to"]
+            mail.Subject = payload["subject"]
+            mail.Body = payload["body"]
+            if payload.get("cc"):
+                mail.CC = payload["cc"]
+            if payload.get("bcc"):
+                mail.BCC = payload["bcc"]
+        mail.Send()
+
+    def retry(self, queue_ids: Optional[List[str]] = None) -> int:
+        self.load()
+        count = 0
+        with self.condition:
+            for message in self.messages.values():
+                if message["status"] == "failed" and (not queue_ids or message["id"] in queue_ids):
+                    message.update(status="queued", attempts=0, next_attempt_at=0.0)
+                    self._persist(message)
+                    count += 1
+            self.condition.notify_all()
+        if count:
+            self.ensure_workers()
+        return count
+
+    def purge_sent(self) -> int:
+        with self.condition:
+            sent = [m["id"] for m in self.messages.values() if m["status"] == "sent"]
+            for queue_id in sent:
+                del self.messages[queue_id]
+                try:
+                    os.remove(self._path(queue_id))
+                except OSError:
+                    pass
+        return len(sent)
+
+
+_send_queue: Optional[SendQueue] = None
+
+
+def get_send_queue() -> SendQueue:
+    global _send_queue
+    if _send_queue is None or _send_queue.spool_dir != SPOOL_DIR:
+        _send_queue = SendQueue(SPOOL_DIR)
+        _send_queue.load()
+    return _send_queue
+
+
+def queue_new_mail(to: str, subject: str, body: str, cc: Optional[str] = None,
+                   bcc: Optional[str] = None) -> str:
+    payload = {"to": to, "subject": subject, "body": body, "cc": cc, "bcc": bcc}
+    return get_send_queue().enqueue("new", payload, f"{subject} → {to}")
+
+# ===== Outlook事件 =====
+class ItemsEventHandler:
+    """Folder.Items 的事件接收器；folder_id 与 hub 由 ItemEventHub.watch 生成的子类提供"""
+    folder_id: Optional[str] = None
+    hub: Any = None
+
+    def OnItemAdd(self, item):
+        self.hub.publish("add", self.folder_id, item)
+
+    def OnItemChange(self, item):
+        self.hub.publish("change", self.folder_id, item)
+
+    def OnItemRemove(self):
+        self.hub.publish("remove", self.folder_id, None)
+
+
+class ApplicationEventHandler:
+    """Application 的事件接收器：NewMailEx 一次送达一批新邮件的EntryID（逗号分隔）"""
+    hub: Any = None
+
+    def OnNewMailEx(self, entry_ids):
+        for entry_id in (entry_ids or "").split(","):
+            if entry_id.strip():
+                self.hub.dispatch("new_mail", None, entry_id.strip())
+
+
+class ItemEventHub:
+    """在专用线程上订阅默认邮箱各邮件文件夹的 ItemAdd/ItemChange/ItemRemove 事件以及 Application.NewMailEx，
+    分发给监听者。监听者签名为 listener(kind, folder_id, entry_id)，kind 为 add/change/remove/new_mail
+    （remove 不带 entry_id，new_mail 不带 folder_id）"""
+
+    def __init__(self):
+        self.listeners: List[Any] = []
+        self.sinks: Dict[str, Any] = {}
+        self.app_sink: Any = None
+        self.counts = {"add": 0, "change": 0, "remove": 0, "new_mail": 0}
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self.ready.is_set() and self.error is None
+
+    def subscribe(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+    def publish(self, kind: str, folder_id: Optional[str], item):
+        entry_id = None
+        if item is not None:
+            try:
+                entry_id = item.EntryID
+            except Exception:
+                entry_id = None
+        self.dispatch(kind, folder_id, entry_id)
+
+    def dispatch(self, kind: str, folder_id: Optional[str], entry_id: Optional[str]):
+        self.counts[kind] += 1
+        for listener in list(self.listeners):
+            try:
+                listener(kind, folder_id, entry_id)
+            except Exception as e:
+                print(f"处理Outlook事件出错: {str(e)}", file=sys.stderr)
+
+    def ensure_started(self, timeout: float = 10.0) -> bool:
+        """按需启动订阅线程；返回事件是否可用（不可用时依赖事件失效的缓存应直接绕过）"""
+        if not EVENTS_ENABLED:
+            return False
+        with self.lock:
+            if self.thread is None:
+                self.thread = start_com_thread(self._run, "outlook-events")
+        self.ready.wait(timeout)
+        return self.running
+
+    def watch(self, folder):
+        import win32com.client
+        folder_id = folder.EntryID
+        if folder_id in self.sinks:
+            return
+        handler = type("FolderItemsEvents", (ItemsEventHandler,), {"folder_id": folder_id, "hub": self})
+        self.sinks[folder_id] = win32com.client.DispatchWithEvents(folder.Items, handler)
+
+    def watch_application(self, outlook):
+        """订阅 NewMailEx：覆盖投递到各存储收件箱的新邮件，包括没有逐个订阅 ItemAdd 的文件夹"""
+        import win32com.client
+        handler = type("ApplicationEvents", (ApplicationEventHandler,), {"hub": self})
+        try:
+            self.app_sink = win32com.client.DispatchWithEvents(outlook, handler)
+        except Exception as e:
+            print(f"订阅NewMailEx失败：{str(e)}", file=sys.stderr)
+
+    def _run(self):
+        try:
+            import pythoncom
+        except ImportError:
+            pythoncom = None
+        try:
+            outlook, namespace = connect_to_outlook()
+            for count, folder in enumerate(iter_mail_folders(namespace.DefaultStore.GetRootFolder())):
+                if count >= EVENT_WATCH_LIMIT:
+                    break
+                self.watch(folder)
+            self.watch_application(outlook)
+        except Exception as e:
+            self.error = str(e)
+            print(f"订阅Outlook事件失败：{str(e)}", file=sys.stderr)
+            return
+        finally:
+            self.ready.set()
+        # 事件通过本线程的消息循环送达
+        while True:
+            if pythoncom is not None:
+                pythoncom.PumpWaitingMessages()
+            time.sleep(0.05)
+
+
+_event_hub = ItemEventHub()
+
+# ===== 邮件条目缓存 =====
+class ItemCache:
+    """按EntryID缓存已打开邮件的元数据与正文，按字节预算做LRU淘汰；由Outlook事件保证失效"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.sizes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        # 失效计数：读取邮件前取一次，写入时若期间有过失效则丢弃，避免读取途中的变化留下旧数据
+        self.cleared = 0
+        self.changed: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def version(self, entry_id: str) -> Tuple[int, int]:
+        with self.lock:
+            return self.cleared, self.changed.get(entry_id, 0)
+
+    def get(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            data = self.entries.get(entry_id)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(entry_id)
+            self.hits += 1
+            return data
+
+    def put(self, entry_id: str, data: Dict[str, Any], version: Optional[Tuple[int, int]] = None):
+        size = estimate_item_bytes(data)
+        with self.lock:
+            if size > self.max_bytes:
+                return
+            if version is not None and version != (self.cleared, self.changed.get(entry_id, 0)):
+                return
+            self._drop(entry_id)
+            self.entries[entry_id] = data
+            self.sizes[entry_id] = size
+            self.total_bytes += size
+            self._evict()
+
+    def resize(self, max_bytes: int):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _drop(self, entry_id: str):
+        if entry_id in self.entries:
+            del self.entries[entry_id]
+            self.total_bytes -= self.sizes.pop(entry_id)
+
+    def invalidate(self, entry_id: Optional[str] = None, folder_id: Optional[str] = None):
+        with self.lock:
+            if entry_id is not None:
+                self._drop(entry_id)
+                self.changed[entry_id] = self.changed.get(entry_id, 0) + 1
+                return
+            self.cleared += 1
+            if folder_id is not None:
+                for key in [k for k, v in self.entries.items() if v.get("folder_id") == folder_id]:
+                    self._drop(key)
+            else:
+                self.entries.clear()
+                self.sizes.clear()
+                self.total_bytes = 0
+
+    def on_event(self, kind: str, folder_id: Optional[str], entry_id: Optional[str]):
+        if kind == "change" and entry_id:
+            self.invalidate(entry_id)
+        elif kind == "remove":
+            # ItemRemove 不告诉是哪封邮件，只能丢弃该文件夹的全部缓存
+            self.invalidate(folder_id=folder_id)
+
+
+def estimate_item_bytes(data: Dict[str, Any]) -> int:
+    text = sum(len(v) for v in data.values() if isinstance(v, str))
+    text += sum(len(a) for a in data.get("attachments", []))
+    text += len(data.get("normalized", {}).get("text", ""))
+    return 2 * text + 256
+
+
+# ===== 正文规整 =====
+QUOTE_MARKERS = [re.compile(p, re.IGNORECASE) for p in (
+    r"^-{2,}\s*(原始邮件|原邮件|转发的邮件|Original Message|Forwarded message)\s*-{2,}",
+    r"^_{10,}\s*$",
+    r"^(发件人|From)\s*[:：].+",
+    r"^On .{5,200} wrote:\s*$",
+    r"^在 ?.{5,100}写道[:：]\s*$",
+    r"^>",
+)]
+# "发件人/From:" 只有后面紧跟 发送时间/Sent/Date 等邮件头时才算引用开始
+QUOTE_HEADER_FOLLOWERS = re.compile(r"^(发送时间|发送日期|时间|日期|Sent|Date|收件人|To)\s*[:：]", re.IGNORECASE)
+SIGNATURE_MARKERS = re.compile(
+    r"^(--\s*|—{2,}\s*|Best regards,?|Kind regards,?|Regards,?|Best,|Thanks,?|Thank you,?|Cheers,?|Sincerely,?|"
+    r"此致|敬礼[!！]?|祝好[!！。]?|顺祝商祺[!！。]?|谢谢[!！。]?|Sent from my .+|发自我的.+)\s*$",
+    re.IGNORECASE)
+FOOTER_MARKERS = re.compile(
+    r"(CONFIDENTIALITY NOTICE|DISCLAIMER|This (e-?mail|message)( and any attachments?)? (is|are|may contain) "
+    r"(confidential|intended)|免责声明|保密声明|本邮件(及其附件)?(含有|包含|可能包含).{0,20}(保密|机密)|"
+    r"此邮件(及其附件)?(含有|包含|可能包含).{0,20}(保密|机密)|如果您不是(本邮件的)?(指定|预期)?收件人)",
+    re.IGNORECASE)
+SIGNATURE_TAIL_LINES = 12
+
+
+class HtmlTextExtractor(HTMLParser):
+    """把HTMLBody转为紧凑的纯文本：跳过script/style，块级标签换行"""
+    BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style", "head"):
+            self.skip += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style", "head"):
+            self.skip = max(0, self.skip - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skip:
+            self.parts.append(data)
+
+
+def html_to_text(html_body: str) -> str:
+    parser = HtmlTextExtractor()
+    try:
+        parser.feed(html_body)
+        parser.close()
+    except Exception:
+        return html.unescape(re.sub(r"<[^>]+>", " ", html_body))
+    return "".join(parser.parts)
+
+
+def body_is_poor(body: str) -> bool:
+    """纯文本正文缺失或几乎为空时改用HTMLBody"""
+    return len(body.strip()) < 20
+
+
+def find_quote_start(lines: List[str]) -> Optional[int]:
+    for i, line in enumerate(lines):
+        text = line.strip()
+        if not text:
+            continue
+        for marker in QUOTE_MARKERS:
+            if not marker.match(text):
+                continue
+            if marker.pattern.startswith("^(发件人|From)"):
+                following = [l.strip() for l in lines[i + 1:i + 4] if l.strip()]
+                if not any(QUOTE_HEADER_FOLLOWERS.match(l) for l in following):
+                    continue
+            return i
+    return None
+
+
+def normalize_body(body: str, html_body: Optional[str] = None) -> Dict[str, Any]:
+    """规整邮件正文：必要时由HTMLBody转换，去掉引用的历史邮件、签名与法律声明，压缩空行。
+    返回 {"text", "source", "original_chars", "quoted_chars", "signature_chars", "footer_chars"}"""
+    source = "text"
+    if body_is_poor(body or "") and html_body:
+        body, source = html_to_text(html_body), "html"
+    text = (body or "").replace("\r\n", "\n").replace("\r", "\n")
+    original_chars = len(text)
+    lines = [line.rstrip() for line in text.split("\n")]
+
+    quoted_chars = 0
+    quote_start = find_quote_start(lines)
+    if quote_start is not None and quote_start > 0:
+        quoted_chars = sum(len(l) + 1 for l in lines[quote_start:])
+        lines = lines[:quote_start]
+
+    footer_chars = 0
+    for i, line in enumerate(lines):
+        if i >= len(lines) // 3 and FOOTER_MARKERS.search(line):
+            footer_chars = sum(len(l) + 1 for l in lines[i:])
+            lines = lines[:i]
+            break
+
+    signature_chars = 0
+    tail_start = max(1, len(lines) - SIGNATURE_TAIL_LINES)
+    for i in range(tail_start, len(lines)):
+        if SIGNATURE_MARKERS.match(lines[i].strip()):
+            signature_chars = sum(len(l) + 1 for l in lines[i:])
+            lines = lines[:i]
+            break
+
+    cleaned = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+    return {
+        "text": cleaned,
+        "source": source,
+        "original_chars": original_chars,
+        "quoted_chars": quoted_chars,
+        "signature_chars": signature_chars,
+        "footer_chars": footer_chars,
+    }
+
+
+def truncate_text(text: str, max_chars: Optional[int]) -> str:
+    if not max_chars or len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    if cut < max_chars * 0.6:
+        cut = max_chars
+    return text[:cut].rstrip() + f"\n…[已截断，正文共{len(text)}字]"
+
+
+def describe_normalization(normalized: Dict[str, Any]) -> str:
+    removed = []
+    if normalized["quoted_chars"]:
+        removed.append(f"引用的历史邮件{normalized['quoted_chars']}字")
+    if normalized["signature_chars"]:
+        removed.append(f"签名{normalized['signature_chars']}字")
+    if normalized["footer_chars"]:
+        removed.append(f"免责声明{normalized['footer_chars']}字")
+    notes = []
+    if normalized["source"] == "html":
+        notes.append("正文由HTML转换")
+    if removed:
+        notes.append("已省略" + "、".join(removed))
+    return "；".join(notes)
+
+
+def read_item_data(item, store_id: Optional[str] = None) -> Dict[str, Any]:
+    """一次性读取详情与分析工具需要的邮件属性"""
+    attachments = []
+    try:
+        item_attachments = item.Attachments
+        for i in range(1, item_attachments.Count + 1):
+            try:
+                attachments.append(item_attachments(i).FileName)
+            except Exception:
+                attachments.append(f"[附件 {i}]")
+    except Exception:
+        pass
+    try:
+        folder_id = item.Parent.EntryID
+    except Exception:
+        folder_id = None
+    received = getattr(item, "ReceivedTime", None)
+    body = getattr(item, "Body", "") or ""
+    html_body = (getattr(item, "HTMLBody", "") or "") if body_is_poor(body) else None
+    return {
+        "id": item.EntryID,
+        "store_id": store_id,
+        "folder_id": folder_id,
+        "subject": getattr(item, "Subject", "") or "",
+        "sender": getattr(item, "SenderName", "") or "",
+        "sender_email": getattr(item, "SenderEmailAddress", "") or "",
+        "received": received.replace(tzinfo=None) if received else None,
+        "body": body,
+        "categories": getattr(item, "Categories", "") or "",
+        "importance": getattr(item, "Importance", 1),
+        "attachments": attachments,
+        "normalized": normalize_body(body, html_body),
+    }
+
+
+_item_cache = ItemCache(ITEM_CACHE_BYTES)
+_event_hub.subscribe(_item_cache.on_event)
+
+
+def remember_item_data(entry_id: str, data: Dict[str, Any], version: Tuple[int, int]):
+    """只缓存所在文件夹订阅了Outlook事件的邮件（其他存储或超出订阅上限的文件夹无法及时失效）"""
+    if data.get("folder_id") in _event_hub.sinks:
+        _item_cache.put(entry_id, data, version)
+
+
+def get_item_data(namespace, email_data: Dict[str, Any]) -> Dict[str, Any]:
+    """读取邮件元数据与正文；Outlook事件可用时优先从缓存返回"""
+    entry_id = email_data["id"]
+    cacheable = _event_hub.ensure_started()
+    if cacheable:
+        cached = _item_cache.get(entry_id)
+        if cached is not None:
+            return cached
+    version = _item_cache.version(entry_id)
+    data = read_item_data(open_item(namespace, email_data), email_data.get("store_id"))
+    if cacheable:
+        remember_item_data(entry_id, data, version)
+    return data
+
+
+class ItemPrefetcher:
+    """列表/搜索之后在后台读取前N封邮件的正文，后续的详情与分析调用直接命中缓存"""
+
+    def __init__(self):
+        self.pending: deque = deque()
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.prefetched = 0
+
+    def schedule(self, emails: List[Dict[str, Any]]):
+        if PREFETCH_COUNT <= 0 or not emails or not EVENTS_ENABLED:
+            return
+        with self.condition:
+            # 新的列表优先：丢弃尚未处理的旧请求
+            self.pending.clear()
+            self.pending.extend({"id": e["id"], "store_id": e.get("store_id")} for e in emails[:PREFETCH_COUNT])
+            self.condition.notify()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = start_com_thread(self._run, "outlook-prefetch")
+
+    def _run(self):
+        namespace = None
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                email_data = self.pending.popleft()
+            # 没有事件就无法保证缓存失效，此时不预读
+            if not _event_hub.ensure_started() or _item_cache.get(email_data["id"]) is not None:
+                continue
+            try:
+                if namespace is None:
+                    _, namespace = connect_to_outlook()
+                version = _item_cache.version(email_data["id"])
+                data = read_item_data(open_item(namespace, email_data), email_data["store_id"])
+                remember_item_data(email_data["id"], data, version)
+                self.prefetched += 1
+            except Exception:
+                namespace = None
+
+
+_prefetcher = ItemPrefetcher()
+
+# ===== 查询结果缓存 =====
+class QueryResultCache:
+    """按 (工具, 规范化的查询, 文件夹) 缓存搜索/列表结果，受TTL与字节预算限制；
+    被查询的文件夹收到 ItemAdd/ItemChange/ItemRemove 事件时，只丢弃涉及该文件夹的条目"""
+
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self.by_folder: Dict[str, set] = {}
+        self.generations: Dict[str, int] = {}
+        self.total_bytes = 0
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+        self.by_tool: Dict[str, List[int]] = {}
+        self.lock = threading.Lock()
+
+    def generation(self, folder_ids: List[str]) -> tuple:
+        with self.lock:
+            return tuple(self.generations.get(f, 0) for f in folder_ids)
+
+    def get(self, key) -> Optional[List[Dict[str, Any]]]:
+        with self.lock:
+            counts = self.by_tool.setdefault(key[0], [0, 0])
+            entry = self.entries.get(key)
+            if entry is not None and entry["expires"] <= time.time():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                counts[1] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            counts[0] += 1
+            return entry["emails"]
+
+    def put(self, key, emails: List[Dict[str, Any]], folder_ids: List[str], generation: tuple):
+        """generation 为计算结果之前各文件夹的失效计数；期间收到过事件则不缓存（结果可能已过时）"""
+        emails = [{k: v for k, v in e.items() if k != "body"} for e in emails]
+        size = sum(len(str(v)) for e in emails for v in e.values()) + 64 * len(emails) + 256
+        with self.lock:
+            if size > self.max_bytes or tuple(self.generations.get(f, 0) for f in folder_ids) != generation:
+                return
+            self._drop(key)
+            self.entries[key] = {"emails": emails, "folders": folder_ids, "bytes": size,
+                                 "expires": time.time() + self.ttl}
+            for folder_id in folder_ids:
+                self.by_folder.setdefault(folder_id, set()).add(key)
+            self.total_bytes += size
+            self._evict()
+
+    def resize(self, max_bytes: int):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry["bytes"]
+        for folder_id in entry["folders"]:
+            keys = self.by_folder.get(folder_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_folder[folder_id]
+
+    def invalidate(self, folder_id: Optional[str] = None):
+        with self.lock:
+            if folder_id is None:
+                for key in list(self.entries):
+                    self._drop(key)
+                for known in list(self.generations):
+                    self.generations[known] += 1
+                return
+            self.generations[folder_id] = self.generations.get(folder_id, 0) + 1
+            keys = self.by_folder.get(folder_id, ())
+            self.invalidations += len(keys)
+            for key in list(keys):
+                self._drop(key)
+
+    def on_event(self, kind: str, folder_id: Optional[str], entry_id: Optional[str]):
+        if folder_id is not None:
+            self.invalidate(folder_id)
+
+
+_query_cache = QueryResultCache(QUERY_CACHE_TTL, QUERY_CACHE_BYTES)
+_event_hub.subscribe(_query_cache.on_event)
+
+
+def cached_query(tool: str, key_parts: tuple, folders, compute) -> List[Dict[str, Any]]:
+    """带缓存地执行查询；只有所有相关文件夹都订阅了Outlook事件时才缓存（否则无法及时失效）"""
+    folder_ids = [folder.EntryID for folder in folders]
+    if (_query_cache.ttl <= 0 or not _event_hub.ensure_started()
+            or not all(folder_id in _event_hub.sinks for folder_id in folder_ids)):
+        return compute()
+    key = (tool, key_parts, tuple(sorted(folder_ids)))
+    emails = _query_cache.get(key)
+    if emails is None:
+        generation = _query_cache.generation(folder_ids)
+        skipped = skipped_count()
+        emails = compute()
+        # 跳过了条目的不完整结果不缓存，以免之后的命中不再提示
+        if skipped_count() == skipped:
+            _query_cache.put(key, emails, folder_ids, generation)
+    return emails
+
+
+def within_days(emails: List[Dict[str, Any]], days: int) -> List[Dict[str, Any]]:
+    """缓存的结果按当前时间重新套用"最近N天"的窗口"""
+    threshold = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    return [e for e in emails if (e.get("received_time") or "") >= threshold]
+
+# ===== 列式邮箱快照 =====
+SNAPSHOT_VERSION = 1
+SNAPSHOT_UNREAD = 1
+SNAPSHOT_ATTACH = 2
+SNAPSHOT_NO_TIME = np.iinfo(np.int64).min
+SNAPSHOT_EPOCH = datetime.datetime(1970, 1, 1)
+# 数值列；主题与EntryID以 偏移+UTF-8字节 存储，分类以 偏移+编码 存储（一封邮件可有多个分类）
+SNAPSHOT_COLUMNS = {
+    "received": np.int64, "flags": np.uint8, "importance": np.int8, "size": np.int64,
+    "sender": np.int32, "folder": np.int32, "cat_offsets": np.int64, "cat_codes": np.int32,
+    "subject_offsets": np.int64, "subject_blob": np.uint8, "id_offsets": np.int64, "id_blob": np.uint8,
+}
+
+
+def to_epoch_seconds(dt: Optional[datetime.datetime]) -> int:
+    """本地时间（无时区）按UTC口径转换为秒数，便于按天/小时整除分桶"""
+    return int((dt - SNAPSHOT_EPOCH).total_seconds()) if dt else SNAPSHOT_NO_TIME
+
+
+def from_epoch_seconds(seconds: int) -> Optional[datetime.datetime]:
+    return None if seconds == SNAPSHOT_NO_TIME else SNAPSHOT_EPOCH + datetime.timedelta(seconds=int(seconds))
+
+
+class StringDictionary:
+    """值到连续整数编码的字典（字典编码列的取值表）"""
+
+    def __init__(self, values=()):
+        self.values: List[Any] = []
+        self.codes: Dict[Any, int] = {}
+        for value in values:
+            self.encode(value)
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def remap(self, values) -> np.ndarray:
+        """旧取值表的编码 -> 本字典编码 的映射数组"""
+        return np.array([self.encode(v) for v in values], dtype=np.int32)
+
+
+class MailboxSnapshot:
+    """列式邮箱快照：每封邮件一行，数值列为NumPy数组（从磁盘加载时为内存映射），
+    发件人/文件夹/分类为字典编码；分析工具在这些数组上做向量化运算，不再逐封构造字典"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], senders: List[Any], categories: List[str],
+                 folders: List[Dict[str, Any]], built_at: str, path: Optional[str] = None):
+        for name in SNAPSHOT_COLUMNS:
+            setattr(self, name, columns[name])
+        self.senders = [tuple(s) for s in senders]
+        self.categories = categories
+        self.folders = folders
+        self.built_at = built_at
+        self.path = path
+        self._sender_names = None
+
+    def __len__(self) -> int:
+        return len(self.received)
+
+    def tokens(self) -> Dict[str, Any]:
+        return {f["id"]: f["token"] for f in self.folders}
+
+    def folder_code(self, folder_id: str) -> Optional[int]:
+        for code, folder in enumerate(self.folders):
+            if folder["id"] == folder_id:
+                return code
+        return None
+
+    def subject(self, row: int) -> str:
+        return bytes(self.subject_blob[self.subject_offsets[row]:self.subject_offsets[row + 1]]).decode("utf-8", "replace")
+
+    def entry_id(self, row: int) -> str:
+        return bytes(self.id_blob[self.id_offsets[row]:self.id_offsets[row + 1]]).decode("ascii", "replace")
+
+    def email(self, row: int) -> Dict[str, Any]:
+        """第row行转换为结果集中的邮件字典"""
+        folder = self.folders[self.folder[row]]
+        sender, sender_email = self.senders[self.sender[row]]
+        received = from_epoch_seconds(self.received[row])
+        flags = int(self.flags[row])
+        categories = self.cat_codes[self.cat_offsets[row]:self.cat_offsets[row + 1]]
+        return {
+            "id": self.entry_id(row), "store_id": folder["store_id"], "folder": folder["path"],
+            "subject": self.subject(row), "sender": sender, "sender_email": sender_email,
+            "received_time": received.strftime("%Y-%m-%d %H:%M:%S") if received else None,
+            "unread": bool(flags & SNAPSHOT_UNREAD), "has_attachments": bool(flags & SNAPSHOT_ATTACH),
+            "importance": int(self.importance[row]), "size": int(self.size[row]),
+            "categories": ", ".join(self.categories[c] for c in categories),
+        }
+
+    def sender_names(self):
+        """发件人编码 -> 发件人姓名编码，以及姓名列表（同名不同地址的发件人合并统计）"""
+        if self._sender_names is None:
+            names = StringDictionary()
+            codes = np.array([names.encode(name) for name, _ in self.senders], dtype=np.int32)
+            self._sender_names = (codes, names.values)
+        return self._sender_names
+
+    def mask(self, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+             folder_ids: Optional[List[str]] = None) -> np.ndarray:
+        """按时间范围 [start, end) 与文件夹筛选行"""
+        selected = np.ones(len(self), dtype=bool)
+        if start is not None:
+            selected &= self.received >= to_epoch_seconds(start)
+        if end is not None:
+            selected &= (self.received < to_epoch_seconds(end)) & (self.received != SNAPSHOT_NO_TIME)
+        if folder_ids is not None:
+            codes = [c for c in (self.folder_code(f) for f in folder_ids) if c is not None]
+            selected &= np.isin(self.folder, np.array(codes, dtype=np.int32))
+        return selected
+
+    def category_rows(self) -> np.ndarray:
+        """与 cat_codes 等长：每个分类编码所属的行号"""
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.cat_offsets))
+
+    @timed_op("cache:save_snapshot")
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for name in SNAPSHOT_COLUMNS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        meta = {"version": SNAPSHOT_VERSION, "built_at": self.built_at, "rows": len(self),
+                "senders": self.senders, "categories": self.categories, "folders": self.folders}
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    @classmethod
+    @timed_op("cache:load_snapshot")
+    def load(cls, directory: str) -> "MailboxSnapshot":
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"快照版本不匹配：{meta.get('version')}")
+        columns = {}
+        for name in SNAPSHOT_COLUMNS:
+            file_path = os.path.join(directory, f"{name}.npy")
+            try:
+                columns[name] = np.load(file_path, mmap_mode="r")
+            except ValueError:
+                # 空数组无法内存映射
+                columns[name] = np.load(file_path)
+        return cls(columns, meta["senders"], meta["categories"], meta["folders"], meta["built_at"], directory)
+
+    def disk_bytes(self) -> int:
+        if not self.path:
+            return 0
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+
+
+class SnapshotBuilder:
+    """逐个文件夹追加行：有变化的文件夹使用元数据索引的行，未变化的文件夹直接复用旧快照的切片"""
+
+    PARTS = ("received", "flags", "importance", "size", "sender", "folder",
+             "cat_counts", "cat_codes", "subject_lengths", "subject_blob", "id_lengths", "id_blob")
+
+    def __init__(self):
+        self.senders = StringDictionary()
+        self.categories = StringDictionary()
+        self.folders: List[Dict[str, Any]] = []
+        self.parts: Dict[str, List[np.ndarray]] = {name: [] for name in self.PARTS}
+        self.rows = 0
+        self._maps: Dict[int, Any] = {}
+
+    def _append(self, meta: Dict[str, Any], n: int, **columns):
+        meta.update(start=self.rows, stop=self.rows + n)
+        columns["folder"] = np.full(n, len(self.folders), dtype=np.int32)
+        self.folders.append(meta)
+        self.rows += n
+        for name, values in columns.items():
+            self.parts[name].append(values)
+
+    def add_rows(self, meta: Dict[str, Any], rows: List[Dict[str, Any]]):
+        n = len(rows)
+        cat_lists = [[self.categories.encode(c) for c in split_categories(r["categories"])] for r in rows]
+        subjects = [r["subject"].encode("utf-8") for r in rows]
+        entry_ids = [r["entry_id"].encode("ascii", "replace") for r in rows]
+        self._append(
+            meta, n,
+            received=np.fromiter((to_epoch_seconds(r["received"]) for r in rows), np.int64, n),
+            flags=np.fromiter(((SNAPSHOT_UNREAD if r["unread"] else 0) | (SNAPSHOT_ATTACH if r["has_attachments"] else 0)
+                               for r in rows), np.uint8, n),
+            importance=np.fromiter((r["importance"] for r in rows), np.int8, n),
+            size=np.fromiter((r["size"] for r in rows), np.int64, n),
+            sender=np.fromiter((self.senders.encode((r["sender"], r["sender_email"])) for r in rows), np.int32, n),
+            cat_counts=np.fromiter(map(len, cat_lists), np.int64, n),
+            cat_codes=np.fromiter(itertools.chain.from_iterable(cat_lists), np.int32),
+            subject_lengths=np.fromiter(map(len, subjects), np.int64, n),
+            subject_blob=np.frombuffer(b"".join(subjects), dtype=np.uint8),
+            id_lengths=np.fromiter(map(len, entry_ids), np.int64, n),
+            id_blob=np.frombuffer(b"".join(entry_ids), dtype=np.uint8),
+        )
+
+    def add_slice(self, meta: Dict[str, Any], old: MailboxSnapshot, start: int, stop: int):
+        maps = self._maps.get(id(old))
+        if maps is None:
+            maps = self._maps[id(old)] = (self.senders.remap(old.senders), self.categories.remap(old.categories))
+        sender_map, category_map = maps
+        cat_lo, cat_hi = old.cat_offsets[start], old.cat_offsets[stop]
+        subject_lo, subject_hi = old.subject_offsets[start], old.subject_offsets[stop]
+        id_lo, id_hi = old.id_offsets[start], old.id_offsets[stop]
+        self._append(
+            meta, stop - start,
+            received=np.array(old.received[start:stop]),
+            flags=np.array(old.flags[start:stop]),
+            importance=np.array(old.importance[start:stop]),
+            size=np.array(old.size[start:stop]),
+            sender=sender_map[old.sender[start:stop]],
+            cat_counts=np.diff(old.cat_offsets[start:stop + 1]),
+            cat_codes=category_map[old.cat_codes[cat_lo:cat_hi]],
+            subject_lengths=np.diff(old.subject_offsets[start:stop + 1]),
+            subject_blob=np.array(old.subject_blob[subject_lo:subject_hi]),
+            id_lengths=np.diff(old.id_offsets[start:stop + 1]),
+            id_blob=np.array(old.id_blob[id_lo:id_hi]),
+        )
+
+    def build(self) -> MailboxSnapshot:
+        def concat(name):
+            parts = self.parts[name]
+            dtype = SNAPSHOT_COLUMNS.get(name, np.int64)
+            return np.concatenate(parts).astype(dtype, copy=False) if parts else np.zeros(0, dtype=dtype)
+
+        def offsets(name):
+            return np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(concat(name), dtype=np.int64)])
+
+        columns = {name: concat(name) for name in ("received", "flags", "importance", "size", "sender",
+                                                   "folder", "cat_codes", "subject_blob", "id_blob")}
+        columns.update(cat_offsets=offsets("cat_counts"), subject_offsets=offsets("subject_lengths"),
+                       id_offsets=offsets("id_lengths"))
+        return MailboxSnapshot(columns, self.senders.values, self.categories.values, self.folders,
+                               datetime.datetime.now().isoformat(timespec="seconds"))
+
+
+_snapshot: Optional[MailboxSnapshot] = None
+# 事件可用时，只有收到邮件变化事件后才需要重新核对各文件夹的变化标记
+_snapshot_dirty = True
+_snapshot_lock = threading.Lock()
+
+
+def on_snapshot_event(kind: str, folder_id: Optional[str], entry_id: Optional[str]):
+    global _snapshot_dirty
+    _snapshot_dirty = True
+
+
+def load_mailbox_snapshot() -> Optional[MailboxSnapshot]:
+    """从磁盘加载最近一次保存的快照（内存映射）；没有或已损坏时返回None"""
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, "current"), "r", encoding="utf-8") as f:
+            generation = f.read().strip()
+        return MailboxSnapshot.load(os.path.join(SNAPSHOT_DIR, generation))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"加载邮箱快照失败: {str(e)}", file=sys.stderr)
+        return None
+
+
+def persist_mailbox_snapshot(snapshot: MailboxSnapshot) -> MailboxSnapshot:
+    """写入新的快照目录并切换 current 指针，返回以内存映射方式重新加载的快照。
+    旧目录可能仍被映射（Windows上无法删除），清理失败时留待下次"""
+    generation = f"g{time.time_ns()}"
+    snapshot.save(os.path.join(SNAPSHOT_DIR, generation))
+    pointer = os.path.join(SNAPSHOT_DIR, "current")
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(generation)
+    os.replace(pointer + ".tmp", pointer)
+    for name in os.listdir(SNAPSHOT_DIR):
+        if name.startswith("g") and name != generation:
+            shutil.rmtree(os.path.join(SNAPSHOT_DIR, name), ignore_errors=True)
+    return MailboxSnapshot.load(os.path.join(SNAPSHOT_DIR, generation))
+
+
+def folder_index_rows(folder, folder_id: str, token) -> Tuple[List[Dict[str, Any]], bool]:
+    """读取文件夹的元数据行，返回 (行, 是否完整)；元数据索引中已有同一变化标记的行时直接复用"""
+    with _mailbox_index_lock:
+        cached = _mailbox_index.get(folder_id)
+    if cached and cached["token"] == token:
+        return cached["rows"], True
+    return read_index_rows(folder, folder_id)
+
+
+def get_mailbox_snapshot(namespace, force: bool = False) -> MailboxSnapshot:
+    """返回默认邮箱的列式快照；只重新读取变化标记有变化的文件夹，其余文件夹复用旧快照"""
+    global _snapshot, _snapshot_dirty
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = load_mailbox_snapshot()
+        if (_snapshot is not None and not force and not _snapshot_dirty and _event_hub.running
+                and len(_event_hub.sinks) >= len(_snapshot.folders)):
+            return _snapshot
+        _snapshot_dirty = False
+        complete = True
+
+        current = []
+        for folder in iter_mail_folders(namespace.DefaultStore.GetRootFolder()):
+            try:
+                current.append((folder, folder.EntryID, list(folder_change_token(folder))))
+            except Exception as e:
+                note_skipped(e)
+                complete = False
+        old = _snapshot
+        old_tokens = old.tokens() if old is not None else {}
+        if (not force and old is not None and len(old_tokens) == len(current)
+                and all(old_tokens.get(folder_id) == token for _, folder_id, token in current)):
+            return old
+
+        builder = SnapshotBuilder()
+        for folder, folder_id, token in current:
+            meta = {"id": folder_id, "name": folder.Name, "path": folder.FolderPath,
+                    "store_id": folder.StoreID, "token": token}
+            previous = old.folders[old.folder_code(folder_id)] if not force and folder_id in old_tokens else None
+            if previous is not None and previous["token"] == token:
+                builder.add_slice(meta, old, previous["start"], previous["stop"])
+            else:
+                rows, folder_complete = folder_index_rows(folder, folder_id, tuple(token))
+                if not folder_complete:
+                    # 跳过了条目：不记录变化标记，下次重新读取该文件夹
+                    meta["token"] = None
+                    complete = False
+                builder.add_rows(meta, rows)
+        snapshot = builder.build()
+        if not complete:
+            # 不完整的快照不能凭"没有新事件"直接复用，下次调用重新核对各文件夹
+            _snapshot_dirty = True
         try:
-            if hasattr(item, "ReceivedTime") and item.ReceivedTime:
-                if item.ReceivedTime.replace(tzinfo=None) < threshold_date:
-                    continue
-                email_data = format_email(item)
-                emails_list.append(email_data)
+            snapshot = persist_mailbox_snapshot(snapshot)
         except Exception as e:
-            continue
-    return emails_list
+            print(f"保存邮箱快照失败: {str(e)}", file=sys.stderr)
+        _snapshot = snapshot
+        return snapshot
+
+
+_event_hub.subscribe(on_snapshot_event)
 
 # ===== 基础邮件操作 =====
 @mcp.tool()
@@ -177,6 +2639,28 @@ def list_folders() -> str:
     except Exception as e:
         return f"列出文件夹时出错：{str(e)}"
 
+@mcp.tool()
+def list_stores() -> str:
+    """列出配置文件中的所有存储（主邮箱、共享邮箱、在线存档、PST数据文件）及其顶层文件夹。
+    其他工具可用 "存储名:文件夹/子文件夹" 指定这些存储中的文件夹"""
+    try:
+        _, namespace = connect_to_outlook()
+        result = "📦 Outlook存储：\n\n"
+        for store in list_mail_stores(namespace):
+            store_type = STORE_TYPE_LABELS.get(getattr(store, "ExchangeStoreType", None), "未知类型")
+            result += f"- {store.DisplayName}（{store_type}）\n"
+            file_path = getattr(store, "FilePath", "")
+            if file_path:
+                result += f"  文件：{file_path}\n"
+            try:
+                names = [folder.Name for folder in store.GetRootFolder().Folders]
+                result += f"  顶层文件夹：{', '.join(names) if names else '无'}\n"
+            except Exception as e:
+                result += f"  无法访问：{str(e)}\n"
+        return result
+    except Exception as e:
+        return f"列出存储时出错：{str(e)}"
+
 @mcp.tool()
 def list_recent_emails(days: int = 7, folder_name: Optional[str] = None) -> str:
     """列出最近几天的邮件"""
@@ -187,71 +2671,62 @@ def list_recent_emails(days: int = 7, folder_name: Optional[str] = None) -> str:
         folder = namespace.GetDefaultFolder(6) if not folder_name else get_folder_by_name(namespace, folder_name)
         if not folder:
             return f"错误：找不到文件夹'{folder_name}'"
-        clear_email_cache()
-        emails = get_emails_from_folder(folder, days)
+        emails = within_days(cached_query("list_recent_emails", (days,), [folder],
+                                          lambda: get_emails_from_folder(folder, days)), days)
         if not emails:
             return f"在{folder_name or '收件箱'}中没有找到最近{days}天的邮件。"
         
-        global email_cache
+        handle = create_result_set("list_recent_emails", emails, folder)
         result = f"找到{len(emails)}封邮件：\n\n"
         for i, email in enumerate(emails, 1):
-            email_cache[i] = email
             result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']} <{email['sender_email']}>\n接收时间：{email['received_time']}\n\n"
         
-        save_email_cache(email_cache)
+        result += result_set_note(handle)
         return result
     except Exception as e:
         return f"获取邮件时出错：{str(e)}"
 
 @mcp.tool()
-def get_email_by_number(email_number: int) -> str:
-    """获取指定邮件的完整内容"""
+def get_email_by_number(email_number: Union[int, str], full_body: bool = False,
+                        max_chars: Optional[int] = None) -> str:
+    """获取指定邮件的内容 (编号、结果集引用如 "r3:5" 或稳定ID)。
+    默认返回去掉引用历史、签名与免责声明后的正文并按字数截断；full_body=True 返回原始正文"""
     try:
-        global email_cache
-        loaded_cache = load_email_cache()
-        
-        if not email_cache and loaded_cache:
-            email_cache = loaded_cache
-            
-        if not email_cache:
-            return "错误：还没有列出任何邮件。请先列出邮件。"
-            
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}。"
-            
-        email_data = email_cache[email_number]
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         _, namespace = connect_to_outlook()
         
         try:
-            email = namespace.GetItemFromID(email_data["id"])
+            email = get_item_data(namespace, email_data)
         except Exception as e:
             return f"错误：无法获取邮件。该邮件可能已被移动或删除。错误：{str(e)}"
-            
-        if not email:
-            return f"错误：无法获取邮件 #{email_number}。"
 
         result = f"邮件 #{email_number} 详情：\n"
-        result += f"主题：{email.Subject}\n"
-        result += f"发件人：{email.SenderName} <{email.SenderEmailAddress}>\n"
-        result += f"接收时间：{email.ReceivedTime}\n"
+        result += f"稳定ID：{email_data['id']}\n"
+        result += f"主题：{email['subject']}\n"
+        result += f"发件人：{email['sender']} <{email['sender_email']}>\n"
+        received = email['received'].strftime('%Y-%m-%d %H:%M:%S') if email['received'] else '未知'
+        result += f"接收时间：{received}\n"
         
         recipients = email_data.get('recipients', [])
         result += f"收件人：{', '.join(recipients)}\n"
         
-        if hasattr(email, 'Attachments') and email.Attachments.Count > 0:
+        if email['attachments']:
             result += "附件：\n"
-            for i in range(1, email.Attachments.Count + 1):
-                try:
-                    result += f" - {email.Attachments(i).FileName}\n"
-                except Exception:
-                    result += f" - [附件 {i}]\n"
+            for name in email['attachments']:
+                result += f" - {name}\n"
                     
-        result += "\n正文：\n"
-        try:
-            body = email.Body or "[未找到纯文本正文]"
-            result += body
-        except Exception as e:
-            result += f"[获取邮件正文失败：{str(e)}]"
+        budget = max_chars if max_chars is not None else BODY_CHAR_BUDGET
+        if full_body:
+            result += "\n正文：\n"
+            result += truncate_text(email['body'], max_chars) or "[未找到纯文本正文]"
+        else:
+            normalized = email['normalized']
+            note = describe_normalization(normalized)
+            result += f"\n正文{'（' + note + '；full_body=True 查看原文）' if note else ''}：\n"
+            result += truncate_text(normalized['text'], budget) or "[未找到纯文本正文]"
             
         return result
     except Exception as e:
@@ -268,66 +2743,51 @@ def compose_email(to: str, subject: str, body: str, cc: Optional[str] = None, bc
         return "错误：'正文'字段不能为空"
         
     try:
-        outlook, _ = connect_to_outlook()
-        mail = outlook.CreateItem(0)
-        
-        mail.To = to
-        mail.Subject = subject
-        mail.Body = body
-        
-        if cc and cc.strip():
-            mail.CC = cc
-        if bcc and bcc.strip():
-            mail.BCC = bcc
-            
-        mail.Send()
-        return f"邮件已成功发送给 {to}，主题为 '{subject}'"
+        queue_id = queue_new_mail(to, subject, body,
+                                  cc if cc and cc.strip() else None,
+                                  bcc if bcc and bcc.strip() else None)
+        return f"邮件已加入发送队列（队列ID：{queue_id}），收件人 {to}，主题为 '{subject}'"
     except Exception as e:
         return f"发送邮件时出错：{str(e)}"
 
 @mcp.tool()
-def reply_to_email_by_number(email_number: int, reply_body: str, reply_all: bool = False) -> str:
+def reply_to_email_by_number(email_number: Union[int, str], reply_body: str, reply_all: bool = False) -> str:
     """回复指定的邮件"""
     if not reply_body.strip():
         return "错误：回复内容不能为空"
         
     try:
-        global email_cache
-        loaded_cache = load_email_cache()
-        
-        if not email_cache and loaded_cache:
-            email_cache = loaded_cache
-            
-        if not email_cache:
-            return "错误：还没有列出任何邮件。请先列出邮件。"
-            
-        if email_number not in email_cache:
-            return f"错误：在缓存中找不到邮件 #{email_number}。"
-            
-        email_data = email_cache[email_number]
-        _, namespace = connect_to_outlook()
-        
         try:
-            original_email = namespace.GetItemFromID(email_data["id"])
-        except Exception as e:
-            return f"错误：无法获取原始邮件。该邮件可能已被移动或删除。错误：{str(e)}"
-            
-        if not original_email:
-            return f"错误：无法获取邮件 #{email_number}。"
-        
-        if reply_all:
-            reply = original_email.ReplyAll()
-        else:
-            reply = original_email.Reply()
-            
-        reply.Body = reply_body + "\n\n" + reply.Body
-        reply.Send()
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
+        payload = {"entry_id": email_data["id"], "store_id": email_data.get("store_id"),
+                   "reply_all": reply_all, "body": reply_body}
         action = "全部回复" if reply_all else "回复"
-        return f"{action}已成功发送到邮件 #{email_number}（主题：{original_email.Subject}）"
+        queue_id = get_send_queue().enqueue("reply", payload, f"{action}：{email_data.get('subject', '')}")
+        
+        return f"{action}已加入发送队列（队列ID：{queue_id}），邮件 #{email_number}（主题：{email_data.get('subject', '')}）"
     except Exception as e:
         return f"回复邮件时出错：{str(e)}"
 
+@mcp.tool()
+def list_result_sets() -> str:
+    """列出当前有效的结果集句柄（最近使用的在前）"""
+    try:
+        store = current_result_sets()
+        store.load()
+        with store.lock:
+            sets = list(reversed(store.sets.values()))
+        if not sets:
+            return "还没有任何结果集。请先列出或搜索邮件。"
+        result = f"当前有效的结果集（最多保留{RESULT_SET_LIMIT}个）：\n\n"
+        for result_set in sets:
+            result += f"- {result_set['handle']}：{result_set['label']}，{len(result_set['emails'])}封邮件，创建于 {result_set['created_at']}\n"
+        return result
+    except Exception as e:
+        return f"列出结果集时出错：{str(e)}"
+
 # ===== 搜索功能 =====
 @mcp.tool()
 def search_emails(search_term: str, days: int = 7, folder_name: Optional[str] = None) -> str:
@@ -341,45 +2801,46 @@ def search_emails(search_term: str, days: int = 7, folder_name: Optional[str] =
         if not folder:
             return f"错误：找不到文件夹'{folder_name}'"
             
-        clear_email_cache()
-        now = datetime.datetime.now()
-        threshold_date = now - datetime.timedelta(days=days)
-        search_terms = [term.strip().lower() for term in search_term.split(" OR ")]
-        
-        matching_emails = []
-        folder_items = folder.Items
-        folder_items.Sort("[ReceivedTime]", True)
+        search_terms = sorted({term.strip().lower() for term in search_term.split(" OR ") if term.strip()})
         
-        for item in folder_items:
-            try:
-                if not hasattr(item, "ReceivedTime") or not item.ReceivedTime:
-                    continue
-                if item.ReceivedTime.replace(tzinfo=None) < threshold_date:
+        def scan():
+            threshold_date = datetime.datetime.now() - datetime.timedelta(days=days)
+            found = []
+            folder_items = folder.Items
+            folder_items.Sort("[ReceivedTime]", True)
+            
+            for item in folder_items:
+                try:
+                    if not hasattr(item, "ReceivedTime") or not item.ReceivedTime:
+                        continue
+                    if item.ReceivedTime.replace(tzinfo=None) < threshold_date:
+                        continue
+                        
+                    email_text = f"{item.Subject} {item.SenderName} {item.Body}".lower()
+                    if any(term in email_text for term in search_terms):
+                        found.append(format_email(item))
+                except Exception as e:
+                    note_skipped(e)
                     continue
-                    
-                email_text = f"{item.Subject} {item.SenderName} {item.Body}".lower()
-                if any(term in email_text for term in search_terms):
-                    email_data = format_email(item)
-                    matching_emails.append(email_data)
-            except Exception:
-                continue
+            return found
+        
+        matching_emails = within_days(cached_query("search_emails", (tuple(search_terms), days), [folder], scan), days)
         
         if not matching_emails:
             return f"在{folder_name or '收件箱'}中没有找到匹配'{search_term}'的邮件（最近{days}天）。"
         
-        global email_cache
+        handle = create_result_set("search_emails", matching_emails, folder)
         result = f"找到{len(matching_emails)}封匹配'{search_term}'的邮件：\n\n"
         for i, email in enumerate(matching_emails, 1):
-            email_cache[i] = email
             result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']} <{email['sender_email']}>\n接收时间：{email['received_time']}\n\n"
         
-        save_email_cache(email_cache)
+        result += result_set_note(handle)
         return result
     except Exception as e:
         return f"搜索邮件时出错：{str(e)}"
 
 @mcp.tool()
-def list_and_get_email(days: int = 7, folder_name: Optional[str] = None, email_number: Optional[int] = None) -> str:
+def list_and_get_email(days: int = 7, folder_name: Optional[str] = None, email_number: Optional[Union[int, str]] = None) -> str:
     """列出邮件并可选获取特定邮件的内容"""
     # 先列出邮件
     result = list_recent_emails(days, folder_name)
@@ -398,7 +2859,6 @@ def search_by_date_range(start_date: str, end_date: str, folder_name: Optional[s
         _, namespace = connect_to_outlook()
         folder = namespace.GetDefaultFolder(6) if not folder_name else get_folder_by_name(namespace, folder_name)
         
-        clear_email_cache()
         matching_emails = []
         
         for item in folder.Items:
@@ -407,147 +2867,1006 @@ def search_by_date_range(start_date: str, end_date: str, folder_name: Optional[s
                     received_dt = item.ReceivedTime.replace(tzinfo=None)
                     if start_dt <= received_dt <= end_dt:
                         matching_emails.append(format_email(item))
-            except Exception:
+            except Exception as e:
+                note_skipped(e)
+                continue
+        
+        if not matching_emails:
+            return f"在{start_date}到{end_date}期间没有找到邮件"
+        
+        handle = create_result_set("search_by_date_range", matching_emails, folder)
+        result = f"找到{len(matching_emails)}封邮件（{start_date} 到 {end_date}）：\n\n"
+        for i, email in enumerate(matching_emails, 1):
+            result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']}\n时间：{email['received_time']}\n\n"
+        
+        result += result_set_note(handle)
+        return result
+    except Exception as e:
+        return f"按日期搜索时出错：{str(e)}"
+
+@mcp.tool()
+def search_unread_emails(days: int = 7, folder_name: Optional[str] = None) -> str:
+    """只搜索未读邮件"""
+    try:
+        _, namespace = connect_to_outlook()
+        folder = namespace.GetDefaultFolder(6) if not folder_name else get_folder_by_name(namespace, folder_name)
+        
+        def scan():
+            threshold_date = datetime.datetime.now() - datetime.timedelta(days=days)
+            found = []
+            for item in folder.Items:
+                try:
+                    if (hasattr(item, "UnRead") and item.UnRead and 
+                        hasattr(item, "ReceivedTime") and item.ReceivedTime and
+                        item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
+                        found.append(format_email(item))
+                except Exception as e:
+                    note_skipped(e)
+                    continue
+            return found
+        
+        unread_emails = within_days(cached_query("search_unread_emails", (days,), [folder], scan), days)
+        
+        if not unread_emails:
+            return f"最近{days}天没有未读邮件"
+        
+        handle = create_result_set("search_unread_emails", unread_emails, folder)
+        result = f"找到{len(unread_emails)}封未读邮件：\n\n"
+        for i, email in enumerate(unread_emails, 1):
+            result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']}\n时间：{email['received_time']}\n\n"
+        
+        result += result_set_note(handle)
+        return result
+    except Exception as e:
+        return f"搜索未读邮件时出错：{str(e)}"
+
+@mcp.tool()
+def search_with_attachments(days: int = 7, folder_name: Optional[str] = None) -> str:
+    """只搜索有附件的邮件"""
+    try:
+        _, namespace = connect_to_outlook()
+        folder = namespace.GetDefaultFolder(6) if not folder_name else get_folder_by_name(namespace, folder_name)
+        
+        now = datetime.datetime.now()
+        threshold_date = now - datetime.timedelta(days=days)
+        attachment_emails = []
+        
+        for item in folder.Items:
+            try:
+                if (hasattr(item, "Attachments") and item.Attachments.Count > 0 and
+                    hasattr(item, "ReceivedTime") and item.ReceivedTime and
+                    item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
+                    attachment_emails.append(format_email(item))
+            except Exception as e:
+                note_skipped(e)
+                continue
+        
+        if not attachment_emails:
+            return f"最近{days}天没有带附件的邮件"
+        
+        handle = create_result_set("search_with_attachments", attachment_emails, folder)
+        result = f"找到{len(attachment_emails)}封带附件的邮件：\n\n"
+        for i, email in enumerate(attachment_emails, 1):
+            result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']}\n附件数：{email['attachment_count']}\n时间：{email['received_time']}\n\n"
+        
+        result += result_set_note(handle)
+        return result
+    except Exception as e:
+        return f"搜索带附件邮件时出错：{str(e)}"
+
+@mcp.tool()
+def search_by_importance(importance_level: str = "高", days: int = 7, folder_name: Optional[str] = None) -> str:
+    """按重要性搜索邮件 (高/中/低)"""
+    try:
+        importance_map = {"高": 2, "中": 1, "低": 0}
+        if importance_level not in importance_map:
+            return "错误：重要性级别必须是'高'、'中'或'低'"
+        
+        target_importance = importance_map[importance_level]
+        
+        _, namespace = connect_to_outlook()
+        folder = namespace.GetDefaultFolder(6) if not folder_name else get_folder_by_name(namespace, folder_name)
+        
+        now = datetime.datetime.now()
+        threshold_date = now - datetime.timedelta(days=days)
+        important_emails = []
+        
+        for item in folder.Items:
+            try:
+                if (hasattr(item, "Importance") and item.Importance == target_importance and
+                    hasattr(item, "ReceivedTime") and item.ReceivedTime and
+                    item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
+                    important_emails.append(format_email(item))
+            except Exception as e:
+                note_skipped(e)
+                continue
+        
+        if not important_emails:
+            return f"最近{days}天没有{importance_level}重要性的邮件"
+        
+        handle = create_result_set("search_by_importance", important_emails, folder)
+        result = f"找到{len(important_emails)}封{importance_level}重要性邮件：\n\n"
+        for i, email in enumerate(important_emails, 1):
+            result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']}\n时间：{email['received_time']}\n\n"
+        
+        result += result_set_note(handle)
+        return result
+    except Exception as e:
+        return f"按重要性搜索时出错：{str(e)}"
+
+# ===== 查询语言 =====
+QUERY_TOKEN_PATTERN = re.compile(r'(-?)(?:([A-Za-z]+):)?(?:"([^"]*)"|(\S+))')
+QUERY_IMPORTANCE = {"high": 2, "高": 2, "normal": 1, "中": 1, "low": 0, "低": 0}
+# 可下推到 Restrict 的谓词；其余（发件人、主题、正文文本）在本地索引或逐行后过滤中求值
+QUERY_PUSHABLE = {"after", "before", "unread", "attachment", "importance", "category"}
+QUERY_COLUMNS = INDEX_COLUMNS + (PR_BODY_PREVIEW,)
+BODY_PREVIEW_CHARS = 255
+# 代价单位约等于一次COM往返
+QUERY_COST_CALL = 1.0
+QUERY_COST_ROW = 0.02
+QUERY_COST_OPEN = 3.0
+QUERY_COST_TOKEN = 3.0
+QUERY_COST_VECTOR_ROW = 0.00005
+QUERY_DEFAULT_SELECTIVITY = {"after": 0.3, "before": 0.7, "unread": 0.3, "attachment": 0.3,
+                             "importance": 0.1, "category": 0.1, "from": 0.1, "subject": 0.1,
+                             "text": 0.1, "body": 0.1}
+
+
+class QueryPredicate:
+    __slots__ = ("field", "value", "negate", "source")
+
+    def __init__(self, field: str, value: Any, negate: bool, source: str):
+        self.field = field
+        self.value = value
+        self.negate = negate
+        self.source = source
+
+    @property
+    def pushable(self) -> bool:
+        return self.field in QUERY_PUSHABLE
+
+    def dasl(self) -> str:
+        """Restrict/GetTable 可用的DASL条件（日期按UTC比较）"""
+        if self.field in ("after", "before"):
+            utc = self.value.astimezone(datetime.timezone.utc)
+            op = ">=" if self.field == "after" else "<"
+            condition = f"\"urn:schemas:httpmail:datereceived\" {op} '{utc:%Y-%m-%d %H:%M}'"
+        elif self.field == "unread":
+            condition = f"\"urn:schemas:httpmail:read\" = {0 if self.value else 1}"
+        elif self.field == "attachment":
+            condition = "\"urn:schemas:httpmail:hasattachment\" = 1"
+        elif self.field == "importance":
+            condition = f"\"urn:schemas:httpmail:importance\" = {self.value}"
+        else:
+            escaped = self.value.replace("'", "''")
+            condition = f"\"urn:schemas-microsoft-com:office:office#Keywords\" = '{escaped}'"
+        return f"NOT ({condition})" if self.negate else condition
+
+    def match_text(self, subject: str, sender: str, sender_email: str) -> Optional[bool]:
+        """在元数据上求值文本谓词；需要正文才能确定时返回None"""
+        needle = self.value.casefold()
+        if self.field == "from":
+            hit = needle in sender.casefold() or needle in sender_email.casefold()
+        elif self.field == "subject":
+            hit = needle in subject.casefold()
+        elif self.field == "text" and (needle in subject.casefold() or needle in sender.casefold()):
+            hit = True
+        else:
+            return None
+        return hit != self.negate
+
+
+def parse_query(query: str):
+    """解析查询语句，返回 (谓词列表, 文件夹名称或None, 存储范围或None)。
+    支持 from: subject: body: has:attachment is:unread/read after: before: importance: category: folder: in:all
+    store:名称 in:allstores、"精确短语"、普通词语，以及前缀 - 取反"""
+    predicates: List[QueryPredicate] = []
+    folder = None
+    stores = None
+    for match in QUERY_TOKEN_PATTERN.finditer(query):
+        negate, key, quoted, bare = bool(match.group(1)), (match.group(2) or "").lower(), match.group(3), match.group(4)
+        value = quoted if quoted is not None else bare
+        source = match.group(0)
+        if not key:
+            if value:
+                predicates.append(QueryPredicate("text", value, negate, source))
+        elif key == "from":
+            predicates.append(QueryPredicate("from", value, negate, source))
+        elif key == "subject":
+            predicates.append(QueryPredicate("subject", value, negate, source))
+        elif key == "body":
+            predicates.append(QueryPredicate("body", value, negate, source))
+        elif key == "has" and value.lower() in ("attachment", "attachments", "附件"):
+            predicates.append(QueryPredicate("attachment", True, negate, source))
+        elif key == "is" and value.lower() in ("unread", "read", "未读", "已读"):
+            predicates.append(QueryPredicate("unread", value.lower() in ("unread", "未读"), negate, source))
+        elif key in ("after", "before"):
+            predicates.append(QueryPredicate(key, parse_date_arg(value), negate, source))
+        elif key == "importance":
+            if value.lower() not in QUERY_IMPORTANCE:
+                raise ValueError(f"无法识别的重要性：{value}（可用 high/normal/low 或 高/中/低）")
+            predicates.append(QueryPredicate("importance", QUERY_IMPORTANCE[value.lower()], negate, source))
+        elif key == "category":
+            predicates.append(QueryPredicate("category", value, negate, source))
+        elif key == "folder":
+            folder = value
+        elif key == "in" and value.lower() in ("all", "全部"):
+            folder = "all"
+        elif key == "in" and value.lower() in ("allstores", "所有存储"):
+            stores = "all"
+        elif key == "store":
+            stores = value if not stores else f"{stores},{value}"
+        else:
+            raise ValueError(f"无法识别的查询条件：{source}")
+    if not predicates:
+        raise ValueError("查询中没有任何条件")
+    return predicates, folder, stores
+
+
+def body_matches(text_predicates: List[QueryPredicate], body: str) -> bool:
+    body = body.casefold()
+    return all((p.value.casefold() in body) != p.negate for p in text_predicates)
+
+
+def query_row_matches(predicates: List[QueryPredicate], subject: str, sender: str, sender_email: str,
+                      preview: Optional[str], load_body) -> bool:
+    """逐行求值文本谓词：先用元数据，再用正文预览，最后才打开邮件读取完整正文"""
+    pending = []
+    for predicate in predicates:
+        verdict = predicate.match_text(subject, sender, sender_email)
+        if verdict is False:
+            return False
+        if verdict is None:
+            pending.append(predicate)
+    if not pending:
+        return True
+    if preview is not None:
+        if body_matches(pending, preview) and not any(p.negate for p in pending):
+            return True
+        if len(preview) < BODY_PREVIEW_CHARS:
+            return body_matches(pending, preview)
+    return body_matches(pending, load_body())
+
+
+class QueryPlan:
+    """一个候选执行计划及其代价估计"""
+
+    def __init__(self, name: str, cost: float, detail: str):
+        self.name = name
+        self.cost = cost
+        self.detail = detail
+
+
+def snapshot_query_mask(snapshot: MailboxSnapshot, predicates: List[QueryPredicate],
+                        folder_ids: Optional[List[str]]) -> np.ndarray:
+    """在快照上向量化求值可下推的谓词"""
+    selected = snapshot.mask(folder_ids=folder_ids)
+    for predicate in predicates:
+        if predicate.field == "after":
+            condition = snapshot.received >= to_epoch_seconds(predicate.value)
+        elif predicate.field == "before":
+            condition = (snapshot.received < to_epoch_seconds(predicate.value)) & (snapshot.received != SNAPSHOT_NO_TIME)
+        elif predicate.field == "unread":
+            condition = ((snapshot.flags & SNAPSHOT_UNREAD) > 0) == predicate.value
+        elif predicate.field == "attachment":
+            condition = (snapshot.flags & SNAPSHOT_ATTACH) > 0
+        elif predicate.field == "importance":
+            condition = snapshot.importance == predicate.value
+        elif predicate.field == "category":
+            wanted = [code for code, name in enumerate(snapshot.categories)
+                      if name.casefold() == predicate.value.casefold()]
+            condition = np.zeros(len(snapshot), dtype=bool)
+            if wanted:
+                condition[snapshot.category_rows()[np.isin(snapshot.cat_codes, wanted)]] = True
+        else:
+            continue
+        selected &= ~condition if predicate.negate else condition
+    return selected
+
+
+def plan_query(namespace, predicates: List[QueryPredicate], folders) -> List[QueryPlan]:
+    """为查询估计两种计划的代价：Restrict下推+逐行过滤，或在列式快照上求值。
+    选择性取自已加载（可能略旧）的快照；没有快照时使用默认估计"""
+    pushed = [p for p in predicates if p.pushable]
+    text = [p for p in predicates if not p.pushable]
+    needs_body = any(p.field in ("text", "body") for p in text)
+    folder_ids = [folder.EntryID for folder in folders]
+    snapshot = _snapshot
+
+    known = snapshot is not None and all(snapshot.folder_code(f) is not None for f in folder_ids)
+    if known:
+        scope = snapshot.mask(folder_ids=folder_ids)
+        total = int(scope.sum())
+        restricted = int(snapshot_query_mask(snapshot, pushed, folder_ids).sum())
+    else:
+        total = sum(folder.Items.Count for folder in folders)
+        restricted = total
+        for predicate in pushed:
+            restricted *= QUERY_DEFAULT_SELECTIVITY[predicate.field]
+    text_selectivity = 1.0
+    for predicate in text:
+        if predicate.field in ("from", "subject"):
+            text_selectivity *= QUERY_DEFAULT_SELECTIVITY[predicate.field]
+    body_checks = restricted * text_selectivity if needs_body else 0
+
+    plans = []
+    filter_text = " AND ".join(p.dasl() for p in pushed)
+    table_cost = (len(folders) * QUERY_COST_CALL * 2 + restricted / INDEX_TABLE_CHUNK * QUERY_COST_CALL
+                  + restricted * QUERY_COST_ROW + body_checks * 0.5 * QUERY_COST_OPEN)
+    plans.append(QueryPlan("restrict", table_cost,
+                           f"Restrict 条件：{'@SQL=' + filter_text if filter_text else '（无）'}；"
+                           f"预计返回{restricted:.0f}行（共{total:.0f}封），"
+                           f"正文核对约{body_checks * 0.5:.0f}封（正文预览不足时才打开邮件）"))
+
+    if snapshot is not None and known:
+        fresh = (not _snapshot_dirty and _event_hub.running and len(_event_hub.sinks) >= len(snapshot.folders))
+        check_cost = 0.0 if fresh else len(snapshot.folders) * QUERY_COST_TOKEN
+        snapshot_cost = check_cost + len(snapshot) * QUERY_COST_VECTOR_ROW + body_checks * QUERY_COST_OPEN
+        plans.append(QueryPlan("snapshot", snapshot_cost,
+                               f"列式快照向量化求值（{'事件保持最新' if fresh else f'需核对{len(snapshot.folders)}个文件夹'}）；"
+                               f"预计候选{restricted}行，正文核对约{body_checks:.0f}封"))
+    return plans
+
+
+def run_query_restrict(namespace, predicates: List[QueryPredicate], folders, stats: Dict[str, int],
+                       deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    pushed = [p for p in predicates if p.pushable]
+    text = [p for p in predicates if not p.pushable]
+    filter_text = "@SQL=" + " AND ".join(p.dasl() for p in pushed) if pushed else ""
+    emails = []
+    for folder in folders:
+        check_deadline(deadline)
+        folder_id, store_id, path = folder.EntryID, folder.StoreID, folder.FolderPath
+        for values in read_folder_table(folder, QUERY_COLUMNS, filter_text):
+            stats["rows"] += 1
+            try:
+                row = index_row(values[:len(INDEX_COLUMNS)], folder_id, store_id)
+            except Exception as e:
+                note_skipped(e)
+                continue
+
+            def load_body(row=row):
+                stats["opened"] += 1
+                return get_item_data(namespace, {"id": row["entry_id"], "store_id": store_id})["body"]
+
+            if not query_row_matches(text, row["subject"], row["sender"], row["sender_email"],
+                                     values[-1] or "", load_body):
+                continue
+            emails.append(index_row_email(row, path))
+    return emails
+
+
+def run_query_snapshot(namespace, predicates: List[QueryPredicate], folders, stats: Dict[str, int]) -> List[Dict[str, Any]]:
+    snapshot = get_mailbox_snapshot(namespace)
+    text = [p for p in predicates if not p.pushable]
+    rows = np.flatnonzero(snapshot_query_mask(snapshot, predicates, [folder.EntryID for folder in folders]))
+    stats["rows"] += len(rows)
+    emails = []
+    for row in rows:
+        email = snapshot.email(row)
+
+        def load_body(email=email):
+            stats["opened"] += 1
+            return get_item_data(namespace, email)["body"]
+
+        if query_row_matches(text, email["subject"], email["sender"], email["sender_email"], None, load_body):
+            emails.append(email)
+    return emails
+
+
+def store_query_folders(store, folder_name: Optional[str]) -> list:
+    """存储内参与查询的邮件文件夹：未指定时为全部邮件文件夹，否则按路径或名称定位，存储中没有该文件夹时为空"""
+    if not folder_name or folder_name.strip().lower() in ("all", "全部"):
+        return list(iter_mail_folders(store.GetRootFolder()))
+    segments = [part.strip() for part in re.split(r"[\\/]", folder_name) if part.strip()]
+    folder = resolve_store_folder(store, segments) if len(segments) > 1 else None
+    folder = folder or find_folder_in_store(store, folder_name.strip())
+    if folder is None and folder_name.strip().casefold() in DEFAULT_FOLDER_IDS:
+        folder = resolve_store_folder(store, [folder_name.strip()])
+    return [folder] if folder is not None else []
+
+
+def run_query_stores(predicates: List[QueryPredicate], stores, folder_name: Optional[str],
+                     timeout: Optional[float]):
+    """在多个存储上并发执行Restrict下推计划，返回 (合并的邮件, 各存储统计, 失败的存储)"""
+    def task(namespace, store, deadline):
+        stats = {"rows": 0, "opened": 0, "folders": 0}
+        started = time.perf_counter()
+        folders = store_query_folders(store, folder_name)
+        stats["folders"] = len(folders)
+        emails = run_query_restrict(namespace, predicates, folders, stats, deadline)
+        stats["ms"] = (time.perf_counter() - started) * 1000
+        return emails, stats
+
+    results, failures = scan_stores(stores, task, timeout)
+    emails = [email for _, (store_emails, _) in results for email in store_emails]
+    return emails, [(name, stats) for name, (_, stats) in results], failures
+
+
+@mcp.tool()
+def search_mail_query(query: str, folder_name: Optional[str] = None, limit: int = 50, explain: bool = False,
+                      stores: Optional[str] = None, store_timeout: Optional[float] = None) -> str:
+    """用查询语言组合条件搜索邮件，例如：from:alice subject:报表 has:attachment after:2026-01-01 is:unread "精确短语"。
+    条件：from: subject: body: has:attachment is:unread/is:read after: before:（YYYY-MM-DD）importance:high/normal/low
+    category: folder:名称 in:all store:存储名 in:allstores，普通词语与 "短语" 在主题、发件人和正文中查找，前缀 - 表示取反。
+    日期、未读、附件、重要性、分类下推到Outlook的Restrict过滤，文本条件在本地快照或逐行过滤中求值；
+    stores 为逗号分隔的存储名称或 "all"（共享邮箱、存档、PST），各存储并发扫描后合并，
+    超过 store_timeout 秒（默认 OUTLOOK_MCP_STORE_TIMEOUT）的存储不纳入结果；
+    explain=True 时附上所选执行计划、各计划的估计代价与实际开销"""
+    try:
+        if limit < 1:
+            return "错误：limit 必须是正整数"
+        predicates, query_folder, query_stores = parse_query(query)
+        _, namespace = connect_to_outlook()
+        if query_stores or stores:
+            return search_mail_query_stores(namespace, query, predicates, query_folder or folder_name,
+                                            query_stores or stores, limit, explain, store_timeout)
+        folders = select_mail_folders(namespace, query_folder or folder_name)
+
+        start = time.perf_counter()
+        plans = plan_query(namespace, predicates, folders)
+        chosen = min(plans, key=lambda p: p.cost)
+        stats = {"rows": 0, "opened": 0}
+        runner = run_query_snapshot if chosen.name == "snapshot" else run_query_restrict
+        key = tuple(sorted((p.field, str(p.value), p.negate) for p in predicates))
+        emails = list(cached_query("search_mail_query", key, folders,
+                                   lambda: runner(namespace, predicates, folders, stats)))
+        emails.sort(key=lambda e: e["received_time"] or "", reverse=True)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        scope = "全部邮件文件夹" if (query_folder or folder_name or "").lower() in ("all", "全部") else (query_folder or folder_name or "收件箱")
+        if not emails:
+            result = f"在{scope}中没有找到匹配 {query} 的邮件\n"
+        else:
+            shown = emails[:limit]
+            handle = create_result_set("search_mail_query", shown)
+            result = f"找到{len(emails)}封匹配 {query} 的邮件"
+            result += f"（显示最新的{len(shown)}封）：\n\n" if len(shown) < len(emails) else "：\n\n"
+            for i, email in enumerate(shown, 1):
+                result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']} <{email['sender_email']}>\n"
+                result += f"接收时间：{email['received_time']}\n文件夹：{email['folder']}\n\n"
+            result += result_set_note(handle)
+
+        if explain:
+            labels = {"restrict": "Restrict下推 + 逐行过滤", "snapshot": "列式快照"}
+            result += "\n🔍 执行计划：\n"
+            result += "条件：" + "；".join(
+                f"{p.source}（{'下推Restrict' if p.pushable else '文本，本地求值'}）" for p in predicates) + "\n"
+            for plan in sorted(plans, key=lambda p: p.cost):
+                marker = "✅" if plan is chosen else "  "
+                result += f"{marker} {labels[plan.name]}：估计代价 {plan.cost:.1f}\n     {plan.detail}\n"
+            if not stats["rows"] and not stats["opened"]:
+                result += f"实际开销：命中查询结果缓存，耗时{elapsed:.0f} ms\n"
+            else:
+                result += f"实际开销：扫描{stats['rows']}行，打开{stats['opened']}封邮件读取正文，耗时{elapsed:.0f} ms\n"
+        return result
+    except ValueError as e:
+        return f"错误：{str(e)}"
+    except Exception as e:
+        return f"查询邮件时出错：{str(e)}"
+
+
+def search_mail_query_stores(namespace, query: str, predicates: List[QueryPredicate], folder_name: Optional[str],
+                             stores: str, limit: int, explain: bool, store_timeout: Optional[float]) -> str:
+    """search_mail_query 的多存储范围：各存储并发执行Restrict计划（快照只覆盖默认存储），结果按时间合并"""
+    selected = select_stores(namespace, stores)
+    start = time.perf_counter()
+    emails, per_store, failures = run_query_stores(predicates, selected, folder_name, store_timeout)
+    emails.sort(key=lambda e: e["received_time"] or "", reverse=True)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    scope = f"{len(selected)}个存储"
+    if not emails:
+        result = f"在{scope}中没有找到匹配 {query} 的邮件\n"
+    else:
+        shown = emails[:limit]
+        handle = create_result_set("search_mail_query", shown)
+        result = f"在{scope}中找到{len(emails)}封匹配 {query} 的邮件"
+        result += f"（显示最新的{len(shown)}封）：\n\n" if len(shown) < len(emails) else "：\n\n"
+        for i, email in enumerate(shown, 1):
+            result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']} <{email['sender_email']}>\n"
+            result += f"接收时间：{email['received_time']}\n文件夹：{email['folder']}\n\n"
+        result += result_set_note(handle)
+    result += describe_store_failures(failures)
+
+    if explain:
+        result += "\n🔍 执行计划：各存储并发执行 Restrict下推 + 逐行过滤\n"
+        result += "条件：" + "；".join(
+            f"{p.source}（{'下推Restrict' if p.pushable else '文本，本地求值'}）" for p in predicates) + "\n"
+        for name, stats in per_store:
+            result += (f"- {name}：{stats['folders']}个文件夹，扫描{stats['rows']}行，"
+                       f"打开{stats['opened']}封邮件，耗时{stats['ms']:.0f} ms\n")
+        result += f"总耗时{elapsed:.0f} ms\n"
+    return result
+
+# ===== 新邮件摘要 =====
+DIGEST_PENDING_LIMIT = 20
+DIGEST_MINUTE_FORMAT = "%Y-%m-%d %H:%M"
+
+
+class DigestState:
+    """按消费者持久化各文件夹的高水位：水位所在分钟（Restrict只精确到分钟）及该分钟内已交付的EntryID。
+    摘要先生成待确认的推进（令牌），客户端确认后才写入水位，未确认的邮件会在下次摘要中再次出现"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data: Dict[str, Any] = {"next_token": 1, "consumers": {}}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    loaded = json.load(f)
+                if isinstance(loaded, dict) and "consumers" in loaded:
+                    self.data = loaded
+            except Exception as e:
+                print(f"加载摘要水位出错: {str(e)}", file=sys.stderr)
+
+    def _consumer(self, consumer: str) -> Dict[str, Any]:
+        return self.data["consumers"].setdefault(consumer, {"folders": {}, "pending": {}})
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"保存摘要水位出错: {str(e)}", file=sys.stderr)
+
+    def watermark(self, consumer: str, folder_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            mark = self._consumer(consumer)["folders"].get(folder_id)
+            return dict(mark) if mark else None
+
+    def propose(self, consumer: str, advances: Dict[str, Dict[str, Any]]) -> str:
+        """登记一次待确认的推进，返回确认令牌；每个消费者只保留最近的若干个令牌"""
+        with self.lock:
+            token = f"d{self.data['next_token']}"
+            self.data["next_token"] += 1
+            pending = self._consumer(consumer)["pending"]
+            pending[token] = advances
+            for stale in list(pending)[:-DIGEST_PENDING_LIMIT]:
+                del pending[stale]
+            self._save()
+            return token
+
+    def ack(self, consumer: str, token: str) -> Optional[int]:
+        """应用令牌对应的推进，返回推进的文件夹数；令牌不存在时返回None。
+        晚于当前水位的推进才会生效，因此按任意顺序确认都不会让水位倒退"""
+        with self.lock:
+            state = self._consumer(consumer)
+            advances = state["pending"].pop(token, None)
+            if advances is None:
+                return None
+            moved = 0
+            for folder_id, advance in advances.items():
+                mark = state["folders"].get(folder_id)
+                if mark is None or advance["floor"] > mark["floor"]:
+                    state["folders"][folder_id] = advance
+                elif advance["floor"] == mark["floor"]:
+                    mark["seen"] = sorted(set(mark["seen"]) | set(advance["seen"]))
+                    mark["received"] = max(mark["received"], advance["received"])
+                else:
+                    continue
+                moved += 1
+            self._save()
+            return moved
+
+    def reset(self, consumer: str):
+        with self.lock:
+            self.data["consumers"].pop(consumer, None)
+            self._save()
+
+
+_digest_state: Optional[DigestState] = None
+_digest_state_lock = threading.Lock()
+
+
+def get_digest_state() -> DigestState:
+    global _digest_state
+    with _digest_state_lock:
+        if _digest_state is None:
+            _digest_state = DigestState(DIGEST_FILE)
+        return _digest_state
+
+
+def digest_new_rows(folder, mark: Dict[str, Any], stats: Dict[str, int]) -> List[Dict[str, Any]]:
+    """水位之后到达的邮件。水位分钟之后的邮件先用一次受限计数判断有无（空闲时计数为0，不读取表格），
+    水位所在分钟的少量行单独读取并排除已交付的EntryID。
+    不能拿计数与已交付条数比较：已交付的邮件可能已被移出文件夹"""
+    floor = datetime.datetime.strptime(mark["floor"], DIGEST_MINUTE_FORMAT)
+    later = floor + datetime.timedelta(minutes=1)
+    later_filter = f"[ReceivedTime] >= '{outlook_date_literal(later)}'"
+    filters = [f"[ReceivedTime] >= '{outlook_date_literal(floor)}' AND [ReceivedTime] < '{outlook_date_literal(later)}'"]
+    stats["counts"] += 1
+    if folder.GetTable(later_filter, 0).GetRowCount() > 0:
+        filters.append(later_filter)
+    seen = set(mark["seen"])
+    folder_id, store_id = folder.EntryID, folder.StoreID
+    rows = []
+    for filter_text in filters:
+        for values in read_folder_table(folder, INDEX_COLUMNS, filter_text):
+            stats["rows"] += 1
+            try:
+                row = index_row(values, folder_id, store_id)
+            except Exception as e:
+                note_skipped(e)
                 continue
-        
-        if not matching_emails:
-            return f"在{start_date}到{end_date}期间没有找到邮件"
-        
-        global email_cache
-        result = f"找到{len(matching_emails)}封邮件（{start_date} 到 {end_date}）：\n\n"
-        for i, email in enumerate(matching_emails, 1):
-            email_cache[i] = email
-            result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']}\n时间：{email['received_time']}\n\n"
-        
-        save_email_cache(email_cache)
-        return result
-    except Exception as e:
-        return f"按日期搜索时出错：{str(e)}"
+            if row["entry_id"] in seen or not row["received"] or row["received"] < floor:
+                continue
+            rows.append(row)
+    return rows
+
+
+def digest_advance(mark: Dict[str, Any], rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """交付 rows（按时间升序）之后该文件夹的新水位"""
+    newest = rows[-1]["received"]
+    floor = newest.strftime(DIGEST_MINUTE_FORMAT)
+    seen = {row["entry_id"] for row in rows if row["received"].strftime(DIGEST_MINUTE_FORMAT) == floor}
+    if mark["floor"] == floor:
+        seen |= set(mark["seen"])
+    return {"floor": floor, "seen": sorted(seen), "received": newest.strftime("%Y-%m-%d %H:%M:%S")}
+
 
 @mcp.tool()
-def search_unread_emails(days: int = 7, folder_name: Optional[str] = None) -> str:
-    """只搜索未读邮件"""
+def get_new_mail_digest(folder_names: Optional[str] = None, consumer: str = "default", limit: int = 50,
+                        initial_days: int = 1, ack: bool = False) -> str:
+    """返回自上次确认以来新到达的邮件（代替反复调用 list_recent_emails 轮询）。
+    每个消费者在各文件夹上持久化一个高水位（ReceivedTime + 该分钟内已交付的EntryID），只取水位之后的邮件；
+    没有新邮件时每个文件夹只花一次受限计数和水位分钟内少量行的读取。返回确认令牌，调用 ack_mail_digest 后水位才推进，
+    未确认的邮件会在下次摘要中再次出现；ack=True 时立即推进。
+    folder_names 为逗号分隔的文件夹（可带存储，如 "共享邮箱:收件箱"），默认收件箱；
+    首次调用时从最近 initial_days 天开始；新邮件超过 limit 封时先返回最早的 limit 封"""
     try:
         _, namespace = connect_to_outlook()
-        folder = namespace.GetDefaultFolder(6) if not folder_name else get_folder_by_name(namespace, folder_name)
-        
-        clear_email_cache()
-        now = datetime.datetime.now()
-        threshold_date = now - datetime.timedelta(days=days)
-        unread_emails = []
-        
-        for item in folder.Items:
-            try:
-                if (hasattr(item, "UnRead") and item.UnRead and 
-                    hasattr(item, "ReceivedTime") and item.ReceivedTime and
-                    item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
-                    unread_emails.append(format_email(item))
-            except Exception:
-                continue
-        
-        if not unread_emails:
-            return f"最近{days}天没有未读邮件"
-        
-        global email_cache
-        result = f"找到{len(unread_emails)}封未读邮件：\n\n"
-        for i, email in enumerate(unread_emails, 1):
-            email_cache[i] = email
-            result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']}\n时间：{email['received_time']}\n\n"
-        
-        save_email_cache(email_cache)
+        folders = select_mail_folders(namespace, folder_names)
+        state = get_digest_state()
+        stats = {"counts": 0, "rows": 0}
+        start_floor = (datetime.datetime.now() - datetime.timedelta(days=initial_days)).strftime(DIGEST_MINUTE_FORMAT)
+
+        found = []
+        marks = {}
+        for folder in folders:
+            folder_id = folder.EntryID
+            marks[folder_id] = state.watermark(consumer, folder_id) or {"floor": start_floor, "seen": [], "received": ""}
+            path = folder.FolderPath
+            found.extend((row, path) for row in digest_new_rows(folder, marks[folder_id], stats))
+        if not found:
+            return f"📭 没有新邮件（检查了{len(folders)}个文件夹，共{stats['counts']}次受限计数）\n"
+
+        found.sort(key=lambda entry: (entry[0]["received"], entry[0]["entry_id"]))
+        delivered = found[:limit]
+        by_folder: Dict[str, List[Dict[str, Any]]] = {}
+        for row, _ in delivered:
+            by_folder.setdefault(row["folder_id"], []).append(row)
+        advances = {folder_id: digest_advance(marks[folder_id], rows) for folder_id, rows in by_folder.items()}
+        token = state.propose(consumer, advances)
+        if ack:
+            state.ack(consumer, token)
+
+        emails = [index_row_email(row, path) for row, path in delivered]
+        handle = create_result_set("get_new_mail_digest", emails)
+        counts: Dict[str, int] = {}
+        for _, path in delivered:
+            counts[path] = counts.get(path, 0) + 1
+        result = f"📬 {len(delivered)}封新邮件（" + "，".join(f"{path} {n}" for path, n in counts.items()) + "）：\n\n"
+        for i, email in enumerate(emails, 1):
+            marks_text = ("🔵" if email["unread"] else "") + ("📎" if email["has_attachments"] else "") + \
+                         ("❗" if email["importance"] == 2 else "")
+            result += f"#{i} {email['received_time']} {marks_text}{email['sender']}：{email['subject']}\n"
+        result += "\n" + result_set_note(handle)
+        if len(found) > len(delivered):
+            result += f"还有{len(found) - len(delivered)}封新邮件未列出，确认后再次调用即可继续获取\n"
+        if ack:
+            result += "水位已推进\n"
+        else:
+            result += f"确认令牌：{token}（处理完后调用 ack_mail_digest(\"{token}\") 推进水位；未确认时下次摘要会再次包含这些邮件）\n"
         return result
+    except ValueError as e:
+        return f"错误：{str(e)}"
     except Exception as e:
-        return f"搜索未读邮件时出错：{str(e)}"
+        return f"获取新邮件摘要时出错：{str(e)}"
+
 
 @mcp.tool()
-def search_with_attachments(days: int = 7, folder_name: Optional[str] = None) -> str:
-    """只搜索有附件的邮件"""
+def ack_mail_digest(token: str, consumer: str = "default", reset: bool = False) -> str:
+    """确认 get_new_mail_digest 返回的令牌，把对应文件夹的水位推进到已交付的邮件之后。
+    reset=True 时清除该消费者的全部水位与未确认令牌（下次摘要重新从最近 initial_days 天开始）"""
     try:
-        _, namespace = connect_to_outlook()
-        folder = namespace.GetDefaultFolder(6) if not folder_name else get_folder_by_name(namespace, folder_name)
-        
-        clear_email_cache()
-        now = datetime.datetime.now()
-        threshold_date = now - datetime.timedelta(days=days)
-        attachment_emails = []
-        
-        for item in folder.Items:
+        state = get_digest_state()
+        if reset:
+            state.reset(consumer)
+            return f"已清除消费者 {consumer} 的摘要水位"
+        moved = state.ack(consumer, token.strip())
+        if moved is None:
+            return f"错误：找不到确认令牌 {token}（可能已确认或已过期）"
+        return f"已确认 {token}，推进了{moved}个文件夹的水位"
+    except Exception as e:
+        return f"确认摘要时出错：{str(e)}"
+
+# ===== 新邮件通知 =====
+NOTIFY_MAX_ITEMS = 20
+NOTIFY_LOGGER = "outlook.new_mail"
+
+
+def read_mail_header(item) -> Optional[Dict[str, Any]]:
+    """新邮件的简要信息（不读取正文）；不是邮件的条目返回None"""
+    if not str(getattr(item, "MessageClass", "") or "").startswith(("IPM.Note", "IPM.Schedule.Meeting")):
+        return None
+    folder = item.Parent
+    received = item.ReceivedTime
+    return {
+        "id": item.EntryID, "store_id": folder.StoreID, "folder_id": folder.EntryID, "folder": folder.FolderPath,
+        "subject": item.Subject or "", "sender": item.SenderName or "", "sender_email": item.SenderEmailAddress or "",
+        "received_time": received.strftime("%Y-%m-%d %H:%M:%S") if received else None,
+        "unread": bool(item.UnRead), "importance": item.Importance, "has_attachments": item.Attachments.Count > 0,
+    }
+
+
+class MailSubscription:
+    """一个客户端会话的新邮件订阅：文件夹（在推送线程中解析为EntryID）、发件人包含的文字与最低重要性"""
+
+    def __init__(self, subscription_id: str, session_key: str, send, folder_names: Optional[str],
+                 sender: Optional[str], importance: Optional[int]):
+        self.id = subscription_id
+        self.session_key = session_key
+        self.send = send
+        self.folder_names = folder_names
+        self.folder_ids: Optional[set] = None
+        self.sender = sender.casefold() if sender else None
+        self.importance = importance
+        self.error: Optional[str] = None
+        self.created_at = datetime.datetime.now()
+        self.notifications = 0
+        self.items = 0
+
+    def matches(self, header: Dict[str, Any]) -> bool:
+        if not self.folder_ids or header["folder_id"] not in self.folder_ids:
+            return False
+        if self.sender and self.sender not in header["sender"].casefold() \
+                and self.sender not in header["sender_email"].casefold():
+            return False
+        return self.importance is None or header["importance"] >= self.importance
+
+    def describe(self) -> str:
+        parts = [f"文件夹：{self.folder_names or '收件箱'}"]
+        if self.sender:
+            parts.append(f"发件人包含：{self.sender}")
+        if self.importance is not None:
+            parts.append(f"重要性≥{self.importance}")
+        return "，".join(parts)
+
+
+class NewMailNotifier:
+    """合并 NewMailEx 与 ItemAdd 事件，去抖后按订阅条件把新邮件的简要信息推送给MCP客户端。
+    事件线程只登记EntryID（同一封邮件的两种事件合并为一条）；推送线程在最后一个事件之后静默 debounce 秒、
+    或距第一个事件满 max_delay 秒时读取邮件头并发送，一阵突发的新邮件对每个订阅只产生一条通知"""
+
+    def __init__(self, debounce: float, max_delay: float):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.subscriptions: Dict[str, MailSubscription] = {}
+        self.pending: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self.first_event: Optional[float] = None
+        self.last_event: Optional[float] = None
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.next_id = 1
+        self.stats = {"events": 0, "coalesced": 0, "batches": 0, "notifications": 0, "errors": 0}
+
+    def subscribe(self, session_key: str, send, folder_names: Optional[str], sender: Optional[str],
+                  importance: Optional[int]) -> MailSubscription:
+        with self.condition:
+            subscription = MailSubscription(f"n{self.next_id}", session_key, send, folder_names, sender, importance)
+            self.next_id += 1
+            self.subscriptions[subscription.id] = subscription
+            if self.thread is None:
+                self.thread = start_com_thread(self._run, "outlook-new-mail")
+            self.condition.notify()
+            return subscription
+
+    def unsubscribe(self, subscription_id: str, session_key: Optional[str] = None) -> bool:
+        with self.condition:
+            subscription = self.subscriptions.get(subscription_id)
+            if subscription is None or (session_key is not None and subscription.session_key != session_key):
+                return False
+            del self.subscriptions[subscription_id]
+            if not self.subscriptions:
+                self.pending.clear()
+            return True
+
+    def on_event(self, kind: str, folder_id: Optional[str], entry_id: Optional[str]):
+        if kind not in ("add", "new_mail") or not entry_id:
+            return
+        with self.condition:
+            if not self.subscriptions:
+                return
+            if kind == "add" and not any(s.folder_ids is None or folder_id in s.folder_ids
+                                         for s in self.subscriptions.values()):
+                return
+            self.stats["events"] += 1
+            if entry_id in self.pending:
+                self.stats["coalesced"] += 1
+            else:
+                self.pending[entry_id] = folder_id
+            now = time.monotonic()
+            self.first_event = self.first_event or now
+            self.last_event = now
+            self.condition.notify()
+
+    def _next_batch(self):
+        """阻塞到有待解析的订阅或一批事件去抖完毕，返回 (EntryID列表, 待解析的订阅)"""
+        with self.condition:
+            while True:
+                unresolved = [s for s in self.subscriptions.values() if s.folder_ids is None]
+                if unresolved:
+                    return [], unresolved
+                if not self.pending:
+                    self.condition.wait()
+                    continue
+                due = min(self.last_event + self.debounce, self.first_event + self.max_delay)
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+                batch = list(self.pending)
+                self.pending.clear()
+                self.first_event = self.last_event = None
+                return batch, []
+
+    def _run(self):
+        _event_hub.ensure_started()
+        while True:
+            batch, unresolved = self._next_batch()
             try:
-                if (hasattr(item, "Attachments") and item.Attachments.Count > 0 and
-                    hasattr(item, "ReceivedTime") and item.ReceivedTime and
-                    item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
-                    attachment_emails.append(format_email(item))
+                _, namespace = connect_to_outlook()
+                for subscription in unresolved:
+                    self._resolve(namespace, subscription)
+                if batch:
+                    self._deliver(namespace, batch)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"推送新邮件通知出错：{str(e)}", file=sys.stderr)
+
+    def _resolve(self, namespace, subscription: MailSubscription):
+        try:
+            subscription.folder_ids = {f.EntryID for f in select_mail_folders(namespace, subscription.folder_names)}
+        except Exception as e:
+            subscription.folder_ids = set()
+            subscription.error = str(e)
+            self._send(subscription, {"event": "subscription_error", "subscription": subscription.id,
+                                      "error": subscription.error})
+
+    def _deliver(self, namespace, entry_ids: List[str]):
+        self.stats["batches"] += 1
+        headers = []
+        for entry_id in entry_ids:
+            try:
+                header = read_mail_header(namespace.GetItemFromID(entry_id))
             except Exception:
+                self.stats["errors"] += 1
                 continue
-        
-        if not attachment_emails:
-            return f"最近{days}天没有带附件的邮件"
-        
-        global email_cache
-        result = f"找到{len(attachment_emails)}封带附件的邮件：\n\n"
-        for i, email in enumerate(attachment_emails, 1):
-            email_cache[i] = email
-            result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']}\n附件数：{email['attachment_count']}\n时间：{email['received_time']}\n\n"
-        
-        save_email_cache(email_cache)
-        return result
-    except Exception as e:
-        return f"搜索带附件邮件时出错：{str(e)}"
+            if header is not None:
+                headers.append(header)
+        with self.condition:
+            subscriptions = list(self.subscriptions.values())
+        for subscription in subscriptions:
+            matched = [header for header in headers if subscription.matches(header)]
+            if not matched:
+                continue
+            handle = get_session(subscription.session_key).result_sets.create("new_mail", matched, None)
+            payload = {
+                "event": "new_mail", "subscription": subscription.id, "count": len(matched), "result_set": handle,
+                "items": [{"ref": f"{handle}:{i}", "subject": h["subject"], "sender": h["sender"],
+                           "sender_email": h["sender_email"], "received_time": h["received_time"],
+                           "folder": h["folder"], "importance": h["importance"],
+                           "has_attachments": h["has_attachments"]}
+                          for i, h in enumerate(matched[:NOTIFY_MAX_ITEMS], 1)],
+                "omitted": max(0, len(matched) - NOTIFY_MAX_ITEMS),
+            }
+            if self._send(subscription, payload):
+                subscription.notifications += 1
+                subscription.items += len(matched)
+                self.stats["notifications"] += 1
+
+    def _send(self, subscription: MailSubscription, payload: Dict[str, Any]) -> bool:
+        """发送失败（客户端会话已关闭）时取消该订阅"""
+        try:
+            if subscription.send(payload):
+                return True
+        except Exception as e:
+            print(f"发送新邮件通知失败（{subscription.id}）：{str(e)}", file=sys.stderr)
+        self.unsubscribe(subscription.id)
+        return False
+
+
+_new_mail_notifier = NewMailNotifier(NOTIFY_DEBOUNCE, NOTIFY_MAX_DELAY)
+_event_hub.subscribe(_new_mail_notifier.on_event)
+
+
+def mcp_log_sender(server_session, loop):
+    """把通知作为 notifications/message（logger 为 outlook.new_mail）发送给订阅所在的客户端会话；
+    会话已被回收时返回False"""
+    session_ref = weakref.ref(server_session)
+
+    def send(payload: Dict[str, Any]) -> bool:
+        session = session_ref()
+        if session is None:
+            return False
+        future = asyncio.run_coroutine_threadsafe(
+            session.send_log_message(level="info", data=payload, logger=NOTIFY_LOGGER), loop)
+        future.result(timeout=10)
+        return True
+    return send
+
 
 @mcp.tool()
-def search_by_importance(importance_level: str = "高", days: int = 7, folder_name: Optional[str] = None) -> str:
-    """按重要性搜索邮件 (高/中/低)"""
+def subscribe_new_mail(folder_names: Optional[str] = None, sender: Optional[str] = None,
+                       importance: Optional[str] = None, ctx: Optional[Context] = None) -> str:
+    """订阅新邮件推送，代替轮询 list_recent_emails。新邮件（Application.NewMailEx 与各文件夹的 ItemAdd）
+    经去抖合并后，以 notifications/message（logger 为 outlook.new_mail）推送给当前会话，
+    data 中包含新邮件的简要信息及可直接引用的结果集句柄。
+    folder_names 为逗号分隔的文件夹（默认收件箱），sender 为发件人名称或地址包含的文字，
+    importance 为最低重要性（high/normal/low 或 高/中/低）"""
     try:
-        importance_map = {"高": 2, "中": 1, "低": 0}
-        if importance_level not in importance_map:
-            return "错误：重要性级别必须是'高'、'中'或'低'"
-        
-        target_importance = importance_map[importance_level]
-        
-        _, namespace = connect_to_outlook()
-        folder = namespace.GetDefaultFolder(6) if not folder_name else get_folder_by_name(namespace, folder_name)
-        
-        clear_email_cache()
-        now = datetime.datetime.now()
-        threshold_date = now - datetime.timedelta(days=days)
-        important_emails = []
-        
-        for item in folder.Items:
-            try:
-                if (hasattr(item, "Importance") and item.Importance == target_importance and
-                    hasattr(item, "ReceivedTime") and item.ReceivedTime and
-                    item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
-                    important_emails.append(format_email(item))
-            except Exception:
-                continue
-        
-        if not important_emails:
-            return f"最近{days}天没有{importance_level}重要性的邮件"
-        
-        global email_cache
-        result = f"找到{len(important_emails)}封{importance_level}重要性邮件：\n\n"
-        for i, email in enumerate(important_emails, 1):
-            email_cache[i] = email
-            result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']}\n时间：{email['received_time']}\n\n"
-        
-        save_email_cache(email_cache)
-        return result
+        if ctx is None:
+            return "错误：订阅新邮件通知需要通过MCP客户端会话调用"
+        level = None
+        if importance:
+            if importance.lower() not in QUERY_IMPORTANCE:
+                return f"错误：无法识别的重要性：{importance}（可用 high/normal/low 或 高/中/低）"
+            level = QUERY_IMPORTANCE[importance.lower()]
+        send = mcp_log_sender(ctx.session, asyncio.get_running_loop())
+        subscription = _new_mail_notifier.subscribe(current_session_key(), send, folder_names, sender, level)
+        return (f"已订阅新邮件通知：{subscription.id}（{subscription.describe()}）\n"
+                f"新邮件在静默{NOTIFY_DEBOUNCE:g}秒后合并推送（突发时最迟{NOTIFY_MAX_DELAY:g}秒）；"
+                f"用 unsubscribe_new_mail(\"{subscription.id}\") 取消")
     except Exception as e:
-        return f"按重要性搜索时出错：{str(e)}"
+        return f"订阅新邮件通知时出错：{str(e)}"
+
+
+@mcp.tool()
+def unsubscribe_new_mail(subscription_id: str) -> str:
+    """取消当前会话的一个新邮件订阅"""
+    if _new_mail_notifier.unsubscribe(subscription_id.strip(), current_session_key()):
+        return f"已取消订阅 {subscription_id}"
+    return f"错误：当前会话没有订阅 {subscription_id}"
+
+
+@mcp.tool()
+def list_new_mail_subscriptions() -> str:
+    """列出当前会话的新邮件订阅及推送统计"""
+    key = current_session_key()
+    notifier = _new_mail_notifier
+    with notifier.condition:
+        subscriptions = [s for s in notifier.subscriptions.values() if s.session_key == key]
+    if not subscriptions:
+        return "当前会话没有新邮件订阅"
+    result = "🔔 新邮件订阅：\n\n"
+    for subscription in subscriptions:
+        result += f"- {subscription.id}：{subscription.describe()}，创建于{subscription.created_at:%Y-%m-%d %H:%M:%S}，"
+        result += f"已推送{subscription.notifications}条通知（{subscription.items}封邮件）\n"
+        if subscription.error:
+            result += f"  ⚠️ {subscription.error}\n"
+    stats = notifier.stats
+    result += (f"\n事件：{stats['events']}（合并重复{stats['coalesced']}），批次：{stats['batches']}，"
+               f"通知：{stats['notifications']}，错误：{stats['errors']}\n")
+    return result
 
 # ===== 邮件管理功能 =====
 @mcp.tool()
-def mark_email_as_read(email_number: int, mark_read: bool = True) -> str:
+def mark_email_as_read(email_number: Union[int, str], mark_read: bool = True) -> str:
     """标记邮件为已读或未读"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = open_email(namespace, email_data)
         email.UnRead = not mark_read
         email.Save()
         
@@ -557,17 +3876,16 @@ def mark_email_as_read(email_number: int, mark_read: bool = True) -> str:
         return f"标记邮件状态时出错：{str(e)}"
 
 @mcp.tool()
-def delete_email_by_number(email_number: int) -> str:
+def delete_email_by_number(email_number: Union[int, str]) -> str:
     """删除指定邮件"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = open_email(namespace, email_data)
         subject = email.Subject
         email.Delete()
         
@@ -576,21 +3894,20 @@ def delete_email_by_number(email_number: int) -> str:
         return f"删除邮件时出错：{str(e)}"
 
 @mcp.tool()
-def move_email_to_folder(email_number: int, target_folder: str) -> str:
+def move_email_to_folder(email_number: Union[int, str], target_folder: str) -> str:
     """移动邮件到指定文件夹"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
         folder = get_folder_by_name(namespace, target_folder)
         if not folder:
             return f"错误：找不到文件夹 '{target_folder}'"
         
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = open_email(namespace, email_data)
         subject = email.Subject
         email.Move(folder)
         
@@ -599,17 +3916,16 @@ def move_email_to_folder(email_number: int, target_folder: str) -> str:
         return f"移动邮件时出错：{str(e)}"
 
 @mcp.tool()
-def flag_email(email_number: int, flag_status: str = "重要") -> str:
+def flag_email(email_number: Union[int, str], flag_status: str = "重要") -> str:
     """标记邮件为重要或跟进"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = open_email(namespace, email_data)
         
         if flag_status == "重要":
             email.Importance = 2  # High importance
@@ -643,7 +3959,8 @@ def get_folder_summary() -> str:
                 total = folder.Items.Count
                 unread = sum(1 for item in folder.Items if hasattr(item, "UnRead") and item.UnRead)
                 result += f"{folder_name}：{total} 封邮件（{unread} 封未读）\n"
-            except Exception:
+            except Exception as e:
+                note_skipped(e)
                 continue
         
         # 自定义文件夹
@@ -653,7 +3970,8 @@ def get_folder_summary() -> str:
                     total = folder.Items.Count
                     unread = sum(1 for item in folder.Items if hasattr(item, "UnRead") and item.UnRead)
                     result += f"{folder.Name}：{total} 封邮件（{unread} 封未读）\n"
-            except Exception:
+            except Exception as e:
+                note_skipped(e)
                 continue
         
         return result
@@ -666,33 +3984,25 @@ def get_sender_statistics(days: int = 30, top_count: int = 10) -> str:
     try:
         _, namespace = connect_to_outlook()
         inbox = namespace.GetDefaultFolder(6)
+        snapshot = get_mailbox_snapshot(namespace)
         
-        now = datetime.datetime.now()
-        threshold_date = now - datetime.timedelta(days=days)
-        
-        sender_count = {}
-        total_emails = 0
-        
-        for item in inbox.Items:
-            try:
-                if (hasattr(item, 'ReceivedTime') and item.ReceivedTime and
-                    item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
-                    sender = getattr(item, 'SenderName', '未知发件人')
-                    sender_count[sender] = sender_count.get(sender, 0) + 1
-                    total_emails += 1
-            except Exception:
-                continue
-        
-        if not sender_count:
+        threshold_date = datetime.datetime.now() - datetime.timedelta(days=days)
+        selected = snapshot.mask(start=threshold_date, folder_ids=[inbox.EntryID])
+        total_emails = int(selected.sum())
+        if not total_emails:
             return f"最近{days}天没有邮件"
         
+        name_codes, names = snapshot.sender_names()
+        counts = np.bincount(name_codes[snapshot.sender[selected]], minlength=len(names))
         # 排序并取前N个
-        top_senders = sorted(sender_count.items(), key=lambda x: x[1], reverse=True)[:top_count]
+        top = np.argsort(-counts, kind="stable")[:top_count]
         
         result = f"最近{days}天发件人统计（总邮件{total_emails}封）：\n\n"
-        for i, (sender, count) in enumerate(top_senders, 1):
-            percentage = (count / total_emails) * 100
-            result += f"#{i} {sender}：{count}封 ({percentage:.1f}%)\n"
+        for i, code in enumerate(top, 1):
+            if not counts[code]:
+                break
+            percentage = (counts[code] / total_emails) * 100
+            result += f"#{i} {names[code] or '未知发件人'}：{counts[code]}封 ({percentage:.1f}%)\n"
         
         return result
     except Exception as e:
@@ -700,17 +4010,16 @@ def get_sender_statistics(days: int = 30, top_count: int = 10) -> str:
 
 # ===== 附件管理功能 =====
 @mcp.tool()
-def download_attachment(email_number: int, attachment_name: Optional[str] = None, save_path: Optional[str] = None) -> str:
+def download_attachment(email_number: Union[int, str], attachment_name: Optional[str] = None, save_path: Optional[str] = None) -> str:
     """下载邮件附件"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = open_email(namespace, email_data)
         
         if email.Attachments.Count == 0:
             return f"邮件 #{email_number} 没有附件"
@@ -735,17 +4044,16 @@ def download_attachment(email_number: int, attachment_name: Optional[str] = None
         return f"下载附件时出错：{str(e)}"
 
 @mcp.tool()
-def get_attachment_info(email_number: int) -> str:
+def get_attachment_info(email_number: Union[int, str]) -> str:
     """获取邮件附件详细信息"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = open_email(namespace, email_data)
         
         if email.Attachments.Count == 0:
             return f"邮件 #{email_number} 没有附件"
@@ -775,7 +4083,6 @@ def list_attachments_only(days: int = 7, folder_name: Optional[str] = None) -> s
         _, namespace = connect_to_outlook()
         folder = namespace.GetDefaultFolder(6) if not folder_name else get_folder_by_name(namespace, folder_name)
         
-        clear_email_cache()
         now = datetime.datetime.now()
         threshold_date = now - datetime.timedelta(days=days)
         attachment_emails = []
@@ -786,19 +4093,19 @@ def list_attachments_only(days: int = 7, folder_name: Optional[str] = None) -> s
                     hasattr(item, "ReceivedTime") and item.ReceivedTime and
                     item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
                     attachment_emails.append(format_email(item))
-            except Exception:
+            except Exception as e:
+                note_skipped(e)
                 continue
         
         if not attachment_emails:
             return f"最近{days}天没有带附件的邮件"
         
-        global email_cache
+        handle = create_result_set("list_attachments_only", attachment_emails, folder)
         result = f"找到{len(attachment_emails)}封带附件的邮件：\n\n"
         for i, email in enumerate(attachment_emails, 1):
-            email_cache[i] = email
             result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']}\n附件数：{email['attachment_count']}\n时间：{email['received_time']}\n\n"
         
-        save_email_cache(email_cache)
+        result += result_set_note(handle)
         return result
     except Exception as e:
         return f"列出带附件邮件时出错：{str(e)}"
@@ -806,9 +4113,9 @@ def list_attachments_only(days: int = 7, folder_name: Optional[str] = None) -> s
 # ===== 批量操作功能 =====
 @mcp.tool()
 def mark_multiple_emails(email_numbers: str, mark_read: bool = True) -> str:
-    """批量标记多封邮件为已读或未读"""
+    """批量标记多封邮件为已读或未读 (逗号分隔，如 "1,2,3"、"r3:1,2,3"，"r3:4-9" 为编号区间，"r3:*" 为整个结果集)"""
     try:
-        numbers = [int(x.strip()) for x in email_numbers.split(",")]
+        numbers = split_email_refs(email_numbers)
         results = []
         
         for num in numbers:
@@ -821,9 +4128,9 @@ def mark_multiple_emails(email_numbers: str, mark_read: bool = True) -> str:
 
 @mcp.tool()
 def delete_multiple_emails(email_numbers: str) -> str:
-    """批量删除多封邮件"""
+    """批量删除多封邮件 (逗号分隔，如 "1,2,3"、"r3:1,2,3"，"r3:4-9" 为编号区间，"r3:*" 为整个结果集)"""
     try:
-        numbers = [int(x.strip()) for x in email_numbers.split(",")]
+        numbers = split_email_refs(email_numbers)
         results = []
         
         for num in numbers:
@@ -834,6 +4141,34 @@ def delete_multiple_emails(email_numbers: str) -> str:
     except Exception as e:
         return f"批量删除邮件时出错：{str(e)}"
 
+@mcp.tool()
+def move_multiple_emails(email_numbers: str, target_folder: str) -> str:
+    """批量移动多封邮件到指定文件夹 (逗号分隔，如 "1,2,3"、"r3:1,2,3"，"r3:4-9" 为编号区间，"r3:*" 为整个结果集)"""
+    try:
+        numbers = split_email_refs(email_numbers)
+        _, namespace = connect_to_outlook()
+        folder = get_folder_by_name(namespace, target_folder)
+        if not folder:
+            return f"错误：找不到文件夹 '{target_folder}'"
+        
+        results = []
+        moved = 0
+        for num in numbers:
+            try:
+                email = open_email(namespace, lookup_email(num))
+                subject = email.Subject
+                email.Move(folder)
+                moved += 1
+                results.append(f"邮件 #{num}: '{subject}' 已移动")
+            except LookupError as e:
+                results.append(f"邮件 #{num}: 错误：{str(e)}")
+            except Exception as e:
+                results.append(f"邮件 #{num}: 移动邮件时出错：{str(e)}")
+        
+        return f"批量移动结果（{moved}/{len(numbers)}封已移动到 '{target_folder}'）：\n" + "\n".join(results)
+    except Exception as e:
+        return f"批量移动邮件时出错：{str(e)}"
+
 @mcp.tool()
 def export_emails_to_file(days: int = 7, folder_name: Optional[str] = None, file_path: Optional[str] = None) -> str:
     """导出邮件到文件"""
@@ -876,53 +4211,268 @@ def check_folder_exists(folder_name: str) -> str:
     except Exception as e:
         return f"检查文件夹时出错：{str(e)}"
 
+# ===== 邮箱规则会话 =====
+RULES_CACHE_TTL = 60
+_rules_cache: Dict[str, Any] = {"session": None, "loaded_at": 0.0, "thread": None}
+
+
+class RulesSession:
+    """一次获取规则集合并建立 名称→序号 索引，批量创建/删除/启停规则后只调用一次 Save()"""
+
+    def __init__(self, outlook, namespace):
+        self.namespace = namespace
+        self.rules = outlook.Session.DefaultStore.GetRules()
+        self.index: Dict[str, int] = {}
+        for i in range(1, self.rules.Count + 1):
+            self.index[self.rules.Item(i).Name.lower()] = i
+        self.dirty = False
+
+    def find(self, rule_name: str):
+        position = self.index.get(rule_name.lower())
+        return self.rules.Item(position) if position else None
+
+    def validate(self, definition: Dict[str, Any]):
+        """检查规则定义（不检查重名）并解析目标文件夹；定义无效时抛出ValueError，返回目标文件夹或None"""
+        if not (definition.get("name") or "").strip():
+            raise ValueError("规则名称不能为空")
+        if not any([definition.get("sender_contains"), definition.get("subject_contains")]):
+            raise ValueError("必须指定至少一个条件（发件人包含 或 主题包含）")
+        move_to_folder = definition.get("move_to_folder")
+        if not any([move_to_folder, definition.get("mark_as_read"), definition.get("forward_to")]):
+            raise ValueError("必须指定至少一个操作（移动到文件夹、标记为已读 或 转发）")
+        # 先解析目标文件夹，避免创建半成品规则
+        if not move_to_folder:
+            return None
+        target_folder = get_folder_by_name(self.namespace, move_to_folder)
+        if not target_folder:
+            raise ValueError(f"无法创建或访问文件夹 '{move_to_folder}'")
+        return target_folder
+
+    def create(self, definition: Dict[str, Any]):
+        """按规则定义创建规则；失败时抛出ValueError并撤销未完成的规则"""
+        target_folder = self.validate(definition)
+        rule_name = definition["name"].strip()
+        sender_contains = definition.get("sender_contains")
+        subject_contains = definition.get("subject_contains")
+        move_to_folder = definition.get("move_to_folder")
+        mark_as_read = bool(definition.get("mark_as_read"))
+        forward_to = definition.get("forward_to")
+        if rule_name.lower() in self.index:
+            raise ValueError(f"已存在名为 '{rule_name}' 的规则")
+
+        rule = self.rules.Create(rule_name, 0)  # 0 = olRuleReceive
+        position = self._locate_new_rule(rule_name)
+        try:
+            self._apply_definition(rule, sender_contains, subject_contains, target_folder,
+                                   move_to_folder, mark_as_read, forward_to)
+            rule.Enabled = definition.get("enabled", True)
+        except Exception:
+            self.delete(rule_name)
+            raise
+        self.dirty = True
+        return rule
+
+    def _locate_new_rule(self, rule_name: str) -> int:
+        """新规则通常追加在末尾，也可能插在最前；据此更新索引，避免重新扫描全部规则"""
+        count = self.rules.Count
+        if self.rules.Item(count).Name == rule_name:
+            position = count
+        elif self.rules.Item(1).Name == rule_name:
+            position = 1
+            for name in self.index:
+                self.index[name] += 1
+        else:
+            self.index = {self.rules.Item(i).Name.lower(): i for i in range(1, count + 1)}
+            return self.index[rule_name.lower()]
+        self.index[rule_name.lower()] = position
+        return position
+
+    @staticmethod
+    def _apply_definition(rule, sender_contains, subject_contains, target_folder,
+                          move_to_folder, mark_as_read, forward_to):
+        # 设置条件 - 简化条件设置
+        conditions = rule.Conditions
+
+        if sender_contains:
+            senders = sender_contains if isinstance(sender_contains, list) else [sender_contains]
+            try:
+                conditions.From.Enabled = True
+                for sender in senders:
+                    conditions.From.Recipients.Add(sender)
+            except Exception:
+                # 如果From不工作，尝试SenderAddress
+                try:
+                    conditions.SenderAddress.Enabled = True
+                    conditions.SenderAddress.Address = senders
+                except Exception:
+                    pass
+
+        if subject_contains:
+            try:
+                conditions.Subject.Enabled = True
+                conditions.Subject.Text = subject_contains if isinstance(subject_contains, list) else [subject_contains]
+            except Exception:
+                pass
+
+        # 设置操作 - 只设置一个主要操作以避免冲突
+        actions = rule.Actions
+
+        if target_folder:
+            try:
+                actions.MoveToFolder.Enabled = True
+                actions.MoveToFolder.Folder = target_folder
+            except Exception:
+                raise ValueError(f"无法设置移动到文件夹 '{move_to_folder}'")
+
+        elif mark_as_read:
+            try:
+                # 修复MarkAsRead属性访问
+                actions.MarkAsRead.Enabled = True
+            except Exception:
+                try:
+                    # 尝试其他可能的属性名
+                    actions.MarkRead.Enabled = True
+                except Exception:
+                    raise ValueError("无法设置标记为已读操作")
+
+        elif forward_to:
+            try:
+                actions.Forward.Enabled = True
+                actions.Forward.Recipients.Add(forward_to)
+            except Exception:
+                raise ValueError(f"无法设置转发到 '{forward_to}'")
+
+    def replace(self, definition: Dict[str, Any]):
+        """替换同名规则：先以临时名称创建新规则，成功后才删除旧规则并改回原名；
+        新定义无效时抛出ValueError，旧规则保持不变"""
+        rule_name = definition["name"].strip()
+        temporary = f"{rule_name}（导入中）"
+        while temporary.lower() in self.index:
+            temporary += "_"
+        rule = self.create(dict(definition, name=temporary))
+        self.delete(rule_name)
+        rule.Name = rule_name
+        self.index[rule_name.lower()] = self.index.pop(temporary.lower())
+        return rule
+
+    def delete(self, rule_name: str) -> bool:
+        position = self.index.pop(rule_name.lower(), None)
+        if not position:
+            return False
+        self.rules.Remove(position)
+        for name, i in self.index.items():
+            if i > position:
+                self.index[name] = i - 1
+        self.dirty = True
+        return True
+
+    def toggle(self, rule_name: str, enable: bool) -> bool:
+        rule = self.find(rule_name)
+        if rule is None:
+            return False
+        rule.Enabled = enable
+        self.dirty = True
+        return True
+
+    def save(self):
+        if self.dirty:
+            self.rules.Save()
+            self.dirty = False
+
+
+def get_rules_session() -> RulesSession:
+    """返回缓存的规则会话（同一线程内、RULES_CACHE_TTL秒内复用），否则重新获取"""
+    cached = _rules_cache["session"]
+    if (cached is not None and not cached.dirty and _rules_cache["thread"] == threading.get_ident() and
+            time.monotonic() - _rules_cache["loaded_at"] < RULES_CACHE_TTL):
+        return cached
+    outlook, namespace = connect_to_outlook()
+    session = RulesSession(outlook, namespace)
+    _rules_cache.update(session=session, loaded_at=time.monotonic(), thread=threading.get_ident())
+    return session
+
+
+def invalidate_rules_cache():
+    _rules_cache["session"] = None
+
+
+def rule_to_definition(rule) -> Dict[str, Any]:
+    """将Outlook规则导出为规则定义（与 RulesSession.create 的输入格式一致）"""
+    definition: Dict[str, Any] = {"name": rule.Name, "enabled": bool(rule.Enabled)}
+    conditions = rule.Conditions
+    actions = rule.Actions
+
+    def single_or_list(values):
+        values = [v for v in values if v]
+        return values[0] if len(values) == 1 else (values or None)
+
+    try:
+        if conditions.From.Enabled:
+            recipients = conditions.From.Recipients
+            definition["sender_contains"] = single_or_list(
+                [recipients.Item(i).Name for i in range(1, recipients.Count + 1)])
+        elif conditions.SenderAddress.Enabled:
+            definition["sender_contains"] = single_or_list(list(conditions.SenderAddress.Address))
+    except Exception:
+        pass
+    try:
+        if conditions.Subject.Enabled:
+            definition["subject_contains"] = single_or_list(list(conditions.Subject.Text))
+    except Exception:
+        pass
+    try:
+        if actions.MoveToFolder.Enabled and actions.MoveToFolder.Folder:
+            definition["move_to_folder"] = actions.MoveToFolder.Folder.Name
+    except Exception:
+        pass
+    try:
+        if actions.MarkAsRead.Enabled:
+            definition["mark_as_read"] = True
+    except Exception:
+        pass
+    try:
+        if actions.Forward.Enabled:
+            recipients = actions.Forward.Recipients
+            if recipients.Count:
+                definition["forward_to"] = recipients.Item(1).Address
+    except Exception:
+        pass
+    return {k: v for k, v in definition.items() if v is not None}
+
 @mcp.tool()
 def create_simple_rule(rule_name: str, condition_type: str, condition_value: str, 
                       action_type: str, action_value: Optional[str] = None) -> str:
     """创建简单邮箱规则 (条件类型: 发件人/主题, 操作类型: 移动/标记/转发)"""
+    definition: Dict[str, Any] = {"name": rule_name}
+    if condition_type == "发件人":
+        definition["sender_contains"] = condition_value
+    elif condition_type == "主题":
+        definition["subject_contains"] = condition_value
+    else:
+        return "错误：条件类型必须是'发件人'或'主题'"
+
+    if action_type == "移动":
+        if not action_value:
+            return "错误：移动操作需要指定目标文件夹"
+        definition["move_to_folder"] = action_value
+    elif action_type == "标记":
+        definition["mark_as_read"] = True
+    elif action_type == "转发":
+        if not action_value:
+            return "错误：转发操作需要指定邮箱地址"
+        definition["forward_to"] = action_value
+    else:
+        return "错误：操作类型必须是'移动'、'标记'或'转发'"
+
     try:
-        outlook, namespace = connect_to_outlook()
-        rules = outlook.Session.DefaultStore.GetRules()
-        
-        # 创建规则
-        rule = rules.Create(rule_name, 0)
-        
-        # 设置条件
-        if condition_type == "发件人":
-            rule.Conditions.From.Enabled = True
-            rule.Conditions.From.Recipients.Add(condition_value)
-        elif condition_type == "主题":
-            rule.Conditions.Subject.Enabled = True
-            rule.Conditions.Subject.Text = [condition_value]
-        else:
-            return "错误：条件类型必须是'发件人'或'主题'"
-        
-        # 设置操作
-        if action_type == "移动":
-            if not action_value:
-                return "错误：移动操作需要指定目标文件夹"
-            folder = get_folder_by_name(namespace, action_value)
-            if folder:
-                rule.Actions.MoveToFolder.Enabled = True
-                rule.Actions.MoveToFolder.Folder = folder
-            else:
-                return f"错误：无法访问文件夹 '{action_value}'"
-        elif action_type == "标记":
-            rule.Actions.MarkAsRead.Enabled = True
-        elif action_type == "转发":
-            if not action_value:
-                return "错误：转发操作需要指定邮箱地址"
-            rule.Actions.Forward.Enabled = True
-            rule.Actions.Forward.Recipients.Add(action_value)
-        else:
-            return "错误：操作类型必须是'移动'、'标记'或'转发'"
-        
-        rule.Enabled = True
-        rules.Save()
-        
+        session = get_rules_session()
+        session.create(definition)
+        session.save()
         return f"简单规则 '{rule_name}' 创建成功！"
-        
+    except ValueError as e:
+        return f"错误：{str(e)}"
     except Exception as e:
+        invalidate_rules_cache()
         return f"创建简单规则时出错：{str(e)}。建议使用Outlook手动创建复杂规则。"
 
 # ===== 邮箱规则功能 =====
@@ -930,8 +4480,7 @@ def create_simple_rule(rule_name: str, condition_type: str, condition_value: str
 def list_email_rules() -> str:
     """列出所有现有的邮箱规则"""
     try:
-        outlook, namespace = connect_to_outlook()
-        rules = outlook.Session.DefaultStore.GetRules()
+        rules = get_rules_session().rules
         
         if rules.Count == 0:
             return "当前没有设置任何邮箱规则。"
@@ -947,6 +4496,7 @@ def list_email_rules() -> str:
         
         return result
     except Exception as e:
+        invalidate_rules_cache()
         return f"获取邮箱规则时出错：{str(e)}"
 
 @mcp.tool()
@@ -954,84 +4504,18 @@ def create_email_rule(rule_name: str, sender_contains: Optional[str] = None,
                      subject_contains: Optional[str] = None, move_to_folder: Optional[str] = None,
                      mark_as_read: bool = False, forward_to: Optional[str] = None) -> str:
     """创建新的邮箱规则"""
-    if not rule_name.strip():
-        return "错误：规则名称不能为空"
-    
-    if not any([sender_contains, subject_contains]):
-        return "错误：必须指定至少一个条件（发件人包含 或 主题包含）"
-    
-    if not any([move_to_folder, mark_as_read, forward_to]):
-        return "错误：必须指定至少一个操作（移动到文件夹、标记为已读 或 转发）"
-    
     try:
-        outlook, namespace = connect_to_outlook()
-        rules = outlook.Session.DefaultStore.GetRules()
-        
-        # 创建新规则
-        rule = rules.Create(rule_name, 0)  # 0 = olRuleReceive
-        
-        # 设置条件 - 简化条件设置
-        conditions = rule.Conditions
-        
-        if sender_contains:
-            try:
-                conditions.From.Enabled = True
-                conditions.From.Recipients.Add(sender_contains)
-            except Exception:
-                # 如果From不工作，尝试SenderAddress
-                try:
-                    conditions.SenderAddress.Enabled = True
-                    conditions.SenderAddress.Address = [sender_contains]
-                except Exception:
-                    pass
-        
-        if subject_contains:
-            try:
-                conditions.Subject.Enabled = True
-                conditions.Subject.Text = [subject_contains]
-            except Exception:
-                pass
-        
-        # 设置操作 - 简化操作设置
-        actions = rule.Actions
-        
-        # 只设置一个主要操作以避免冲突
-        if move_to_folder:
-            target_folder = get_folder_by_name(namespace, move_to_folder)
-            if target_folder:
-                try:
-                    actions.MoveToFolder.Enabled = True
-                    actions.MoveToFolder.Folder = target_folder
-                except Exception:
-                    return f"错误：无法设置移动到文件夹 '{move_to_folder}'"
-            else:
-                return f"错误：无法创建或访问文件夹 '{move_to_folder}'"
-        
-        elif mark_as_read:
-            try:
-                # 修复MarkAsRead属性访问
-                actions.MarkAsRead.Enabled = True
-            except Exception:
-                try:
-                    # 尝试其他可能的属性名
-                    actions.MarkRead.Enabled = True
-                except Exception:
-                    return "错误：无法设置标记为已读操作"
-        
-        elif forward_to:
-            try:
-                actions.Forward.Enabled = True
-                actions.Forward.Recipients.Add(forward_to)
-            except Exception:
-                return f"错误：无法设置转发到 '{forward_to}'"
-        
-        # 启用并保存规则
-        rule.Enabled = True
-        rules.Save()
-        
+        session = get_rules_session()
+        session.create({
+            "name": rule_name, "sender_contains": sender_contains, "subject_contains": subject_contains,
+            "move_to_folder": move_to_folder, "mark_as_read": mark_as_read, "forward_to": forward_to,
+        })
+        session.save()
         return f"邮箱规则 '{rule_name}' 创建成功！"
-        
+    except ValueError as e:
+        return f"错误：{str(e)}"
     except Exception as e:
+        invalidate_rules_cache()
         return f"创建邮箱规则时出错：{str(e)}。建议手动在Outlook中创建规则。"
 
 @mcp.tool()
@@ -1041,19 +4525,13 @@ def delete_email_rule(rule_name: str) -> str:
         return "错误：规则名称不能为空"
     
     try:
-        outlook, namespace = connect_to_outlook()
-        rules = outlook.Session.DefaultStore.GetRules()
-        
-        for i in range(1, rules.Count + 1):
-            rule = rules.Item(i)
-            if rule.Name.lower() == rule_name.lower():
-                rules.Remove(i)
-                rules.Save()
-                return f"邮箱规则 '{rule_name}' 已成功删除！"
-        
-        return f"错误：找不到名为 '{rule_name}' 的规则"
-        
+        session = get_rules_session()
+        if not session.delete(rule_name):
+            return f"错误：找不到名为 '{rule_name}' 的规则"
+        session.save()
+        return f"邮箱规则 '{rule_name}' 已成功删除！"
     except Exception as e:
+        invalidate_rules_cache()
         return f"删除邮箱规则时出错：{str(e)}"
 
 @mcp.tool()
@@ -1063,38 +4541,339 @@ def toggle_email_rule(rule_name: str, enable: bool = True) -> str:
         return "错误：规则名称不能为空"
     
     try:
-        outlook, namespace = connect_to_outlook()
-        rules = outlook.Session.DefaultStore.GetRules()
-        
-        for i in range(1, rules.Count + 1):
-            rule = rules.Item(i)
-            if rule.Name.lower() == rule_name.lower():
-                rule.Enabled = enable
-                rules.Save()
-                status = "启用" if enable else "禁用"
-                return f"邮箱规则 '{rule_name}' 已{status}！"
-        
-        return f"错误：找不到名为 '{rule_name}' 的规则"
-        
+        session = get_rules_session()
+        if not session.toggle(rule_name, enable):
+            return f"错误：找不到名为 '{rule_name}' 的规则"
+        session.save()
+        status = "启用" if enable else "禁用"
+        return f"邮箱规则 '{rule_name}' 已{status}！"
     except Exception as e:
+        invalidate_rules_cache()
         return f"修改邮箱规则状态时出错：{str(e)}"
 
+@mcp.tool()
+def apply_rule_changes(changes: str) -> str:
+    """批量修改邮箱规则并只保存一次。changes为JSON数组，每项包含op（create/delete/enable/disable）和规则字段"""
+    try:
+        operations = json.loads(changes)
+        if isinstance(operations, dict):
+            operations = [operations]
+        if not isinstance(operations, list):
+            return "错误：changes必须是JSON数组"
+    except Exception as e:
+        return f"错误：无法解析changes：{str(e)}"
+
+    try:
+        session = get_rules_session()
+        results = []
+        for i, operation in enumerate(operations, 1):
+            op = str(operation.get("op", "create")).lower()
+            name = operation.get("name", "")
+            try:
+                if op == "create":
+                    session.create(operation)
+                    results.append(f"#{i} 创建 '{name}'：成功")
+                elif op == "delete":
+                    ok = session.delete(name)
+                    results.append(f"#{i} 删除 '{name}'：{'成功' if ok else '找不到该规则'}")
+                elif op in ("enable", "disable"):
+                    ok = session.toggle(name, op == "enable")
+                    action = "启用" if op == "enable" else "禁用"
+                    results.append(f"#{i} {action} '{name}'：{'成功' if ok else '找不到该规则'}")
+                else:
+                    results.append(f"#{i} 未知操作 '{op}'，已跳过")
+            except ValueError as e:
+                results.append(f"#{i} {op} '{name}'：失败（{str(e)}）")
+        session.save()
+        return f"规则批量修改完成（共{len(operations)}项，已保存一次）：\n" + "\n".join(results)
+    except Exception as e:
+        invalidate_rules_cache()
+        return f"批量修改邮箱规则时出错：{str(e)}"
+
+@mcp.tool()
+def export_email_rules(file_path: Optional[str] = None) -> str:
+    """将邮箱规则导出为JSON文件"""
+    try:
+        if not file_path:
+            file_path = f"email_rules_export_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        session = get_rules_session()
+        definitions = []
+        for i in range(1, session.rules.Count + 1):
+            try:
+                definitions.append(rule_to_definition(session.rules.Item(i)))
+            except Exception as e:
+                note_skipped(e)
+                continue
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(definitions, f, ensure_ascii=False, indent=2)
+        return f"已导出{len(definitions)}条邮箱规则到文件：{file_path}"
+    except Exception as e:
+        invalidate_rules_cache()
+        return f"导出邮箱规则时出错：{str(e)}"
+
+@mcp.tool()
+def import_email_rules(file_path: str, replace_existing: bool = False) -> str:
+    """从JSON文件批量导入邮箱规则（只保存一次）；同名规则默认跳过"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            definitions = json.load(f)
+        if not isinstance(definitions, list):
+            return "错误：规则文件必须包含JSON数组"
+    except Exception as e:
+        return f"读取规则文件时出错：{str(e)}"
+
+    try:
+        session = get_rules_session()
+        created, skipped, failed = [], [], []
+        for definition in definitions:
+            name = definition.get("name", "")
+            exists = session.find(name) is not None
+            if exists and not replace_existing:
+                skipped.append(name)
+                continue
+            try:
+                # 替换时新规则创建成功后才删除旧规则，无效的定义不会毁掉原有规则
+                if exists:
+                    session.replace(definition)
+                else:
+                    session.create(definition)
+                created.append(name)
+            except ValueError as e:
+                failed.append(f"{name}（{str(e)}）")
+        session.save()
+
+        result = f"规则导入完成：创建{len(created)}条，跳过{len(skipped)}条，失败{len(failed)}条\n"
+        if skipped:
+            result += f"已存在而跳过：{', '.join(skipped)}\n"
+        if failed:
+            result += "失败：\n" + "\n".join(f"- {item}" for item in failed) + "\n"
+        return result
+    except Exception as e:
+        invalidate_rules_cache()
+        return f"导入邮箱规则时出错：{str(e)}"
+
+# ===== 规则模拟 =====
+def as_term_list(value) -> List[str]:
+    if not value:
+        return []
+    values = value if isinstance(value, list) else [value]
+    return [str(v).strip().lower() for v in values if str(v).strip()]
+
+
+def rule_matcher(sender_contains, subject_contains):
+    """返回按规则条件（发件人包含、主题包含，条件之间为AND）匹配索引行的函数"""
+    senders = as_term_list(sender_contains)
+    subjects = as_term_list(subject_contains)
+
+    def match(row) -> bool:
+        if senders:
+            sender_text = f"{row['sender']} {row['sender_email']}".lower()
+            if not any(term in sender_text for term in senders):
+                return False
+        if subjects:
+            subject_text = row["subject"].lower()
+            if not any(term in subject_text for term in subjects):
+                return False
+        return True
+    return match
+
+
+def resolve_rule_definition(rule_name: Optional[str], **overrides) -> Dict[str, Any]:
+    """从已有规则读取定义，或直接使用传入的条件与操作"""
+    if rule_name:
+        rule = get_rules_session().find(rule_name)
+        if rule is None:
+            raise ValueError(f"找不到名为 '{rule_name}' 的规则")
+        definition = rule_to_definition(rule)
+    else:
+        definition = {}
+    for key, value in overrides.items():
+        if value:
+            definition[key] = value
+    if not definition.get("sender_contains") and not definition.get("subject_contains"):
+        raise ValueError("必须指定至少一个条件（发件人包含 或 主题包含），或指定已有规则名称")
+    return definition
+
+
+def find_rule_matches(namespace, definition: Dict[str, Any], folder_name: Optional[str],
+                      include_subfolders: bool):
+    """在本地元数据索引中查找匹配规则条件的邮件，返回 (匹配行, 扫描数)"""
+    base = namespace.GetDefaultFolder(6) if not folder_name else get_folder_by_name(namespace, folder_name)
+    if not base:
+        raise ValueError(f"找不到文件夹'{folder_name}'")
+    folders = iter_mail_folders(base) if include_subfolders else [base]
+    match = rule_matcher(definition.get("sender_contains"), definition.get("subject_contains"))
+    matches, scanned = [], 0
+    for folder in folders:
+        entry = get_folder_index(folder)
+        scanned += len(entry["rows"])
+        matches.extend(row for row in entry["rows"] if match(row))
+    matches.sort(key=lambda row: row["received"] or datetime.datetime.min, reverse=True)
+    return matches, scanned
+
+@mcp.tool()
+def simulate_email_rule(rule_name: Optional[str] = None, sender_contains: Optional[str] = None,
+                        subject_contains: Optional[str] = None, folder_name: Optional[str] = None,
+                        include_subfolders: bool = False, sample_count: int = 5) -> str:
+    """预览规则会匹配哪些现有邮件（可指定已有规则名称，或直接给出条件）"""
+    try:
+        definition = resolve_rule_definition(rule_name, sender_contains=sender_contains,
+                                             subject_contains=subject_contains)
+        _, namespace = connect_to_outlook()
+        start = time.perf_counter()
+        matches, scanned = find_rule_matches(namespace, definition, folder_name, include_subfolders)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        title = f"规则 '{rule_name}'" if rule_name else "规则条件"
+        result = f"{title} 模拟结果（{folder_name or '收件箱'}{'及子文件夹' if include_subfolders else ''}）：\n\n"
+        result += f"条件：发件人包含 {definition.get('sender_contains') or '-'}，主题包含 {definition.get('subject_contains') or '-'}\n"
+        result += f"扫描邮件：{scanned}封，匹配：{len(matches)}封，耗时：{elapsed:.1f} ms\n"
+        if matches and sample_count > 0:
+            result += "\n匹配示例：\n"
+            for i, row in enumerate(matches[:sample_count], 1):
+                received = row["received"].strftime("%Y-%m-%d %H:%M") if row["received"] else "未知时间"
+                result += f"{i}. {row['subject']} — {row['sender']}（{received}）\n"
+        return result
+    except ValueError as e:
+        return f"错误：{str(e)}"
+    except Exception as e:
+        return f"模拟邮箱规则时出错：{str(e)}"
+
+@mcp.tool()
+def run_rule_now(rule_name: Optional[str] = None, sender_contains: Optional[str] = None,
+                 subject_contains: Optional[str] = None, move_to_folder: Optional[str] = None,
+                 mark_as_read: bool = False, forward_to: Optional[str] = None,
+                 folder_name: Optional[str] = None, include_subfolders: bool = False,
+                 chunk_size: int = 100, max_items: int = 1000) -> str:
+    """对现有邮件立即执行规则（移动/标记已读/转发），按批处理匹配的邮件"""
+    try:
+        definition = resolve_rule_definition(
+            rule_name, sender_contains=sender_contains, subject_contains=subject_contains,
+            move_to_folder=move_to_folder, mark_as_read=mark_as_read, forward_to=forward_to)
+        if not any([definition.get("move_to_folder"), definition.get("mark_as_read"), definition.get("forward_to")]):
+            return "错误：必须指定至少一个操作（移动到文件夹、标记为已读 或 转发）"
+        chunk_size = max(1, chunk_size)
+
+        _, namespace = connect_to_outlook()
+        target_folder = None
+        if definition.get("move_to_folder"):
+            target_folder = get_folder_by_name(namespace, definition["move_to_folder"])
+            if not target_folder:
+                return f"错误：无法创建或访问文件夹 '{definition['move_to_folder']}'"
+
+        matches, _ = find_rule_matches(namespace, definition, folder_name, include_subfolders)
+        if target_folder:
+            target_id = target_folder.EntryID
+            matches = [row for row in matches if row["folder_id"] != target_id]
+        if not matches:
+            return "没有匹配规则条件的现有邮件"
+        pending = matches[:max_items]
+
+        done, failed = 0, 0
+        last_error = None
+        chunk_reports = []
+        touched_folders = set()
+        for chunk_start in range(0, len(pending), chunk_size):
+            chunk = pending[chunk_start:chunk_start + chunk_size]
+            chunk_done = 0
+            for row in chunk:
+                try:
+                    item = namespace.GetItemFromID(row["entry_id"], row["store_id"])
+                    if definition.get("mark_as_read") and item.UnRead:
+                        item.UnRead = False
+                        item.Save()
+                    if definition.get("forward_to"):
+                        forward = item.Forward()
+                        forward.Recipients.Add(definition["forward_to"])
+                        forward.Send()
+                    if target_folder:
+                        item.Move(target_folder)
+                    touched_folders.add(row["folder_id"])
+                    chunk_done += 1
+                except Exception as e:
+                    note_skipped(e)
+                    failed += 1
+                    last_error = e
+            done += chunk_done
+            chunk_report = f"第{len(chunk_reports) + 1}批：成功{chunk_done}/{len(chunk)}"
+            if chunk_done < len(chunk):
+                chunk_report += f"，失败{len(chunk) - chunk_done}"
+            chunk_reports.append(chunk_report)
+
+        for folder_id in touched_folders:
+            invalidate_folder_index(folder_id)
+        if target_folder:
+            invalidate_folder_index(target_id)
+
+        actions = []
+        if definition.get("mark_as_read"):
+            actions.append("标记为已读")
+        if definition.get("forward_to"):
+            actions.append(f"转发到 {definition['forward_to']}")
+        if target_folder:
+            actions.append(f"移动到 '{definition['move_to_folder']}'")
+
+        result = f"规则已对现有邮件执行：{'、'.join(actions)}\n"
+        result += f"匹配{len(matches)}封，处理{len(pending)}封，成功{done}封，失败{failed}封"
+        result += f"（最近的错误：{describe_com_error(last_error)}）\n" if last_error else "\n"
+        if len(matches) > len(pending):
+            result += f"（超过上限{max_items}封，其余邮件未处理）\n"
+        result += "\n".join(chunk_reports)
+        return result
+    except ValueError as e:
+        return f"错误：{str(e)}"
+    except Exception as e:
+        return f"执行邮箱规则时出错：{str(e)}"
+
+@mcp.tool()
+def refresh_mailbox_index() -> str:
+    """刷新本地邮箱元数据索引（只重新读取有变化的文件夹）"""
+    try:
+        _, namespace = connect_to_outlook()
+        start = time.perf_counter()
+        entries = get_mailbox_index(namespace.DefaultStore.GetRootFolder())
+        elapsed = (time.perf_counter() - start) * 1000
+        total = sum(len(entry["rows"]) for entry in entries)
+        result = f"邮箱元数据索引已更新：{len(entries)}个文件夹，{total}封邮件，耗时{elapsed:.0f} ms\n\n"
+        for entry in sorted(entries, key=lambda e: len(e["rows"]), reverse=True):
+            if entry["rows"]:
+                result += f"- {entry['path']}：{len(entry['rows'])}封\n"
+        return result
+    except Exception as e:
+        return f"刷新邮箱索引时出错：{str(e)}"
+
+@mcp.tool()
+def refresh_mailbox_snapshot(force: bool = False) -> str:
+    """刷新列式邮箱快照（分析工具使用的内存映射数组文件）；force=True 时全部重新读取"""
+    try:
+        _, namespace = connect_to_outlook()
+        start = time.perf_counter()
+        snapshot = get_mailbox_snapshot(namespace, force=force)
+        elapsed = (time.perf_counter() - start) * 1000
+        result = f"邮箱快照已更新：{len(snapshot.folders)}个文件夹，{len(snapshot)}封邮件，耗时{elapsed:.0f} ms\n"
+        result += f"构建时间：{snapshot.built_at}\n"
+        result += f"发件人：{len(snapshot.senders)}个，分类：{len(snapshot.categories)}个\n"
+        if snapshot.path:
+            result += f"位置：{snapshot.path}（{snapshot.disk_bytes() / 1024 / 1024:.1f} MB，内存映射）\n"
+        return result
+    except Exception as e:
+        return f"刷新邮箱快照时出错：{str(e)}"
+
 # ===== AI辅助功能 =====
 @mcp.tool()
-def summarize_email_thread(email_number: int) -> str:
+def summarize_email_thread(email_number: Union[int, str]) -> str:
     """总结邮件对话"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = get_item_data(namespace, email_data)
         
         # 简单的文本摘要（基于关键词和长度）
-        body = email.Body
+        body = email['normalized']['text']
         sentences = body.split('。')
         
         # 提取关键信息
@@ -1106,9 +4885,9 @@ def summarize_email_thread(email_number: int) -> str:
                 important_sentences.append(sentence.strip())
         
         summary = f"邮件摘要：\n\n"
-        summary += f"主题：{email.Subject}\n"
-        summary += f"发件人：{email.SenderName}\n"
-        summary += f"时间：{email.ReceivedTime.strftime('%Y-%m-%d %H:%M')}\n\n"
+        summary += f"主题：{email['subject']}\n"
+        summary += f"发件人：{email['sender']}\n"
+        summary += f"时间：{email['received'].strftime('%Y-%m-%d %H:%M') if email['received'] else '未知'}\n\n"
         
         if important_sentences:
             summary += "关键内容：\n"
@@ -1122,20 +4901,19 @@ def summarize_email_thread(email_number: int) -> str:
         return f"总结邮件时出错：{str(e)}"
 
 @mcp.tool()
-def suggest_reply(email_number: int) -> str:
+def suggest_reply(email_number: Union[int, str]) -> str:
     """建议回复内容"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = get_item_data(namespace, email_data)
         
-        body = email.Body.lower()
-        subject = email.Subject.lower()
+        body = email['normalized']['text'].lower()
+        subject = email['subject'].lower()
         
         # 基于关键词的回复建议
         suggestions = []
@@ -1171,19 +4949,18 @@ def suggest_reply(email_number: int) -> str:
         return f"生成回复建议时出错：{str(e)}"
 
 @mcp.tool()
-def detect_email_sentiment(email_number: int) -> str:
+def detect_email_sentiment(email_number: Union[int, str]) -> str:
     """检测邮件情感"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = get_item_data(namespace, email_data)
         
-        text = f"{email.Subject} {email.Body}".lower()
+        text = f"{email['subject']} {email['normalized']['text']}".lower()
         
         # 情感词典
         positive_words = ['谢谢', '感谢', '很好', '优秀', '满意', '高兴', '成功', '完成', '赞', '棒']
@@ -1210,7 +4987,7 @@ def detect_email_sentiment(email_number: int) -> str:
         urgency = "高" if any(word in text for word in urgent_words) else "普通"
         
         result = f"邮件 #{email_number} 情感分析：\n\n"
-        result += f"📧 主题：{email.Subject}\n"
+        result += f"📧 主题：{email['subject']}\n"
         result += f"😊 情感倾向：{sentiment} (置信度: {confidence}%)\n"
         result += f"⚡ 紧急程度：{urgency}\n"
         result += f"📊 情感词统计：积极({positive_count}) 消极({negative_count}) 中性({neutral_count})\n"
@@ -1226,20 +5003,19 @@ def detect_email_sentiment(email_number: int) -> str:
         return f"检测邮件情感时出错：{str(e)}"
 
 @mcp.tool()
-def auto_categorize_email(email_number: int) -> str:
+def auto_categorize_email(email_number: Union[int, str]) -> str:
     """自动分类邮件"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        data = get_item_data(namespace, email_data)
         
-        text = f"{email.Subject} {email.Body}".lower()
-        sender = email.SenderName.lower()
+        text = f"{data['subject']} {data['normalized']['text']}".lower()
+        sender = data['sender'].lower()
         
         # 分类规则
         categories = []
@@ -1277,6 +5053,7 @@ def auto_categorize_email(email_number: int) -> str:
         
         # 应用分类
         suggested_category = categories[0]
+        email = open_email(namespace, email_data)
         current_categories = getattr(email, 'Categories', '')
         
         if current_categories:
@@ -1287,7 +5064,7 @@ def auto_categorize_email(email_number: int) -> str:
         email.Save()
         
         result = f"邮件 #{email_number} 自动分类结果：\n\n"
-        result += f"📧 主题：{email.Subject}\n"
+        result += f"📧 主题：{data['subject']}\n"
         result += f"🏷️ 建议分类：{', '.join(categories)}\n"
         result += f"✅ 已应用分类：{suggested_category}\n"
         
@@ -1302,53 +5079,165 @@ def analyze_email_trends(days: int = 30) -> str:
     try:
         _, namespace = connect_to_outlook()
         inbox = namespace.GetDefaultFolder(6)
+        snapshot = get_mailbox_snapshot(namespace)
         
-        now = datetime.datetime.now()
-        threshold_date = now - datetime.timedelta(days=days)
-        
-        daily_count = {}
-        hourly_count = {}
-        total_emails = 0
-        unread_count = 0
-        
-        for item in inbox.Items:
-            try:
-                if (hasattr(item, 'ReceivedTime') and item.ReceivedTime and
-                    item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
-                    
-                    date_key = item.ReceivedTime.strftime("%Y-%m-%d")
-                    hour_key = item.ReceivedTime.hour
-                    
-                    daily_count[date_key] = daily_count.get(date_key, 0) + 1
-                    hourly_count[hour_key] = hourly_count.get(hour_key, 0) + 1
-                    total_emails += 1
-                    
-                    if getattr(item, 'UnRead', False):
-                        unread_count += 1
-            except Exception:
-                continue
-        
-        if not daily_count:
+        threshold_date = datetime.datetime.now() - datetime.timedelta(days=days)
+        selected = snapshot.mask(start=threshold_date, folder_ids=[inbox.EntryID])
+        received = snapshot.received[selected]
+        total_emails = len(received)
+        if not total_emails:
             return f"最近{days}天没有邮件数据"
         
+        day_numbers, daily_count = np.unique(received // 86400, return_counts=True)
+        hourly_count = np.bincount((received % 86400) // 3600, minlength=24)
+        unread_count = int(np.count_nonzero(snapshot.flags[selected] & SNAPSHOT_UNREAD))
+        
         # 计算统计数据
-        avg_daily = total_emails / len(daily_count)
-        peak_hour = max(hourly_count.items(), key=lambda x: x[1]) if hourly_count else (0, 0)
+        avg_daily = total_emails / len(day_numbers)
+        peak_hour = int(np.argmax(hourly_count))
         
         result = f"最近{days}天邮件趋势分析：\n\n"
         result += f"📊 总邮件数：{total_emails}封\n"
         result += f"📈 日均邮件：{avg_daily:.1f}封\n"
         result += f"🔵 未读邮件：{unread_count}封 ({(unread_count/total_emails*100):.1f}%)\n"
-        result += f"⏰ 邮件高峰时段：{peak_hour[0]}:00-{peak_hour[0]+1}:00 ({peak_hour[1]}封)\n\n"
+        result += f"⏰ 邮件高峰时段：{peak_hour}:00-{peak_hour+1}:00 ({hourly_count[peak_hour]}封)\n\n"
         
         result += "📅 最近7天邮件数量：\n"
-        for date in sorted(daily_count.keys())[-7:]:
-            result += f"{date}：{daily_count[date]}封\n"
+        for day, count in list(zip(day_numbers, daily_count))[-7:]:
+            result += f"{from_epoch_seconds(day * 86400):%Y-%m-%d}：{count}封\n"
         
         return result
     except Exception as e:
         return f"分析邮件趋势时出错：{str(e)}"
 
+TIMESERIES_BUCKETS = {"day": "日", "week": "周", "month": "月", "日": "日", "周": "周", "月": "月"}
+TIMESERIES_ROLLING = {"日": 7, "周": 4, "月": 3}
+WEEKDAY_LABELS = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+
+
+def parse_date_arg(text: str) -> datetime.datetime:
+    return datetime.datetime.strptime(text.strip(), "%Y-%m-%d")
+
+
+def resolve_snapshot_folders(snapshot: MailboxSnapshot, namespace, folder_names: Optional[str]) -> Optional[List[str]]:
+    """逗号分隔的文件夹名称或路径 -> 文件夹EntryID列表；"all"/"全部" 表示所有邮件文件夹，默认收件箱"""
+    if not folder_names:
+        return [namespace.GetDefaultFolder(6).EntryID]
+    if folder_names.strip().lower() in ("all", "全部"):
+        return None
+    folder_ids = []
+    for name in (n.strip() for n in re.split(r"[,，]", folder_names) if n.strip()):
+        matches = [f["id"] for f in snapshot.folders
+                   if f["name"] == name or f["path"] == name or f["path"].endswith("\\" + name.strip("\\"))]
+        if not matches:
+            raise ValueError(f"找不到邮件文件夹：{name}")
+        folder_ids.extend(matches)
+    return folder_ids
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """末端对齐的滚动平均；序列开头不足一个窗口时按已有的桶数平均"""
+    cumulative = np.concatenate([[0.0], np.cumsum(values, dtype=np.float64)])
+    index = np.arange(1, len(values) + 1)
+    lower = np.maximum(0, index - window)
+    return (cumulative[index] - cumulative[lower]) / (index - lower)
+
+
+@mcp.tool()
+def analyze_mail_timeseries(start_date: Optional[str] = None, end_date: Optional[str] = None,
+                            folder_names: Optional[str] = None, bucket: str = "auto",
+                            rolling_window: Optional[int] = None, max_rows: int = 60) -> str:
+    """邮件时间序列分析：按日/周/月分桶的邮件数、滚动平均、未读率与附件率，以及星期×小时热力图。
+    日期格式 YYYY-MM-DD（默认最近90天，结束日期包含在内）；folder_names 为逗号分隔的文件夹，"all" 为全部邮件文件夹，默认收件箱；
+    bucket 为 day/week/month（或 日/周/月），auto 按时间跨度选择"""
+    try:
+        end = parse_date_arg(end_date) + datetime.timedelta(days=1) if end_date else \
+            datetime.datetime.combine(datetime.date.today() + datetime.timedelta(days=1), datetime.time())
+        start = parse_date_arg(start_date) if start_date else end - datetime.timedelta(days=90)
+        if start >= end:
+            return "错误：开始日期必须早于结束日期"
+        span_days = (end - start).days
+        if bucket == "auto":
+            unit = "日" if span_days <= 62 else "周" if span_days <= 366 else "月"
+        elif bucket in TIMESERIES_BUCKETS:
+            unit = TIMESERIES_BUCKETS[bucket]
+        else:
+            return "错误：bucket 必须是 day/week/month（日/周/月）或 auto"
+        if rolling_window is not None and rolling_window < 1:
+            return "错误：rolling_window 必须是正整数"
+        window = rolling_window or TIMESERIES_ROLLING[unit]
+
+        _, namespace = connect_to_outlook()
+        snapshot = get_mailbox_snapshot(namespace)
+        folder_ids = resolve_snapshot_folders(snapshot, namespace, folder_names)
+        selected = snapshot.mask(start=start, end=end, folder_ids=folder_ids)
+        received = snapshot.received[selected]
+        total = len(received)
+        scope = "全部邮件文件夹" if folder_ids is None else (folder_names or "收件箱")
+        period = f"{start:%Y-%m-%d} 至 {end - datetime.timedelta(days=1):%Y-%m-%d}"
+        if not total:
+            return f"{scope} 在 {period} 没有邮件"
+        flags = snapshot.flags[selected]
+        unread = (flags & SNAPSHOT_UNREAD) > 0
+        attached = (flags & SNAPSHOT_ATTACH) > 0
+
+        # 1970-01-01 是星期四：(天数 + 3) % 7 得到以周一为0的星期
+        days = received // 86400
+        weekday = (days + 3) % 7
+        first_day, last_day = to_epoch_seconds(start) // 86400, (to_epoch_seconds(end) - 1) // 86400
+        step = 7 if unit == "周" else 1
+        if unit == "日":
+            keys, first, last = days, first_day, last_day
+        elif unit == "周":
+            # 以所在周的周一为键
+            keys = days - weekday
+            first, last = first_day - (first_day + 3) % 7, last_day - (last_day + 3) % 7
+        else:
+            keys = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+            first = np.datetime64(start.date(), "M").astype(np.int64)
+            last = np.datetime64((end - datetime.timedelta(days=1)).date(), "M").astype(np.int64)
+        length = int((last - first) // step + 1)
+        positions = (keys - first) // step
+        counts = np.bincount(positions, minlength=length)
+        unread_counts = np.bincount(positions, weights=unread, minlength=length)
+        attached_counts = np.bincount(positions, weights=attached, minlength=length)
+        rolling = rolling_mean(counts, window)
+        heatmap = np.bincount(weekday * 24 + (received % 86400) // 3600, minlength=7 * 24).reshape(7, 24)
+
+        def bucket_label(position: int) -> str:
+            key = int(first + position * step)
+            if unit == "月":
+                return str(np.datetime64(key, "M"))
+            return f"{from_epoch_seconds(key * 86400):%Y-%m-%d}"
+
+        result = f"📈 邮件时间序列（{scope}，{period}，按{unit}分桶）：\n\n"
+        result += f"📊 总邮件数：{total}封，日均 {total / max(1, span_days):.1f}封\n"
+        result += f"🔵 未读率：{unread.mean() * 100:.1f}%，📎 附件率：{attached.mean() * 100:.1f}%\n"
+        peak = int(np.argmax(counts))
+        result += f"⛰️ 峰值{unit}：{bucket_label(peak)}（{counts[peak]}封）\n"
+        busiest = np.unravel_index(int(np.argmax(heatmap)), heatmap.shape)
+        result += f"⏰ 最繁忙时段：{WEEKDAY_LABELS[busiest[0]]} {busiest[1]}:00-{busiest[1] + 1}:00（{heatmap[busiest]}封）\n\n"
+
+        result += f"{'起始' + unit:<12}{'邮件数':>8}{f'{window}{unit}滚动均值':>14}{'未读率':>8}{'附件率':>8}\n"
+        shown_from = max(0, length - max_rows)
+        if shown_from:
+            result += f"（省略最早的{shown_from}个{unit}）\n"
+        for position in range(shown_from, length):
+            count = counts[position]
+            unread_rate = f"{unread_counts[position] / count * 100:.0f}%" if count else "-"
+            attached_rate = f"{attached_counts[position] / count * 100:.0f}%" if count else "-"
+            result += f"{bucket_label(position):<12}{count:>8}{rolling[position]:>14.1f}{unread_rate:>8}{attached_rate:>8}\n"
+
+        result += "\n🗓️ 星期×小时热力图（行：星期，列：0-23时）：\n"
+        result += "    " + " ".join(f"{hour:>3}" for hour in range(24)) + "\n"
+        for day_index, row in enumerate(heatmap):
+            result += f"{WEEKDAY_LABELS[day_index]}" + " ".join(f"{value:>3}" for value in row) + "\n"
+        return result
+    except ValueError as e:
+        return f"错误：{str(e)}"
+    except Exception as e:
+        return f"分析邮件时间序列时出错：{str(e)}"
+
 @mcp.tool()
 def get_response_time_stats(days: int = 30) -> str:
     """获取回复时间统计"""
@@ -1369,7 +5258,8 @@ def get_response_time_stats(days: int = 30) -> str:
                     conversation_id = getattr(item, 'ConversationID', None)
                     if conversation_id:
                         sent_emails[conversation_id] = item.SentOn
-            except Exception:
+            except Exception as e:
+                note_skipped(e)
                 continue
         
         # 计算回复时间
@@ -1383,7 +5273,8 @@ def get_response_time_stats(days: int = 30) -> str:
                         time_diff = (sent_emails[conversation_id] - item.ReceivedTime).total_seconds() / 3600
                         if 0 < time_diff < 168:  # 1周内的回复
                             response_times.append(time_diff)
-            except Exception:
+            except Exception as e:
+                note_skipped(e)
                 continue
         
         if not response_times:
@@ -1415,62 +5306,42 @@ def get_sender_statistics_advanced(days: int = 30, analysis_type: str = "详细"
     try:
         _, namespace = connect_to_outlook()
         inbox = namespace.GetDefaultFolder(6)
+        snapshot = get_mailbox_snapshot(namespace)
         
-        now = datetime.datetime.now()
-        threshold_date = now - datetime.timedelta(days=days)
-        
-        sender_data = {}
-        total_emails = 0
-        
-        for item in inbox.Items:
-            try:
-                if (hasattr(item, 'ReceivedTime') and item.ReceivedTime and
-                    item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
-                    
-                    sender = getattr(item, 'SenderName', '未知发件人')
-                    sender_email = getattr(item, 'SenderEmailAddress', '')
-                    
-                    if sender not in sender_data:
-                        sender_data[sender] = {
-                            'count': 0,
-                            'email': sender_email,
-                            'unread': 0,
-                            'with_attachments': 0,
-                            'high_importance': 0
-                        }
-                    
-                    sender_data[sender]['count'] += 1
-                    total_emails += 1
-                    
-                    if getattr(item, 'UnRead', False):
-                        sender_data[sender]['unread'] += 1
-                    
-                    if hasattr(item, 'Attachments') and item.Attachments.Count > 0:
-                        sender_data[sender]['with_attachments'] += 1
-                    
-                    if getattr(item, 'Importance', 1) == 2:  # High importance
-                        sender_data[sender]['high_importance'] += 1
-            except Exception:
-                continue
-        
-        if not sender_data:
+        threshold_date = datetime.datetime.now() - datetime.timedelta(days=days)
+        selected = snapshot.mask(start=threshold_date, folder_ids=[inbox.EntryID])
+        total_emails = int(selected.sum())
+        if not total_emails:
             return f"最近{days}天没有邮件数据"
         
+        name_codes, names = snapshot.sender_names()
+        senders = snapshot.sender[selected]
+        by_name = name_codes[senders]
+        flags = snapshot.flags[selected]
+        size = len(names)
+        counts = np.bincount(by_name, minlength=size)
+        unread = np.bincount(by_name, weights=(flags & SNAPSHOT_UNREAD) > 0, minlength=size)
+        with_attachments = np.bincount(by_name, weights=(flags & SNAPSHOT_ATTACH) > 0, minlength=size)
+        high_importance = np.bincount(by_name, weights=snapshot.importance[selected] == 2, minlength=size)
+        # 每个姓名取第一封邮件的发件地址
+        first_sender = np.full(size, -1, dtype=np.int64)
+        first_sender[by_name[::-1]] = senders[::-1]
+        
         # 排序
-        top_senders = sorted(sender_data.items(), key=lambda x: x[1]['count'], reverse=True)[:10]
+        top = [code for code in np.argsort(-counts, kind="stable")[:10] if counts[code]]
         
         result = f"最近{days}天高级发件人统计（总邮件{total_emails}封）：\n\n"
         
-        for i, (sender, data) in enumerate(top_senders, 1):
-            percentage = (data['count'] / total_emails) * 100
-            result += f"#{i} {sender}\n"
-            result += f"   邮箱：{data['email']}\n"
-            result += f"   邮件数：{data['count']}封 ({percentage:.1f}%)\n"
+        for i, code in enumerate(top, 1):
+            percentage = (counts[code] / total_emails) * 100
+            result += f"#{i} {names[code] or '未知发件人'}\n"
+            result += f"   邮箱：{snapshot.senders[first_sender[code]][1]}\n"
+            result += f"   邮件数：{counts[code]}封 ({percentage:.1f}%)\n"
             
             if analysis_type == "详细":
-                result += f"   未读：{data['unread']}封\n"
-                result += f"   带附件：{data['with_attachments']}封\n"
-                result += f"   高重要性：{data['high_importance']}封\n"
+                result += f"   未读：{int(unread[code])}封\n"
+                result += f"   带附件：{int(with_attachments[code])}封\n"
+                result += f"   高重要性：{int(high_importance[code])}封\n"
             
             result += "\n"
         
@@ -1478,19 +5349,383 @@ def get_sender_statistics_advanced(days: int = 30, analysis_type: str = "详细"
     except Exception as e:
         return f"获取高级发件人统计时出错：{str(e)}"
 
+# ===== 近似重复邮件 =====
+MINHASH_COLUMNS = ("EntryID", "Subject", "SenderName", "ReceivedTime", PR_BODY_PREVIEW)
+MINHASH_SIZE = 64
+MINHASH_BANDS = 16
+SHINGLE_SIZE = 5
+_minhash_rng = np.random.default_rng(20240601)
+# 乘-移位哈希族：奇数乘数，取高32位
+MINHASH_A = _minhash_rng.integers(1, 2 ** 63, MINHASH_SIZE, dtype=np.uint64) | np.uint64(1)
+MINHASH_B = _minhash_rng.integers(0, 2 ** 63, MINHASH_SIZE, dtype=np.uint64)
+SHINGLE_POWERS = np.array([pow(1000003, SHINGLE_SIZE - 1 - i, 2 ** 64) for i in range(SHINGLE_SIZE)], dtype=np.uint64)
+SUBJECT_PREFIX_PATTERN = re.compile(r"^\s*((re|fw|fwd|回复|答复|转发)\s*[:：]\s*)+", re.IGNORECASE)
+
+
+def shingle_text(subject: str, body: str) -> str:
+    """去掉回复/转发前缀，数字归一为0（通知邮件常只差编号与金额），标点与空白压缩为单个空格"""
+    text = f"{SUBJECT_PREFIX_PATTERN.sub('', subject or '')} {body or ''}".lower()
+    text = re.sub(r"\d+", "0", text)
+    return re.sub(r"[\W_]+", " ", text).strip()
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """字符5-gram的MinHash签名（uint32 × MINHASH_SIZE），中英文都不需要分词"""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < SHINGLE_SIZE:
+        codes = np.concatenate([codes, np.zeros(SHINGLE_SIZE - len(codes), dtype=np.uint64)])
+    shingles = np.unique(np.lib.stride_tricks.sliding_window_view(codes, SHINGLE_SIZE) @ SHINGLE_POWERS)
+    hashed = (shingles[None, :] * MINHASH_A[:, None] + MINHASH_B[:, None]) >> np.uint64(32)
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+class MinHashIndex:
+    """按EntryID增量维护的MinHash签名与LSH分桶：文件夹变化时只为新增的邮件计算签名，消失的邮件移出分桶"""
+
+    def __init__(self):
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.buckets: Dict[Any, set] = {}
+        self.folder_tokens: Dict[str, Any] = {}
+        self.folder_members: Dict[str, set] = {}
+        self.computed = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def band_keys(signature: np.ndarray):
+        for band, values in enumerate(signature.reshape(MINHASH_BANDS, -1)):
+            yield band, values.tobytes()
+
+    def _add(self, entry_id: str, entry: Dict[str, Any]):
+        self.entries[entry_id] = entry
+        for key in self.band_keys(entry["signature"]):
+            self.buckets.setdefault(key, set()).add(entry_id)
+
+    def _remove(self, entry_id: str):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for key in self.band_keys(entry["signature"]):
+            members = self.buckets.get(key)
+            if members is not None:
+                members.discard(entry_id)
+                if not members:
+                    del self.buckets[key]
+
+    def sync_folder(self, folder) -> int:
+        """按文件夹变化标记同步；返回本次新计算的签名数"""
+        folder_id = folder.EntryID
+        token = folder_change_token(folder)
+        with self.lock:
+            if self.folder_tokens.get(folder_id) == token:
+                return 0
+        store_id, path = folder.StoreID, folder.FolderPath
+        rows = list(read_folder_table(folder, MINHASH_COLUMNS))
+        with self.lock:
+            members = self.folder_members.setdefault(folder_id, set())
+            seen = set()
+            added = 0
+            for entry_id, subject, sender, received, preview in rows:
+                seen.add(entry_id)
+                if entry_id in members and entry_id in self.entries:
+                    continue
+                self._add(entry_id, {
+                    "signature": minhash_signature(shingle_text(subject, preview)),
+                    "folder_id": folder_id, "store_id": store_id, "folder": path,
+                    "subject": subject or "", "sender": sender or "",
+                    "received": received.replace(tzinfo=None) if received else None,
+                })
+                added += 1
+            for entry_id in members - seen:
+                self._remove(entry_id)
+            self.folder_members[folder_id] = seen
+            self.folder_tokens[folder_id] = token
+            self.computed += added
+            return added
+
+    def clusters(self, scope: set, threshold: float) -> List[List[str]]:
+        """在scope内按LSH候选聚类：候选最多的邮件依次作为簇首，只接纳与簇首签名的估计Jaccard相似度
+        达到阈值的候选，簇内任意邮件都与簇首相似，不会沿相似链无限扩张"""
+        with self.lock:
+            neighbours: Dict[str, set] = {}
+            for members in self.buckets.values():
+                if len(members) < 2:
+                    continue
+                candidates = members & scope
+                if len(candidates) < 2:
+                    continue
+                for entry_id in candidates:
+                    neighbours.setdefault(entry_id, set()).update(candidates)
+            assigned = set()
+            groups = []
+            for leader in sorted(neighbours, key=lambda m: (-len(neighbours[m]), m)):
+                if leader in assigned:
+                    continue
+                others = sorted(neighbours[leader] - assigned - {leader})
+                if not others:
+                    continue
+                signatures = np.stack([self.entries[m]["signature"] for m in others])
+                similarity = (signatures == self.entries[leader]["signature"]).mean(axis=1)
+                group = [leader] + [other for other, value in zip(others, similarity) if value >= threshold]
+                if len(group) < 2:
+                    continue
+                assigned.update(group)
+                groups.append(group)
+        return groups
+
+
+_minhash_index = MinHashIndex()
+
+
+def select_mail_folders(namespace, folder_names: Optional[str]):
+    """逗号分隔的文件夹名称或路径 -> 邮件文件夹列表；"all"/"全部" 为默认存储的所有邮件文件夹，默认收件箱；
+    "存储名:文件夹/子文件夹" 形式可指定其他存储中的文件夹"""
+    if not folder_names:
+        return [namespace.GetDefaultFolder(6)]
+    folders = list(iter_mail_folders(namespace.DefaultStore.GetRootFolder()))
+    if folder_names.strip().lower() in ("all", "全部"):
+        return folders
+    selected = []
+    for name in (n.strip() for n in re.split(r"[,，]", folder_names) if n.strip()):
+        store_path = split_store_path(name)
+        store = find_store(namespace, store_path[0]) if store_path else None
+        if store is not None:
+            folder = resolve_store_folder(store, store_path[1])
+            if folder is None:
+                raise ValueError(f"找不到邮件文件夹：{name}")
+            selected.append(folder)
+            continue
+        matches = [f for f in folders if f.Name == name or f.FolderPath == name
+                   or f.FolderPath.endswith("\\" + name.strip("\\"))]
+        if not matches:
+            raise ValueError(f"找不到邮件文件夹：{name}")
+        selected.extend(matches)
+    return selected
+
+
+@mcp.tool()
+def find_similar_emails(days: Optional[int] = 30, folder_names: Optional[str] = None, threshold: float = 0.7,
+                        min_cluster_size: int = 3, max_clusters: int = 10) -> str:
+    """查找近似重复的邮件与群发/通知邮件：对主题和正文开头的字符片段计算MinHash签名并用LSH分桶聚类。
+    folder_names 为逗号分隔的文件夹，"all" 为全部邮件文件夹，默认收件箱；threshold 为估计的Jaccard相似度阈值。
+    列出的簇按顺序保存在同一个结果集中，每个簇对应一段编号，可用 "r5:1-12" 交给
+    delete_multiple_emails / move_multiple_emails 批量处理"""
+    try:
+        if not 0 < threshold <= 1:
+            return "错误：threshold 必须在 0 到 1 之间"
+        _, namespace = connect_to_outlook()
+        folders = select_mail_folders(namespace, folder_names)
+        start = time.perf_counter()
+        computed = sum(_minhash_index.sync_folder(folder) for folder in folders)
+
+        folder_ids = {folder.EntryID for folder in folders}
+        threshold_date = datetime.datetime.now() - datetime.timedelta(days=days) if days else None
+        with _minhash_index.lock:
+            scope = {entry_id for entry_id, entry in _minhash_index.entries.items()
+                     if entry["folder_id"] in folder_ids
+                     and (threshold_date is None or (entry["received"] and entry["received"] >= threshold_date))}
+        groups = [g for g in _minhash_index.clusters(scope, threshold) if len(g) >= min_cluster_size]
+        groups.sort(key=len, reverse=True)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        scope_text = f"最近{days}天" if days else "全部时间"
+        result = f"🔁 近似重复邮件（{scope_text}，{len(scope)}封邮件，相似度≥{threshold:.0%}）：\n"
+        result += f"共{len(groups)}个簇（每簇至少{min_cluster_size}封），涉及{sum(len(g) for g in groups)}封邮件；"
+        result += f"新计算签名{computed}个，耗时{elapsed:.0f} ms\n\n"
+        if not groups:
+            return result + "没有找到近似重复的邮件\n"
+
+        shown = []
+        emails = []
+        for group in groups[:max_clusters]:
+            entries = [_minhash_index.entries[entry_id] | {"id": entry_id} for entry_id in group]
+            entries.sort(key=lambda e: e["received"] or datetime.datetime.min, reverse=True)
+            shown.append((len(emails) + 1, entries))
+            emails.extend({
+                "id": e["id"], "store_id": e["store_id"], "subject": e["subject"], "sender": e["sender"],
+                "folder": e["folder"],
+                "received_time": e["received"].strftime("%Y-%m-%d %H:%M:%S") if e["received"] else None,
+            } for e in entries)
+        handle = create_result_set("find_similar_emails", emails)
+        result += result_set_note(handle) + "\n"
+
+        for number, (first, entries) in enumerate(shown, 1):
+            senders: Dict[str, int] = {}
+            for e in entries:
+                senders[e["sender"]] = senders.get(e["sender"], 0) + 1
+            top_sender, top_count = max(senders.items(), key=lambda x: x[1])
+            times = [e["received"] for e in entries if e["received"]]
+            kind = "群发/通知" if top_count == len(entries) else "近似重复"
+            result += f"簇 #{number}（{kind}）：{len(entries)}封，{handle}:{first}-{first + len(entries) - 1}\n"
+            result += f"  主要发件人：{top_sender or '未知发件人'}（{top_count}封）"
+            if len(senders) > 1:
+                result += f"，共{len(senders)}个发件人"
+            result += "\n"
+            if times:
+                result += f"  时间范围：{min(times):%Y-%m-%d} 至 {max(times):%Y-%m-%d}\n"
+            samples = []
+            for e in entries:
+                if e["subject"] not in samples:
+                    samples.append(e["subject"])
+                if len(samples) == 3:
+                    break
+            result += "  示例主题：\n" + "".join(f"    - {subject}\n" for subject in samples)
+            result += "\n"
+        if len(groups) > max_clusters:
+            result += f"（另有{len(groups) - max_clusters}个较小的簇未列出）\n"
+        result += (f"可用编号区间引用整个簇，例如 delete_multiple_emails(\"{handle}:1-{len(shown[0][1])}\") "
+                   f"或 move_multiple_emails(\"{handle}:1-{len(shown[0][1])}\", \"目标文件夹\")\n")
+        return result
+    except ValueError as e:
+        return f"错误：{str(e)}"
+    except Exception as e:
+        return f"查找近似重复邮件时出错：{str(e)}"
+
+# ===== 邮件模板库 =====
+# 模板占位符：{{字段名}}
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*([^{}\s]+)\s*\}\}")
+
+
+def compile_placeholders(text: str) -> List[str]:
+    """预编译模板文本：偶数位为原文，奇数位为占位符字段名"""
+    return PLACEHOLDER_PATTERN.split(text or "")
+
+
+def render_parts(parts: List[str], values: Dict[str, Any], missing: set) -> str:
+    rendered = []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            rendered.append(part)
+        elif values.get(part) not in (None, ""):
+            rendered.append(str(values[part]))
+        else:
+            missing.add(part)
+    return "".join(rendered)
+
+
+class CompiledTemplate:
+    """已解析并预编译占位符的邮件模板"""
+
+    def __init__(self, data: Dict[str, Any], mtime_ns: int):
+        self.data = data
+        self.mtime_ns = mtime_ns
+        self.name = data.get('name', '')
+        self.subject = data.get('subject', '')
+        self.body = data.get('body', '')
+        self.subject_parts = compile_placeholders(self.subject)
+        self.body_parts = compile_placeholders(self.body)
+        self.fields = sorted(set(self.subject_parts[1::2]) | set(self.body_parts[1::2]))
+
+    def render(self, values: Dict[str, Any]):
+        """返回 (主题, 正文, 缺失的字段集合)"""
+        missing: set = set()
+        subject = render_parts(self.subject_parts, values, missing)
+        body = render_parts(self.body_parts, values, missing)
+        return subject, body, missing
+
+
+class TemplateRegistry:
+    """邮件模板注册表：模板只解析一次，通过目录与文件的mtime判断是否需要重新加载"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.dir_mtime_ns: Optional[int] = None
+        self.files: Dict[str, str] = {}  # 模板文件名（不含扩展名） -> 路径
+        self.templates: Dict[str, CompiledTemplate] = {}
+        self.lock = threading.Lock()
+
+    def _refresh_listing(self):
+        try:
+            dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            self.dir_mtime_ns = None
+            self.files.clear()
+            self.templates.clear()
+            return
+        if dir_mtime_ns == self.dir_mtime_ns:
+            return
+        self.dir_mtime_ns = dir_mtime_ns
+        self.files = {
+            entry.name[:-5]: entry.path
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and entry.name.endswith('.json')
+        }
+        for key in list(self.templates):
+            if key not in self.files:
+                del self.templates[key]
+
+    def _load(self, key: str) -> Optional[CompiledTemplate]:
+        path = self.files.get(key)
+        if not path:
+            return None
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self.templates.pop(key, None)
+            return None
+        cached = self.templates.get(key)
+        if cached and cached.mtime_ns == mtime_ns:
+            return cached
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                template = CompiledTemplate(json.load(f), mtime_ns)
+        except Exception:
+            return None
+        self.templates[key] = template
+        return template
+
+    def get(self, template_name: str) -> Optional[CompiledTemplate]:
+        with self.lock:
+            self._refresh_listing()
+            return self._load(template_name)
+
+    def all(self) -> List[CompiledTemplate]:
+        with self.lock:
+            self._refresh_listing()
+            templates = [self._load(key) for key in sorted(self.files)]
+        return [t for t in templates if t is not None]
+
+
+_template_registries: Dict[str, TemplateRegistry] = {}
+
+
+def get_template_registry() -> TemplateRegistry:
+    template_dir = os.path.join(os.getcwd(), "email_templates")
+    registry = _template_registries.get(template_dir)
+    if registry is None:
+        registry = _template_registries[template_dir] = TemplateRegistry(template_dir)
+    return registry
+
+
+def iter_merge_recipients(file_path: str):
+    """逐行读取收件人列表（CSV / JSON Lines / JSON数组）"""
+    lower = file_path.lower()
+    if lower.endswith('.csv'):
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f):
+                yield {k.strip(): (v or "").strip() for k, v in row.items() if k}
+    elif lower.endswith('.jsonl'):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for row in (data if isinstance(data, list) else [data]):
+            yield row
+
 # ===== 邮件模板功能 =====
 @mcp.tool()
-def save_email_as_template(email_number: int, template_name: str) -> str:
-    """保存邮件为模板"""
+def save_email_as_template(email_number: Union[int, str], template_name: str) -> str:
+    """保存邮件为模板（正文中可使用 {{字段名}} 占位符）"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = open_email(namespace, email_data)
         
         # 创建模板文件夹
         template_dir = os.path.join(os.getcwd(), "email_templates")
@@ -1515,30 +5750,19 @@ def save_email_as_template(email_number: int, template_name: str) -> str:
 def list_email_templates() -> str:
     """列出邮件模板"""
     try:
-        template_dir = os.path.join(os.getcwd(), "email_templates")
-        if not os.path.exists(template_dir):
-            return "没有找到邮件模板"
-        
-        templates = []
-        for file in os.listdir(template_dir):
-            if file.endswith('.json'):
-                try:
-                    with open(os.path.join(template_dir, file), 'r', encoding='utf-8') as f:
-                        template_data = json.load(f)
-                        templates.append(template_data)
-                except Exception:
-                    continue
-        
+        templates = get_template_registry().all()
         if not templates:
             return "没有可用的邮件模板"
         
         result = f"邮件模板列表（共{len(templates)}个）：\n\n"
         for i, template in enumerate(templates, 1):
             result += f"模板 #{i}\n"
-            result += f"名称：{template['name']}\n"
-            result += f"主题：{template['subject']}\n"
-            result += f"创建时间：{template['created_date']}\n"
-            result += f"内容预览：{template['body'][:100]}...\n\n"
+            result += f"名称：{template.name}\n"
+            result += f"主题：{template.subject}\n"
+            result += f"创建时间：{template.data.get('created_date', '')}\n"
+            if template.fields:
+                result += f"占位符：{', '.join(template.fields)}\n"
+            result += f"内容预览：{template.body[:100]}...\n\n"
         
         return result
     except Exception as e:
@@ -1547,63 +5771,207 @@ def list_email_templates() -> str:
 @mcp.tool()
 def compose_from_template(template_name: str, to: str, 
                          subject_override: Optional[str] = None,
-                         body_additions: Optional[str] = None) -> str:
-    """使用模板撰写邮件"""
+                         body_additions: Optional[str] = None,
+                         variables: Optional[str] = None) -> str:
+    """使用模板撰写邮件（variables为JSON对象，用于填充 {{字段名}} 占位符）"""
     try:
-        template_dir = os.path.join(os.getcwd(), "email_templates")
-        template_file = os.path.join(template_dir, f"{template_name}.json")
-        
-        if not os.path.exists(template_file):
+        template = get_template_registry().get(template_name)
+        if template is None:
             return f"未找到模板：{template_name}"
+
+        values = json.loads(variables) if variables else {}
+        values.setdefault("to", to)
+        subject, body, missing = template.render(values)
+        if missing:
+            return f"错误：模板缺少以下占位符的值：{', '.join(sorted(missing))}"
         
-        with open(template_file, 'r', encoding='utf-8') as f:
-            template_data = json.load(f)
-        
-        outlook, _ = connect_to_outlook()
-        mail = outlook.CreateItem(0)
-        
-        mail.To = to
-        mail.Subject = subject_override or template_data['subject']
-        
-        body = template_data['body']
         if body_additions:
             body = f"{body_additions}\n\n{body}"
         
-        mail.Body = body
-        mail.Send()
-        
-        return f"使用模板 '{template_name}' 发送邮件成功到 {to}"
+        queue_id = queue_new_mail(to, subject_override or subject, body)
+        return f"使用模板 '{template_name}' 的邮件已加入发送队列（队列ID：{queue_id}），收件人 {to}"
     except Exception as e:
         return f"使用模板撰写邮件时出错：{str(e)}"
 
+@mcp.tool()
+def mail_merge(template_name: str, recipients_file: str, email_field: str = "email",
+               subject_override: Optional[str] = None, dry_run: bool = False,
+               max_recipients: int = 5000) -> str:
+    """邮件合并：用收件人列表（CSV/JSON/JSONL）逐行填充模板占位符，个性化邮件进入发送队列"""
+    try:
+        template = get_template_registry().get(template_name)
+        if template is None:
+            return f"未找到模板：{template_name}"
+        if not os.path.exists(recipients_file):
+            return f"错误：找不到收件人文件 {recipients_file}"
+
+        subject_parts = compile_placeholders(subject_override) if subject_override else template.subject_parts
+        sent, skipped, previews, errors = 0, 0, [], []
+        for line_no, row in enumerate(iter_merge_recipients(recipients_file), 1):
+            if sent + skipped >= max_recipients:
+                break
+            to = str(row.get(email_field) or "").strip()
+            if not to:
+                skipped += 1
+                errors.append(f"第{line_no}行：缺少收件人字段 '{email_field}'")
+                continue
+            missing: set = set()
+            subject = render_parts(subject_parts, row, missing)
+            body = render_parts(template.body_parts, row, missing)
+            if missing:
+                skipped += 1
+                errors.append(f"第{line_no}行（{to}）：缺少字段 {', '.join(sorted(missing))}")
+                continue
+
+            if dry_run:
+                if len(previews) < 3:
+                    previews.append(f"收件人：{to}\n主题：{subject}\n正文：{body[:200]}")
+                sent += 1
+                continue
+
+            try:
+                queue_new_mail(to, subject, body)
+                sent += 1
+            except Exception as e:
+                skipped += 1
+                errors.append(f"第{line_no}行（{to}）：加入发送队列失败 {str(e)}")
+
+        action = "可发送" if dry_run else "已加入发送队列"
+        result = f"邮件合并{'预览' if dry_run else '完成'}（模板 '{template_name}'）：{action}{sent}封，跳过{skipped}封\n"
+        if previews:
+            result += "\n示例：\n" + "\n\n".join(previews) + "\n"
+        if errors:
+            result += "\n问题（最多显示10条）：\n" + "\n".join(errors[:10]) + "\n"
+        return result
+    except Exception as e:
+        return f"邮件合并时出错：{str(e)}"
+
+# ===== 任务索引 =====
+TASK_COLUMNS = ("EntryID", "Subject", "Complete", "DueDate", "Importance", "PercentComplete")
+TASK_NO_DUE_YEAR = 4501  # Outlook 用 4501-01-01 表示"无日期"
+# {"token", "rows", "by_subject": 小写主题 -> [任务]}
+_task_index: Dict[str, Any] = {}
+_task_index_lock = threading.Lock()
+
+
+def task_row(values) -> Dict[str, Any]:
+    entry_id, subject, complete, due, importance, percent = values
+    if due is not None and due.year >= TASK_NO_DUE_YEAR:
+        due = None
+    return {
+        "entry_id": entry_id,
+        "subject": subject or "无主题",
+        "complete": bool(complete),
+        "due": due.replace(tzinfo=None) if due else None,
+        "importance": importance if importance is not None else 1,
+        "percent_complete": percent or 0,
+    }
+
+
+def read_tasks(tasks_folder, filter_text: str = "", limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """按截止日期排序读取任务（排序与过滤在Outlook中完成），最多读取limit个"""
+    rows = []
+    for values in read_folder_table(tasks_folder, TASK_COLUMNS, filter_text, sort="[DueDate]"):
+        try:
+            rows.append(task_row(values))
+        except Exception as e:
+            note_skipped(e)
+            continue
+        if limit and len(rows) >= limit:
+            break
+    return rows
+
+
+def get_task_index(tasks_folder) -> Dict[str, Any]:
+    """返回任务主题索引；任务文件夹未变化时直接复用"""
+    global _task_index
+    token = folder_change_token(tasks_folder)
+    with _task_index_lock:
+        if _task_index and _task_index["token"] == token:
+            return _task_index
+    skipped = skipped_count()
+    rows = read_tasks(tasks_folder)
+    by_subject: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        by_subject.setdefault(row["subject"].lower(), []).append(row)
+    index = {"token": token, "rows": rows, "by_subject": by_subject}
+    if skipped_count() == skipped:
+        with _task_index_lock:
+            _task_index = index
+    return index
+
+
+def invalidate_task_index():
+    global _task_index
+    with _task_index_lock:
+        _task_index = {}
+
+
+def find_task(index: Dict[str, Any], task_subject: str) -> Optional[Dict[str, Any]]:
+    """按主题查找任务：精确匹配 > 包含匹配 > 模糊匹配，优先未完成的任务"""
+    key = task_subject.strip().lower()
+    if not key:
+        return None
+
+    def pick(candidates):
+        candidates = list(candidates)
+        pending = [row for row in candidates if not row["complete"]]
+        return (pending or candidates or [None])[0]
+
+    exact = pick(index["by_subject"].get(key, []))
+    if exact:
+        return exact
+    contains = pick(row for row in index["rows"] if key in row["subject"].lower())
+    if contains:
+        return contains
+    close = difflib.get_close_matches(key, list(index["by_subject"]), n=1, cutoff=0.6)
+    return pick(index["by_subject"][close[0]]) if close else None
+
+
+def complete_task(namespace, task: Dict[str, Any]):
+    item = namespace.GetItemFromID(task["entry_id"])
+    item.Complete = True
+    item.PercentComplete = 100
+    item.Save()
+
 # ===== 任务管理功能 =====
 @mcp.tool()
-def list_tasks(status: str = "全部") -> str:
-    """列出任务 (全部/未完成/已完成)"""
+def list_tasks(status: str = "全部", due_before: Optional[str] = None, due_after: Optional[str] = None,
+               limit: int = 50) -> str:
+    """列出任务，按截止日期排序 (状态: 全部/未完成/已完成，日期格式: YYYY-MM-DD)，最多列出 limit 个"""
     try:
+        if limit < 1:
+            return "错误：limit 必须是正整数"
         _, namespace = connect_to_outlook()
         tasks = namespace.GetDefaultFolder(13)  # 13 is Tasks
         
-        task_list = []
-        for item in tasks.Items:
-            try:
-                task_status = "已完成" if getattr(item, 'Complete', False) else "未完成"
-                
-                if status == "全部" or status == task_status:
-                    task_list.append({
-                        'subject': getattr(item, 'Subject', '无主题'),
-                        'status': task_status,
-                        'due_date': item.DueDate.strftime("%Y-%m-%d") if hasattr(item, 'DueDate') and item.DueDate else '无截止日期',
-                        'priority': getattr(item, 'Importance', 1),
-                        'percent_complete': getattr(item, 'PercentComplete', 0)
-                    })
-            except Exception:
-                continue
+        conditions = []
+        if status == "未完成":
+            conditions.append("[Complete] = False")
+        elif status == "已完成":
+            conditions.append("[Complete] = True")
+        try:
+            if due_after:
+                after = datetime.datetime.strptime(due_after, "%Y-%m-%d")
+                conditions.append(f"[DueDate] >= '{outlook_date_literal(after)}'")
+            if due_before:
+                before = datetime.datetime.strptime(due_before, "%Y-%m-%d") + datetime.timedelta(days=1)
+                conditions.append(f"[DueDate] < '{outlook_date_literal(before)}'")
+        except ValueError:
+            return "错误：日期格式应为 YYYY-MM-DD"
+        
+        task_list = [{
+            'subject': row['subject'],
+            'status': "已完成" if row['complete'] else "未完成",
+            'due_date': row['due'].strftime("%Y-%m-%d") if row['due'] else '无截止日期',
+            'priority': row['importance'],
+            'percent_complete': row['percent_complete'],
+        } for row in read_tasks(tasks, " AND ".join(conditions), limit)]
         
         if not task_list:
             return f"没有{status}的任务"
         
-        result = f"{status}任务列表（共{len(task_list)}个）：\n\n"
+        result = f"{status}任务列表（按截止日期排序，显示{len(task_list)}个）：\n\n"
         for i, task in enumerate(task_list, 1):
             priority_text = {0: "低", 1: "普通", 2: "高"}.get(task['priority'], "普通")
             result += f"任务 #{i}\n"
@@ -1618,17 +5986,16 @@ def list_tasks(status: str = "全部") -> str:
         return f"获取任务列表时出错：{str(e)}"
 
 @mcp.tool()
-def create_task_from_email(email_number: int, due_date: Optional[str] = None) -> str:
+def create_task_from_email(email_number: Union[int, str], due_date: Optional[str] = None) -> str:
     """从邮件创建任务 (日期格式: YYYY-MM-DD)"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         outlook, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = open_email(namespace, email_data)
         
         task = outlook.CreateItem(3)  # 3 is olTaskItem
         task.Subject = f"处理邮件：{email.Subject}"
@@ -1644,38 +6011,78 @@ def create_task_from_email(email_number: int, due_date: Optional[str] = None) ->
 
 @mcp.tool()
 def mark_task_complete(task_subject: str) -> str:
-    """标记任务完成"""
+    """标记任务完成（按主题精确、包含或模糊匹配）"""
     try:
         _, namespace = connect_to_outlook()
         tasks = namespace.GetDefaultFolder(13)
         
-        for item in tasks.Items:
-            try:
-                if task_subject.lower() in getattr(item, 'Subject', '').lower():
-                    item.Complete = True
-                    item.PercentComplete = 100
-                    item.Save()
-                    return f"任务 '{item.Subject}' 已标记为完成"
-            except Exception:
-                continue
+        task = find_task(get_task_index(tasks), task_subject)
+        if not task:
+            return f"未找到主题包含'{task_subject}'的任务"
+        if task["complete"]:
+            return f"任务 '{task['subject']}' 已经是完成状态"
         
-        return f"未找到主题包含'{task_subject}'的任务"
+        complete_task(namespace, task)
+        invalidate_task_index()
+        return f"任务 '{task['subject']}' 已标记为完成"
     except Exception as e:
         return f"标记任务完成时出错：{str(e)}"
 
+@mcp.tool()
+def mark_tasks_complete(task_subjects: str) -> str:
+    """批量标记任务完成 (主题用逗号或换行分隔)"""
+    try:
+        subjects = [x.strip() for x in re.split(r"[,，\n]", task_subjects) if x.strip()]
+        if not subjects:
+            return "错误：请提供至少一个任务主题"
+        
+        _, namespace = connect_to_outlook()
+        index = get_task_index(namespace.GetDefaultFolder(13))
+        
+        completed, already, not_found, failed = [], [], [], []
+        seen = set()
+        for subject in subjects:
+            task = find_task(index, subject)
+            if not task:
+                not_found.append(subject)
+                continue
+            if task["complete"] or task["entry_id"] in seen:
+                already.append(task["subject"])
+                continue
+            try:
+                complete_task(namespace, task)
+                task["complete"] = True
+                seen.add(task["entry_id"])
+                completed.append(task["subject"])
+            except Exception as e:
+                failed.append(f"{task['subject']}（{str(e)}）")
+        
+        if completed:
+            invalidate_task_index()
+        
+        result = f"批量完成任务：成功{len(completed)}个，已完成{len(already)}个，未找到{len(not_found)}个，失败{len(failed)}个\n"
+        if completed:
+            result += "\n已标记完成：\n" + "\n".join(f"- {x}" for x in completed) + "\n"
+        if not_found:
+            result += "\n未找到：\n" + "\n".join(f"- {x}" for x in not_found) + "\n"
+        if failed:
+            result += "\n失败：\n" + "\n".join(f"- {x}" for x in failed) + "\n"
+        return result
+    except Exception as e:
+        return f"批量标记任务完成时出错：{str(e)}"
+
 # ===== 邮件分类和标签功能 =====
 @mcp.tool()
-def add_category_to_email(email_number: int, category: str) -> str:
+def add_category_to_email(email_number: Union[int, str], category: str) -> str:
     """为邮件添加分类"""
     try:
-        global email_cache
-        if not email_cache:
-            email_cache = load_email_cache()
-        if email_number not in email_cache:
-            return f"错误：找不到邮件 #{email_number}"
+        try:
+            email_data = lookup_email(email_number)
+        except LookupError as e:
+            return f"错误：{str(e)}"
         
         _, namespace = connect_to_outlook()
-        email = namespace.GetItemFromID(email_cache[email_number]["id"])
+        email = open_email(namespace, email_data)
         
         current_categories = getattr(email, 'Categories', '')
         if current_categories:
@@ -1710,42 +6117,117 @@ def list_email_categories() -> str:
         return f"获取邮件分类时出错：{str(e)}"
 
 @mcp.tool()
-def search_by_category(category: str, days: int = 30) -> str:
-    """按分类搜索邮件"""
+def search_by_category(category: str, days: int = 30, folder_name: Optional[str] = None, limit: int = 50) -> str:
+    """按分类搜索邮件（分类名精确匹配，默认搜索所有邮件文件夹）；匹配超过 limit 封时只列出最新的 limit 封"""
     try:
+        category = category.strip()
+        if not category:
+            return "错误：分类名称不能为空"
+        if limit < 1:
+            return "错误：limit 必须是正整数"
+        
         _, namespace = connect_to_outlook()
-        inbox = namespace.GetDefaultFolder(6)
+        if folder_name:
+            folder = get_folder_by_name(namespace, folder_name)
+            if not folder:
+                return f"错误：找不到文件夹'{folder_name}'"
+            folders = [folder]
+        else:
+            folders = list(iter_mail_folders(namespace.DefaultStore.GetRootFolder()))
         
-        now = datetime.datetime.now()
-        threshold_date = now - datetime.timedelta(days=days)
+        threshold_date = datetime.datetime.now() - datetime.timedelta(days=days)
+        escaped = category.replace("'", "''")
+        filter_text = f"[Categories] = '{escaped}' AND [ReceivedTime] >= '{outlook_date_literal(threshold_date)}'"
         
-        clear_email_cache()
         categorized_emails = []
-        
-        for item in inbox.Items:
+        for folder in folders:
             try:
-                if (hasattr(item, 'Categories') and item.Categories and
-                    category.lower() in item.Categories.lower() and
-                    hasattr(item, 'ReceivedTime') and item.ReceivedTime and
-                    item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
-                    categorized_emails.append(format_email(item))
-            except Exception:
+                folder_label = folder.Name
+                store_id = folder.StoreID
+                for item in folder.Items.Restrict(filter_text):
+                    try:
+                        email = format_email(item)
+                        email["folder"] = folder_label
+                        email["store_id"] = store_id
+                        categorized_emails.append(email)
+                    except Exception as e:
+                        note_skipped(e)
+                        continue
+            except Exception as e:
+                note_skipped(e)
                 continue
         
         if not categorized_emails:
             return f"最近{days}天没有找到分类为'{category}'的邮件"
         
-        global email_cache
-        result = f"找到{len(categorized_emails)}封分类为'{category}'的邮件：\n\n"
-        for i, email in enumerate(categorized_emails, 1):
-            email_cache[i] = email
-            result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']}\n分类：{email['categories']}\n时间：{email['received_time']}\n\n"
+        categorized_emails.sort(key=lambda e: e["received_time"] or "", reverse=True)
+        
+        shown = categorized_emails[:limit]
+        handle = create_result_set("search_by_category", shown)
+        result = f"找到{len(categorized_emails)}封分类为'{category}'的邮件"
+        result += f"（显示最新的{len(shown)}封）：\n\n" if len(shown) < len(categorized_emails) else "：\n\n"
+        for i, email in enumerate(shown, 1):
+            result += f"邮件 #{i}\n主题：{email['subject']}\n发件人：{email['sender']}\n分类：{email['categories']}\n"
+            result += f"文件夹：{email['folder']}\n时间：{email['received_time']}\n\n"
         
-        save_email_cache(email_cache)
+        result += result_set_note(handle)
         return result
     except Exception as e:
         return f"按分类搜索邮件时出错：{str(e)}"
 
+def split_categories(text: str) -> List[str]:
+    return [c.strip() for c in re.split(r"[,;，；]", text or "") if c.strip()]
+
+
+@mcp.tool()
+def get_category_statistics(days: Optional[int] = None) -> str:
+    """统计所有邮件文件夹中各分类的邮件数（按文件夹细分）"""
+    try:
+        _, namespace = connect_to_outlook()
+        snapshot = get_mailbox_snapshot(namespace)
+        
+        threshold_date = datetime.datetime.now() - datetime.timedelta(days=days) if days else None
+        selected = snapshot.mask(start=threshold_date)
+        scanned = int(selected.sum())
+        uncategorized = int(np.count_nonzero(selected & (np.diff(snapshot.cat_offsets) == 0)))
+        
+        # 分类编码 × 文件夹编码 的计数矩阵
+        rows = snapshot.category_rows()
+        kept = selected[rows]
+        codes = snapshot.cat_codes[kept]
+        folders = snapshot.folder[rows[kept]]
+        width = max(1, len(snapshot.folders))
+        matrix = np.bincount(codes.astype(np.int64) * width + folders,
+                             minlength=len(snapshot.categories) * width).reshape(-1, width)
+        totals = matrix.sum(axis=1)
+        
+        try:
+            defined = [c.Name for c in namespace.Categories]
+        except Exception:
+            defined = []
+        
+        scope = f"最近{days}天" if days else "全部"
+        result = f"🏷️ 分类统计（{scope}，{len(snapshot.folders)}个文件夹，{scanned}封邮件）：\n\n"
+        if not totals.any():
+            result += "没有带分类的邮件\n"
+        order = sorted((code for code in range(len(totals)) if totals[code]),
+                       key=lambda code: (-totals[code], snapshot.categories[code]))
+        for code in order:
+            result += f"{snapshot.categories[code]}：{totals[code]}封\n"
+            for folder_code in np.argsort(-matrix[code], kind="stable"):
+                if not matrix[code, folder_code]:
+                    break
+                result += f"  - {snapshot.folders[folder_code]['path']}：{matrix[code, folder_code]}封\n"
+        result += f"\n未分类：{uncategorized}封\n"
+        
+        used = {snapshot.categories[code] for code in order}
+        unused = [name for name in defined if name not in used]
+        if unused:
+            result += f"未使用的分类：{', '.join(unused)}\n"
+        return result
+    except Exception as e:
+        return f"统计分类时出错：{str(e)}"
+
 # ===== 联系人管理功能 =====
 @mcp.tool()
 def list_contacts(limit: int = 50) -> str:
@@ -1767,7 +6249,8 @@ def list_contacts(limit: int = 50) -> str:
                     'phone': getattr(item, 'BusinessTelephoneNumber', '')
                 })
                 count += 1
-            except Exception:
+            except Exception as e:
+                note_skipped(e)
                 continue
         
         if not contact_list:
@@ -1803,7 +6286,8 @@ def search_contacts(search_term: str) -> str:
                         'company': getattr(item, 'CompanyName', ''),
                         'phone': getattr(item, 'BusinessTelephoneNumber', '')
                     })
-            except Exception:
+            except Exception as e:
+                note_skipped(e)
                 continue
         
         if not matching_contacts:
@@ -1862,7 +6346,8 @@ def get_contact_info(contact_name: str) -> str:
                     result += f"地址：{getattr(item, 'BusinessAddress', '')}\n"
                     result += f"备注：{getattr(item, 'Body', '')}\n"
                     return result
-            except Exception:
+            except Exception as e:
+                note_skipped(e)
                 continue
         
         return f"未找到联系人：{contact_name}"
@@ -1892,7 +6377,8 @@ def list_calendar_events(days: int = 7) -> str:
                             'location': getattr(item, 'Location', ''),
                             'organizer': getattr(item, 'Organizer', '')
                         })
-            except Exception:
+            except Exception as e:
+                note_skipped(e)
                 continue
         
         if not events:
@@ -1935,6 +6421,87 @@ def create_calendar_event(subject: str, start_time: str, end_time: str,
     except Exception as e:
         return f"创建日历事件时出错：{str(e)}"
 
+# ===== 会议邀请索引 =====
+PID_LID_GLOBAL_OBJECT_ID = "http://schemas.microsoft.com/mapi/id/{6ED8DA90-450B-101B-98DA-00AA003F1305}/00030102"
+MEETING_COLUMNS = ("EntryID", "Subject", "SenderName", "ReceivedTime", PID_LID_GLOBAL_OBJECT_ID)
+MEETING_FILTER = "[MessageClass] = 'IPM.Schedule.Meeting.Request'"
+MEETING_RESPONSES = {"接受": 3, "拒绝": 4, "暂定": 2}
+MEETING_RESPONSE_LABELS = {2: "暂定", 3: "接受", 4: "拒绝"}
+# {"token", "by_id": GlobalAppointmentID -> 会议邀请}
+_meeting_cache: Dict[str, Any] = {}
+# GlobalAppointmentID -> (已回复的邀请的EntryID, 回复)，跨缓存重建保留；
+# 组织者发出更新（同一会议的新邀请）后按未回复处理
+_meeting_answers: Dict[str, Tuple[str, str]] = {}
+_meeting_lock = threading.Lock()
+
+
+def global_object_id(value) -> str:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex().upper()
+    return str(value or "")
+
+
+def get_meeting_requests(inbox) -> Dict[str, Dict[str, Any]]:
+    """通过MessageClass限制读取收件箱中的会议邀请，按GlobalAppointmentID缓存到收件箱变化为止"""
+    global _meeting_cache
+    token = folder_change_token(inbox)
+    with _meeting_lock:
+        if _meeting_cache and _meeting_cache["token"] == token:
+            return _meeting_cache["by_id"]
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for entry_id, subject, sender, received, goid in read_folder_table(inbox, MEETING_COLUMNS, MEETING_FILTER):
+        meeting_id = global_object_id(goid) or entry_id
+        meeting = {
+            "id": meeting_id,
+            "entry_id": entry_id,
+            "subject": subject or "无主题",
+            "sender": sender or "",
+            "received": received.replace(tzinfo=None) if received else None,
+        }
+        current = by_id.get(meeting_id)
+        # 同一会议的更新邀请只保留最新一封
+        if current is None or (meeting["received"] or datetime.datetime.min) > (current["received"] or datetime.datetime.min):
+            by_id[meeting_id] = meeting
+    with _meeting_lock:
+        _meeting_cache = {"token": token, "by_id": by_id}
+    return by_id
+
+
+def find_meeting_request(meetings: Dict[str, Dict[str, Any]], key: str) -> Optional[Dict[str, Any]]:
+    """按GlobalAppointmentID或主题（包含匹配，优先未回复、最新的邀请）查找会议邀请"""
+    key = key.strip()
+    if key in meetings:
+        return meetings[key]
+    lowered = key.lower()
+    candidates = [m for m in meetings.values() if lowered in m["subject"].lower()]
+    # 先按接收时间从新到旧（没有时间的排最后），再稳定地把已回复的排到后面
+    candidates.sort(key=lambda m: m["received"] or datetime.datetime.min, reverse=True)
+    candidates.sort(key=lambda m: meeting_answer(m) is not None)
+    return candidates[0] if candidates else None
+
+
+def meeting_answer(meeting: Dict[str, Any]) -> Optional[str]:
+    """这封会议邀请已作出的回复；回复的是同一会议较早的邀请时返回None"""
+    with _meeting_lock:
+        answered = _meeting_answers.get(meeting["id"])
+    return answered[1] if answered and answered[0] == meeting["entry_id"] else None
+
+
+def answer_meeting(namespace, meeting: Dict[str, Any], response: str) -> bool:
+    """回复会议邀请；已经回复过的邀请直接跳过，返回是否实际发出了回复"""
+    if meeting_answer(meeting) is not None:
+        return False
+    appointment = namespace.GetItemFromID(meeting["entry_id"]).GetAssociatedAppointment(True)
+    status = appointment.ResponseStatus
+    responded = status not in MEETING_RESPONSE_LABELS
+    if responded:
+        appointment.Respond(MEETING_RESPONSES[response], True)
+    with _meeting_lock:
+        _meeting_answers[meeting["id"]] = (meeting["entry_id"],
+                                           response if responded else MEETING_RESPONSE_LABELS[status])
+    return responded
+
+# ===== 会议邀请功能 =====
 @mcp.tool()
 def get_meeting_invitations(days: int = 7) -> str:
     """获取会议邀请"""
@@ -1942,29 +6509,20 @@ def get_meeting_invitations(days: int = 7) -> str:
         _, namespace = connect_to_outlook()
         inbox = namespace.GetDefaultFolder(6)
         
-        now = datetime.datetime.now()
-        threshold_date = now - datetime.timedelta(days=days)
-        
-        invitations = []
-        for item in inbox.Items:
-            try:
-                if (hasattr(item, 'MessageClass') and 
-                    'IPM.Schedule.Meeting' in item.MessageClass and
-                    item.ReceivedTime.replace(tzinfo=None) >= threshold_date):
-                    invitations.append({
-                        'subject': item.Subject,
-                        'sender': item.SenderName,
-                        'received': item.ReceivedTime.strftime("%Y-%m-%d %H:%M")
-                    })
-            except Exception:
-                continue
+        threshold_date = datetime.datetime.now() - datetime.timedelta(days=days)
+        invitations = [m for m in get_meeting_requests(inbox).values()
+                       if m["received"] and m["received"] >= threshold_date]
+        invitations.sort(key=lambda m: m["received"], reverse=True)
         
         if not invitations:
             return f"最近{days}天没有会议邀请"
         
         result = f"最近{days}天的会议邀请：\n\n"
         for i, inv in enumerate(invitations, 1):
-            result += f"邀请 #{i}\n主题：{inv['subject']}\n发起人：{inv['sender']}\n时间：{inv['received']}\n\n"
+            result += f"邀请 #{i}\n主题：{inv['subject']}\n发起人：{inv['sender']}\n时间：{inv['received'].strftime('%Y-%m-%d %H:%M')}\n"
+            if meeting_answer(inv) is not None:
+                result += f"已回复：{meeting_answer(inv)}\n"
+            result += f"会议ID：{inv['id']}\n\n"
         
         return result
     except Exception as e:
@@ -1972,59 +6530,105 @@ def get_meeting_invitations(days: int = 7) -> str:
 
 @mcp.tool()
 def respond_to_meeting(meeting_subject: str, response: str = "接受") -> str:
-    """回复会议邀请 (接受/拒绝/暂定)"""
+    """回复会议邀请 (接受/拒绝/暂定，可按主题或会议ID查找)"""
     try:
-        _, namespace = connect_to_outlook()
-        inbox = namespace.GetDefaultFolder(6)
-        
-        response_map = {"接受": 3, "拒绝": 4, "暂定": 2}
-        if response not in response_map:
+        if response not in MEETING_RESPONSES:
             return "错误：回复必须是'接受'、'拒绝'或'暂定'"
         
-        for item in inbox.Items:
-            try:
-                if (hasattr(item, 'MessageClass') and 
-                    'IPM.Schedule.Meeting' in item.MessageClass and
-                    meeting_subject.lower() in item.Subject.lower()):
-                    
-                    meeting_item = item.GetAssociatedAppointment(True)
-                    meeting_item.Respond(response_map[response], True)
-                    return f"已{response}会议邀请：{item.Subject}"
-            except Exception:
-                continue
+        _, namespace = connect_to_outlook()
+        meeting = find_meeting_request(get_meeting_requests(namespace.GetDefaultFolder(6)), meeting_subject)
+        if not meeting:
+            return f"未找到主题包含'{meeting_subject}'的会议邀请"
         
-        return f"未找到主题包含'{meeting_subject}'的会议邀请"
+        if not answer_meeting(namespace, meeting, response):
+            return f"会议邀请已回复过（{meeting_answer(meeting)}），已跳过：{meeting['subject']}"
+        return f"已{response}会议邀请：{meeting['subject']}"
     except Exception as e:
         return f"回复会议邀请时出错：{str(e)}"
 
+@mcp.tool()
+def respond_to_meetings(meetings: str, response: str = "接受") -> str:
+    """批量回复会议邀请。meetings 为逗号/换行分隔的主题或会议ID，
+    或JSON对象 {"主题或会议ID": "接受/拒绝/暂定"} 为每个会议指定不同回复"""
+    try:
+        text = meetings.strip()
+        if text.startswith("{"):
+            try:
+                requests_list = list(json.loads(text).items())
+            except json.JSONDecodeError as e:
+                return f"错误：JSON格式无效 {str(e)}"
+        else:
+            requests_list = [(x.strip(), response) for x in re.split(r"[,，\n]", text) if x.strip()]
+        if not requests_list:
+            return "错误：请提供至少一个会议主题或会议ID"
+        invalid = sorted({r for _, r in requests_list if r not in MEETING_RESPONSES})
+        if invalid:
+            return f"错误：回复必须是'接受'、'拒绝'或'暂定'，无效的回复：{', '.join(invalid)}"
+        
+        _, namespace = connect_to_outlook()
+        cache = get_meeting_requests(namespace.GetDefaultFolder(6))
+        
+        answered, skipped, not_found, failed = [], [], [], []
+        for key, meeting_response in requests_list:
+            meeting = find_meeting_request(cache, key)
+            if not meeting:
+                not_found.append(key)
+                continue
+            try:
+                if answer_meeting(namespace, meeting, meeting_response):
+                    answered.append(f"{meeting_response}：{meeting['subject']}")
+                else:
+                    skipped.append(f"{meeting['subject']}（已{meeting_answer(meeting)}）")
+            except Exception as e:
+                failed.append(f"{meeting['subject']}（{str(e)}）")
+        
+        result = f"批量回复会议邀请：已回复{len(answered)}个，跳过{len(skipped)}个，未找到{len(not_found)}个，失败{len(failed)}个\n"
+        for title, rows in (("已回复", answered), ("已回复过（跳过）", skipped), ("未找到", not_found), ("失败", failed)):
+            if rows:
+                result += f"\n{title}：\n" + "\n".join(f"- {x}" for x in rows) + "\n"
+        return result
+    except Exception as e:
+        return f"批量回复会议邀请时出错：{str(e)}"
+
 # ===== 统计功能 =====
+EMAIL_STATISTICS_COLUMNS = ("UnRead", PR_HAS_ATTACH, "ReceivedTime")
+
+
+def folder_table_statistics(folder, today: datetime.datetime) -> Tuple[int, int, int, int]:
+    """以 GetTable 读取未读、附件标志与接收时间列，返回 (总数, 未读, 带附件, 今日)"""
+    tomorrow = today + datetime.timedelta(days=1)
+    total = unread = attachments = today_count = 0
+    for is_unread, has_attach, received in read_folder_table(folder, EMAIL_STATISTICS_COLUMNS):
+        total += 1
+        unread += bool(is_unread)
+        attachments += bool(has_attach)
+        if received and today <= received.replace(tzinfo=None) < tomorrow:
+            today_count += 1
+    return total, unread, attachments, today_count
+
+
 @mcp.tool()
 def get_email_statistics(folder_name: Optional[str] = None) -> str:
     """获取邮件统计信息"""
     try:
         _, namespace = connect_to_outlook()
         folder = namespace.GetDefaultFolder(6) if not folder_name else get_folder_by_name(namespace, folder_name)
-        
-        total_count = folder.Items.Count
-        unread_count = 0
-        today_count = 0
-        attachment_count = 0
-        
-        today = datetime.datetime.now().date()
-        
-        for item in folder.Items:
-            try:
-                if hasattr(item, "UnRead") and item.UnRead:
-                    unread_count += 1
-                
-                if hasattr(item, "ReceivedTime") and item.ReceivedTime:
-                    if item.ReceivedTime.date() == today:
-                        today_count += 1
-                
-                if hasattr(item, "Attachments") and item.Attachments.Count > 0:
-                    attachment_count += 1
-            except Exception:
-                continue
+        snapshot = get_mailbox_snapshot(namespace)
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        if snapshot.folder_code(folder.EntryID) is None:
+            if folder.DefaultItemType != 0:
+                return f"文件夹 {folder_name} 不是邮件文件夹"
+            # 快照只覆盖默认存储；其他存储（如 "存档:收件箱"）的文件夹直接按列读取
+            total_count, unread_count, attachment_count, today_count = folder_table_statistics(folder, today)
+        else:
+            selected = snapshot.mask(folder_ids=[folder.EntryID])
+            flags = snapshot.flags[selected]
+            total_count = len(flags)
+            unread_count = int(np.count_nonzero(flags & SNAPSHOT_UNREAD))
+            attachment_count = int(np.count_nonzero(flags & SNAPSHOT_ATTACH))
+            received = snapshot.received[selected]
+            today_count = int(np.count_nonzero((received >= to_epoch_seconds(today)) &
+                                               (received < to_epoch_seconds(today + datetime.timedelta(days=1)))))
         
         result = f"📊 {folder_name or '收件箱'} 统计信息：\n\n"
         result += f"📧 总邮件数：{total_count}\n"
@@ -2037,20 +6641,430 @@ def get_email_statistics(folder_name: Optional[str] = None) -> str:
     except Exception as e:
         return f"获取统计信息时出错：{str(e)}"
 
-# 运行服务器
-if __name__ == "__main__":
-    print("正在启动Outlook MCP服务器...")
+SIZE_HISTOGRAM_EDGES = (10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+SIZE_HISTOGRAM_LABELS = ("<10 KB", "10-100 KB", "100 KB-1 MB", "1-10 MB", "≥10 MB")
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+@mcp.tool()
+def analyze_mailbox_size(folder_names: Optional[str] = "all", top_n: int = 20, top_senders: int = 10,
+                         days: Optional[int] = None) -> str:
+    """分析邮箱空间占用：各文件夹合计、最大的N封邮件、大小分布与按发件人的占用。
+    使用邮件的Size属性（PR_MESSAGE_SIZE）与附件标志列，不打开任何邮件；
+    folder_names 为逗号分隔的文件夹，默认 "all" 为全部邮件文件夹。最大的邮件保存为结果集，可批量移动或删除；
+    top_n、top_senders 为0时不列出对应部分"""
     try:
-        outlook, namespace = connect_to_outlook()
-        inbox = namespace.GetDefaultFolder(6)
-        print(f"已连接。收件箱有 {inbox.Items.Count} 封邮件。")
-        
-        # 启动时加载缓存
-        loaded_cache = load_email_cache()
-        if loaded_cache:
-            email_cache = loaded_cache
-            print(f"启动时已从缓存文件加载了 {len(email_cache)} 封邮件")
-        
-        mcp.run()
+        if top_n < 0 or top_senders < 0:
+            return "错误：top_n 和 top_senders 不能为负数"
+        _, namespace = connect_to_outlook()
+        snapshot = get_mailbox_snapshot(namespace)
+        folder_ids = resolve_snapshot_folders(snapshot, namespace, folder_names)
+        threshold_date = datetime.datetime.now() - datetime.timedelta(days=days) if days else None
+        selected = snapshot.mask(start=threshold_date, folder_ids=folder_ids)
+        rows = np.flatnonzero(selected)
+        if not len(rows):
+            return "所选范围内没有邮件"
+        sizes = snapshot.size[rows]
+        folders = snapshot.folder[rows]
+        attached = (snapshot.flags[rows] & SNAPSHOT_ATTACH) > 0
+        total = int(sizes.sum())
+        
+        scope = "全部邮件文件夹" if folder_ids is None else folder_names
+        result = f"💾 邮箱空间分析（{scope}{f'，最近{days}天' if days else ''}）：\n\n"
+        result += f"📧 邮件数：{len(rows)}封，合计 {format_bytes(total)}，平均 {format_bytes(total / len(rows))}\n"
+        result += f"📎 带附件的邮件：{int(attached.sum())}封，占 {format_bytes(int(sizes[attached].sum()))}"
+        result += f"（{sizes[attached].sum() / max(1, total) * 100:.1f}%）\n\n"
+        
+        width = len(snapshot.folders)
+        folder_bytes = np.bincount(folders, weights=sizes, minlength=width)
+        folder_counts = np.bincount(folders, minlength=width)
+        folder_attached = np.bincount(folders, weights=np.where(attached, sizes, 0), minlength=width)
+        result += "📁 各文件夹占用：\n"
+        for code in np.argsort(-folder_bytes, kind="stable"):
+            if not folder_counts[code]:
+                break
+            result += f"- {snapshot.folders[code]['path']}：{format_bytes(folder_bytes[code])}，{folder_counts[code]}封"
+            result += f"（附件邮件占 {folder_attached[code] / max(1, folder_bytes[code]) * 100:.0f}%）\n"
+        
+        histogram = np.bincount(np.searchsorted(SIZE_HISTOGRAM_EDGES, sizes, side="right"),
+                                minlength=len(SIZE_HISTOGRAM_LABELS))
+        histogram_bytes = np.bincount(np.searchsorted(SIZE_HISTOGRAM_EDGES, sizes, side="right"),
+                                      weights=sizes, minlength=len(SIZE_HISTOGRAM_LABELS))
+        result += "\n📊 大小分布：\n"
+        for label, count, size in zip(SIZE_HISTOGRAM_LABELS, histogram, histogram_bytes):
+            result += f"{label:<12}{count:>8}封  {format_bytes(size):>10}（{size / max(1, total) * 100:.1f}%）\n"
+        
+        if top_senders:
+            name_codes, names = snapshot.sender_names()
+            by_name = name_codes[snapshot.sender[rows]]
+            sender_bytes = np.bincount(by_name, weights=sizes, minlength=len(names))
+            sender_counts = np.bincount(by_name, minlength=len(names))
+            result += "\n👤 按发件人占用：\n"
+            for code in np.argsort(-sender_bytes, kind="stable")[:top_senders]:
+                if not sender_counts[code]:
+                    break
+                result += f"- {names[code] or '未知发件人'}：{format_bytes(sender_bytes[code])}，{sender_counts[code]}封\n"
+        
+        count = min(top_n, len(rows))
+        if count:
+            largest = rows[np.argpartition(-sizes, count - 1)[:count]] if count < len(rows) else rows
+            largest = largest[np.argsort(-snapshot.size[largest], kind="stable")]
+            emails = [snapshot.email(row) for row in largest]
+            handle = create_result_set("analyze_mailbox_size", emails)
+            result += f"\n🐘 最大的{count}封邮件：\n"
+            for i, email in enumerate(emails, 1):
+                result += f"#{i} {format_bytes(email['size'])}  {email['subject']}\n"
+                result += f"    {email['sender']} | {email['folder']} | {email['received_time']}\n"
+            result += "\n" + result_set_note(handle)
+        return result
+    except ValueError as e:
+        return f"错误：{str(e)}"
+    except Exception as e:
+        return f"分析邮箱空间时出错：{str(e)}"
+
+STORE_STATISTICS_COLUMNS = ("UnRead", "Size", PR_HAS_ATTACH)
+
+
+def store_statistics(store, filter_text: str, deadline: Optional[float]) -> Dict[str, Any]:
+    """按文件夹以 GetTable 读取未读、大小与附件标志列，汇总一个存储的邮件统计"""
+    stats = {"folders": 0, "emails": 0, "unread": 0, "attachments": 0, "size": 0, "by_folder": []}
+    for folder in iter_mail_folders(store.GetRootFolder()):
+        check_deadline(deadline)
+        count = 0
+        for unread, size, has_attach in read_folder_table(folder, STORE_STATISTICS_COLUMNS, filter_text):
+            count += 1
+            stats["unread"] += bool(unread)
+            stats["attachments"] += bool(has_attach)
+            stats["size"] += size or 0
+        stats["folders"] += 1
+        stats["emails"] += count
+        if count:
+            stats["by_folder"].append((folder.FolderPath, count))
+    stats["by_folder"].sort(key=lambda entry: -entry[1])
+    return stats
+
+
+@mcp.tool()
+def get_store_statistics(stores: Optional[str] = "all", days: Optional[int] = None,
+                         store_timeout: Optional[float] = None, top_folders: int = 3) -> str:
+    """统计多个存储（主邮箱、共享邮箱、存档、PST）的邮件数、未读、附件与空间占用并合并汇总。
+    stores 为逗号分隔的存储名称，默认 "all"；各存储在独立线程中并发扫描，
+    超过 store_timeout 秒（默认 OUTLOOK_MCP_STORE_TIMEOUT）的存储不纳入合计"""
+    try:
+        _, namespace = connect_to_outlook()
+        selected = select_stores(namespace, stores)
+        filter_text = ""
+        if days:
+            since = datetime.datetime.now() - datetime.timedelta(days=days)
+            filter_text = "@SQL=" + QueryPredicate("after", since, False, "").dasl()
+        start = time.perf_counter()
+        results, failures = scan_stores(selected, lambda ns, store, deadline: store_statistics(
+            store, filter_text, deadline), store_timeout)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        result = f"📦 存储统计（{len(selected)}个存储{f'，最近{days}天' if days else ''}）：\n\n"
+        totals = {"folders": 0, "emails": 0, "unread": 0, "attachments": 0, "size": 0}
+        for name, stats in results:
+            for key in totals:
+                totals[key] += stats[key]
+            result += f"🗂 {name}：{stats['emails']}封（未读{stats['unread']}，带附件{stats['attachments']}），"
+            result += f"{format_bytes(stats['size'])}，{stats['folders']}个邮件文件夹\n"
+            for path, count in stats["by_folder"][:top_folders]:
+                result += f"   - {path}：{count}封\n"
+        result += f"\n📊 合计（{len(results)}个存储）：{totals['emails']}封，未读{totals['unread']}，"
+        result += f"带附件{totals['attachments']}，{format_bytes(totals['size'])}，{totals['folders']}个邮件文件夹\n"
+        result += describe_store_failures(failures)
+        result += f"耗时{elapsed:.0f} ms\n"
+        return result
+    except ValueError as e:
+        return f"错误：{str(e)}"
+    except Exception as e:
+        return f"统计存储时出错：{str(e)}"
+
+# ===== 发件队列工具 =====
+@mcp.tool()
+def get_send_queue_status(limit: int = 10, status: Optional[str] = None, purge_sent: bool = False) -> str:
+    """查看发件队列：排队中、发送中、已发送与失败的邮件 (status: queued/sending/sent/failed)"""
+    try:
+        queue = get_send_queue()
+        with queue.condition:
+            messages = list(queue.messages.values())
+        counts = {key: sum(1 for m in messages if m["status"] == key) for key in ("queued", "sending", "sent", "failed")}
+        labels = {"queued": "排队中", "sending": "发送中", "sent": "已发送", "failed": "失败"}
+
+        result = "📤 发件队列状态：\n\n"
+        result += "，".join(f"{labels[k]}：{v}" for k, v in counts.items()) + "\n"
+        rate = f"每分钟 {SEND_RATE_PER_MINUTE:g} 封" if SEND_RATE_PER_MINUTE > 0 else "不限速"
+        result += f"速率限制：{rate}，工作线程：{max(1, SEND_WORKERS)}，最多重试：{SEND_MAX_ATTEMPTS}次\n"
+
+        shown = [m for m in messages if not status or m["status"] == status]
+        shown.sort(key=lambda m: m["created_at"], reverse=True)
+        if shown:
+            result += "\n最近的邮件：\n"
+            for message in shown[:limit]:
+                result += f"- [{labels.get(message['status'], message['status'])}] {message['id']}：{message['summary']}"
+                result += f"（创建于 {message['created_at']}，尝试 {message['attempts']} 次）\n"
+                if message.get("sent_at"):
+                    result += f"  发送时间：{message['sent_at']}\n"
+                if message.get("last_error"):
+                    result += f"  最近错误：{message['last_error']}\n"
+                if message["status"] == "queued" and message["next_attempt_at"] > time.time():
+                    wait = message["next_attempt_at"] - time.time()
+                    result += f"  将在 {wait:.0f} 秒后重试\n"
+
+        if purge_sent:
+            result += f"\n已清理{queue.purge_sent()}封已发送邮件的队列记录\n"
+        return result
+    except Exception as e:
+        return f"获取发件队列状态时出错：{str(e)}"
+
+@mcp.tool()
+def retry_failed_sends(queue_ids: Optional[str] = None) -> str:
+    """重新发送失败的邮件（可指定逗号分隔的队列ID，默认全部）"""
+    try:
+        ids = [x.strip() for x in queue_ids.split(",") if x.strip()] if queue_ids else None
+        count = get_send_queue().retry(ids)
+        return f"已将{count}封失败的邮件重新加入发送队列" if count else "没有需要重试的失败邮件"
     except Exception as e:
-        print(f"启动服务器时出错：{str(e)}")
+        return f"重试发送时出错：{str(e)}"
+
+# ===== 性能监控工具 =====
+@mcp.tool()
+def get_tool_metrics(tool_name: Optional[str] = None, reset: bool = False) -> str:
+    """查看各工具的调用次数、延迟分布与COM/缓存耗时分项"""
+    if not METRICS_ENABLED:
+        return "性能监控未开启。请设置环境变量 OUTLOOK_MCP_METRICS=1 或调用 configure_metrics(enabled=True)。"
+    with _metrics_lock:
+        snapshot = {name: m for name, m in _tool_metrics.items()
+                    if m.latency.count and (not tool_name or name == tool_name)}
+        if not snapshot:
+            return "还没有工具调用记录" if not tool_name else f"没有工具 '{tool_name}' 的调用记录"
+
+        result = "⏱️ 工具性能统计：\n\n"
+        for name, metrics in sorted(snapshot.items(), key=lambda x: x[1].latency.total, reverse=True):
+            latency = metrics.latency
+            result += f"{name}\n"
+            result += f"   调用次数：{latency.count}（失败 {metrics.errors}）\n"
+            result += f"   平均耗时：{latency.total / latency.count * 1000:.1f} ms，"
+            result += f"P50 ≤ {latency.quantile(0.5) * 1000:g} ms，P95 ≤ {latency.quantile(0.95) * 1000:g} ms\n"
+
+            per_call = lambda prefix: sum(h.count for op, h in metrics.ops.items() if op.startswith(prefix)) / latency.count
+            result += f"   每次调用：COM属性读取 {per_call('com.get'):.0f} 次，COM写入 {per_call('com.set'):.0f} 次，"
+            result += f"COM方法调用 {per_call('com.call'):.0f} 次，缓存读写 {per_call('cache'):.0f} 次\n"
+
+            breakdown = metrics.last_breakdown
+            total = breakdown.get("total", 0.0)
+            accounted = sum(v for k, v in breakdown.items() if k != "total")
+            result += f"   最近一次：总计 {total * 1000:.1f} ms = "
+            result += f"COM读取 {breakdown.get('com.get', 0.0) * 1000:.1f} + COM写入 {breakdown.get('com.set', 0.0) * 1000:.1f} + "
+            result += f"COM调用 {breakdown.get('com.call', 0.0) * 1000:.1f} + 缓存 {breakdown.get('cache', 0.0) * 1000:.1f} + "
+            result += f"其他(字符串拼接等) {max(total - accounted, 0.0) * 1000:.1f} ms\n"
+
+            top_ops = sorted(metrics.ops.items(), key=lambda x: x[1].total, reverse=True)[:5]
+            if top_ops:
+                result += "   耗时最多的操作：" + "，".join(
+                    f"{op} ×{h.count} ({h.total * 1000:.1f} ms)" for op, h in top_ops) + "\n"
+            result += "\n"
+
+        if reset:
+            for name in snapshot:
+                _tool_metrics.pop(name, None)
+            result += "统计数据已重置\n"
+    maybe_flush_metrics(force=True)
+    return result
+
+@mcp.tool()
+def configure_metrics(enabled: bool = True, prometheus_file: Optional[str] = None) -> str:
+    """开启或关闭性能监控，可选设置Prometheus文本格式的指标输出文件"""
+    global METRICS_ENABLED, METRICS_FILE
+    METRICS_ENABLED = enabled
+    if prometheus_file is not None:
+        METRICS_FILE = prometheus_file or None
+    status = "已开启" if enabled else "已关闭"
+    result = f"性能监控{status}"
+    if METRICS_FILE:
+        maybe_flush_metrics(force=True)
+        result += f"，指标文件：{METRICS_FILE}"
+    return result
+
+@mcp.tool()
+def configure_profiling(sample_rate: float = 1.0, tool_names: Optional[str] = None,
+                        profile_dir: Optional[str] = None) -> str:
+    """设置工具调用的性能剖析采样率（0关闭，1全部剖析），可限定工具名（逗号分隔）"""
+    global PROFILE_SAMPLE_RATE, PROFILE_TOOLS, PROFILE_DIR
+    if not 0 <= sample_rate <= 1:
+        return "错误：采样率必须在0到1之间"
+    PROFILE_SAMPLE_RATE = sample_rate
+    if tool_names is not None:
+        PROFILE_TOOLS = {t.strip() for t in tool_names.split(",") if t.strip()}
+    if profile_dir:
+        PROFILE_DIR = profile_dir
+    if not sample_rate:
+        return "性能剖析已关闭"
+    scope = "、".join(sorted(PROFILE_TOOLS)) if PROFILE_TOOLS else "所有工具"
+    return f"性能剖析已开启：采样率 {sample_rate:.0%}，范围：{scope}，输出目录：{PROFILE_DIR}"
+
+@mcp.tool()
+def list_slow_profiles(limit: int = 10, tool_name: Optional[str] = None, top_functions: int = 5) -> str:
+    """列出最近被剖析的最慢工具调用及其耗时最多的函数"""
+    records = [r for r in load_profile_records() if not tool_name or r.get("tool") == tool_name]
+    if not records:
+        return "还没有性能剖析记录。请设置 OUTLOOK_MCP_PROFILE_RATE 或调用 configure_profiling。"
+
+    records.sort(key=lambda r: r.get("duration_ms", 0), reverse=True)
+    result = f"最慢的{min(limit, len(records))}次剖析调用（共{len(records)}条记录）：\n\n"
+    for i, record in enumerate(records[:limit], 1):
+        arguments = ", ".join(f"{k}={v!r}" for k, v in record.get("arguments", {}).items())
+        result += f"#{i} {record['tool']}({arguments})\n"
+        result += f"   时间：{record['timestamp']}，耗时：{record['duration_ms']:.1f} ms\n"
+        result += f"   剖析文件：{record['profile_file']}\n"
+        if top_functions > 0:
+            try:
+                stats = pstats.Stats(record['profile_file']).stats
+                heaviest = sorted(stats.items(), key=lambda x: x[1][3], reverse=True)
+                shown = 0
+                for (filename, line, func), (_, calls, own, cumulative, _) in heaviest:
+                    if func.startswith("<") or filename == "~":
+                        continue
+                    result += f"   - {func} ({os.path.basename(filename)}:{line}) 调用{calls}次，"
+                    result += f"累计 {cumulative * 1000:.1f} ms，自身 {own * 1000:.1f} ms\n"
+                    shown += 1
+                    if shown >= top_functions:
+                        break
+            except Exception as e:
+                result += f"   [读取剖析文件失败：{str(e)}]\n"
+        result += "\n"
+    return result
+
+@mcp.tool()
+def configure_item_cache(max_mb: Optional[float] = None, prefetch_count: Optional[int] = None,
+                         clear: bool = False) -> str:
+    """查看或调整邮件条目缓存：内存上限（MB）、列表后预读正文的邮件数（0为关闭）"""
+    global PREFETCH_COUNT
+    if max_mb is not None:
+        if max_mb < 0:
+            return "错误：max_mb 不能为负数"
+        _item_cache.resize(int(max_mb * 1024 * 1024))
+    if prefetch_count is not None:
+        if prefetch_count < 0:
+            return "错误：prefetch_count 不能为负数"
+        PREFETCH_COUNT = prefetch_count
+    if clear:
+        _item_cache.invalidate()
+
+    cache = _item_cache
+    lookups = cache.hits + cache.misses
+    hit_rate = f"{cache.hits / lookups * 100:.1f}%" if lookups else "-"
+    result = "🗃️ 邮件条目缓存：\n\n"
+    result += f"状态：{'启用（由Outlook事件失效）' if _event_hub.running else '未启用（Outlook事件不可用）'}\n"
+    result += f"已缓存：{len(cache.entries)}封，{cache.total_bytes / 1024 / 1024:.2f} / {cache.max_bytes / 1024 / 1024:.0f} MB\n"
+    result += f"命中：{cache.hits}，未命中：{cache.misses}，命中率：{hit_rate}，淘汰：{cache.evictions}\n"
+    result += f"列表后预读：{'前' + str(PREFETCH_COUNT) + '封' if PREFETCH_COUNT else '关闭'}（已预读{_prefetcher.prefetched}封）\n"
+    counts = _event_hub.counts
+    result += (f"已收到事件：新增{counts['add']}，修改{counts['change']}，删除{counts['remove']}，"
+               f"新邮件（NewMailEx）{counts['new_mail']}\n")
+    return result
+
+@mcp.tool()
+def get_query_cache_stats(ttl_seconds: Optional[float] = None, max_mb: Optional[float] = None,
+                          clear: bool = False) -> str:
+    """查看或调整查询结果缓存（list_recent_emails、search_emails、search_unread_emails、search_mail_query）：
+    命中率、内存占用、有效期（秒，0为关闭）与内存上限（MB）"""
+    cache = _query_cache
+    if ttl_seconds is not None:
+        if ttl_seconds < 0:
+            return "错误：ttl_seconds 不能为负数"
+        cache.ttl = ttl_seconds
+    if max_mb is not None:
+        if max_mb < 0:
+            return "错误：max_mb 不能为负数"
+        cache.resize(int(max_mb * 1024 * 1024))
+    if clear:
+        cache.invalidate()
+
+    lookups = cache.hits + cache.misses
+    hit_rate = f"{cache.hits / lookups * 100:.1f}%" if lookups else "-"
+    result = "🗂️ 查询结果缓存：\n\n"
+    if cache.ttl <= 0:
+        status = "已关闭"
+    else:
+        status = "启用（由Outlook事件失效）" if _event_hub.running else "未启用（Outlook事件不可用）"
+    result += f"状态：{status}，有效期：{cache.ttl:g} 秒\n"
+    result += f"已缓存：{len(cache.entries)}个查询，{cache.total_bytes / 1024 / 1024:.2f} / {cache.max_bytes / 1024 / 1024:.0f} MB\n"
+    result += f"命中：{cache.hits}，未命中：{cache.misses}，命中率：{hit_rate}\n"
+    result += f"事件失效：{cache.invalidations}，过期：{cache.expirations}，内存淘汰：{cache.evictions}\n"
+    if cache.by_tool:
+        result += "\n按工具：\n"
+        for tool, (hits, misses) in sorted(cache.by_tool.items()):
+            result += f"- {tool}：命中{hits}，未命中{misses}（{hits / max(1, hits + misses) * 100:.0f}%）\n"
+    return result
+
+# ===== 服务器状态 =====
+@mcp.tool()
+def get_server_status() -> str:
+    """查看服务器就绪状态与启动耗时分解"""
+    ready = _startup_ready.is_set()
+    result = "🖥️ 服务器状态：\n\n"
+    result += f"状态：{'就绪' if ready and not _startup_state['error'] else _startup_state['phase']}\n"
+    if "started_at" in _startup_state:
+        result += f"启动时间：{_startup_state['started_at'].strftime('%Y-%m-%d %H:%M:%S')}\n"
+    if "inbox_count" in _startup_state:
+        result += f"收件箱邮件数：{_startup_state['inbox_count']}\n"
+    if "cached_emails" in _startup_state:
+        result += f"已加载缓存邮件：{_startup_state['cached_emails']}\n"
+    if _startup_state["error"]:
+        result += f"错误：{_startup_state['error']}\n"
+
+    labels = {
+        "import_win32com": "导入win32com", "connect_outlook": "连接Outlook",
+        "default_folders": "打开默认文件夹", "inbox_count": "统计收件箱",
+        "load_cache": "加载结果集", "send_queue": "恢复发件队列",
+        "events": "订阅Outlook事件", "total": "预热总计",
+    }
+    if _startup_state["timings"]:
+        result += "\n启动耗时：\n"
+        for key, value in _startup_state["timings"].items():
+            result += f"- {labels.get(key, key)}：{value} ms\n"
+
+    breaker = _breaker
+    result += f"\nOutlook连接：{breaker.state}（熔断{breaker.trips}次，熔断期间拒绝{breaker.rejected}个调用）\n"
+    result += f"COM消息过滤器：{describe_message_filter()}\n"
+    result += (f"被Outlook拒绝后重试的调用：{_com_busy_stats['rejected']}次，"
+               f"重试耗尽放弃：{_com_busy_stats['gave_up']}次\n")
+    if breaker.last_error:
+        result += f"最近的Outlook错误：{breaker.last_error}\n"
+
+    snapshot = get_com_dispatcher().snapshot()
+    result += f"\n传输方式：{SERVER_TRANSPORT}\n"
+    result += f"COM调度：{snapshot['workers']}个工作线程，每个会话最多同时执行{snapshot['per_session']}个调用，已完成{snapshot['completed']}个调用\n"
+    if snapshot["sessions"]:
+        result += f"会话（{len(snapshot['sessions'])}个）：\n"
+        now = time.time()
+        for key, info in sorted(snapshot["sessions"].items(), key=lambda x: -x[1]["last_used"]):
+            result += (f"- {key}：调用{info['calls']}次，排队{info['queued']}，执行中{info['in_flight']}，"
+                       f"结果集{info['result_sets']}个，{now - info['last_used']:.0f}秒前活动\n")
+    return result
+
+# 运行服务器
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OutlookMaster MCP 服务器")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"],
+                        default=os.environ.get("OUTLOOK_MCP_TRANSPORT", "stdio"),
+                        help="stdio服务单个客户端；sse/streamable-http可同时服务多个会话")
+    parser.add_argument("--host", default=os.environ.get("OUTLOOK_MCP_HOST", mcp.settings.host))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("OUTLOOK_MCP_PORT", mcp.settings.port)))
+    cli_args = parser.parse_args()
+    SERVER_TRANSPORT = cli_args.transport
+    mcp.settings.host = cli_args.host
+    mcp.settings.port = cli_args.port
+
+    print(f"正在启动Outlook MCP服务器（{SERVER_TRANSPORT}）...", file=sys.stderr)
+    # 先响应MCP握手，Outlook连接、默认文件夹与缓存在后台预热
+    start_background_warmup()
+    mcp.run(transport=SERVER_TRANSPORT)